@@ -20,11 +20,25 @@ else
   log_level="$3"
 fi
 
+# Worker profile, set with CELERY_WORKER_PROFILE:
+# - prefork (default): one task at a time per child process, the children are recycled
+# - io: a single process running CELERY_IO_CONCURRENCY tasks at a time in threads, for the tasks waiting
+#   on the flight API, see `benchmark_worker`
+profile="${CELERY_WORKER_PROFILE:-prefork}"
+
+if [ "$profile" = "io" ]; then
+  # The system checks are run by the web processes, mingle and gossip only sync with the other workers on startup
+  export CELERY_SKIP_CHECKS=1
+  pool_options="--pool=threads --concurrency=${CELERY_IO_CONCURRENCY:-50} --without-mingle --without-gossip"
+else
+  pool_options="--max-tasks-per-child=1000"
+fi
+
 # Check if $2 is provided; if so, add it to the command
 if [ -n "$2" ]; then
-  command="python -m celery -A flightstats worker -n $worker_name $2 -l $log_level --max-tasks-per-child=10"
+  command="python -m celery -A flightstats worker -n $worker_name $2 -l $log_level $pool_options"
 else
-  command="python -m celery -A flightstats worker -n $worker_name -l $log_level --max-tasks-per-child=10"
+  command="python -m celery -A flightstats worker -n $worker_name -l $log_level $pool_options"
 fi
 
 # Run the command
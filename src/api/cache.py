@@ -1,71 +1,462 @@
-import importlib
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Any, Callable
 
 from django.conf import settings
 from django.core.cache import caches
-from django.core.exceptions import ValidationError
-from django.core.validators import URLValidator
-from django.urls import resolve
+from django.db.models import Model
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django_redis import get_redis_connection
+from redis import asyncio as aioredis
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 
+from .metrics import CACHE_REQUESTS, timed
+
+
+logger = logging.getLogger(__name__)
+
+# Default of the lookups telling a missing entry from a cached None
+_MISSING = object()
+
+
+class LocalCache:
+    """A size-bounded in-process cache with per-entry TTL and LRU eviction.
+    Values are shared with the callers, they must not be mutated.
+    """
+
+    def __init__(self, max_entries: int, timeout: int) -> None:
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: int = None) -> None:
+        # Never keep an entry longer than the local timeout, it bounds staleness if an invalidation is lost
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class TwoTierCache:
+    """Serve hot entries from a per-process `LocalCache` in front of the shared Redis cache.
+    Sets and deletes are published over Redis pub/sub, so the other processes
+    drop their local copy of the entry.
+    """
+
+    def __init__(self, cache, local_cache: LocalCache, channel: str, alias: str = 'redis') -> None:
+        self.cache = cache
+        self.local_cache = local_cache
+        self.channel = channel
+        self.alias = alias
+        # Identifies this process in the invalidations, so it does not drop its own fresh entries
+        self.origin = uuid.uuid4().hex
+        self._listener = None
+
+    @property
+    def client(self):
+        return get_redis_connection(self.alias)
+
+    def _publish_invalidation(self, *keys: str) -> None:
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.publish(self.channel, json.dumps({'key': key, 'origin': self.origin}))
+        pipeline.execute()
+
+    def _handle_invalidation(self, message: dict) -> None:
+        invalidation = json.loads(message['data'])
+        if invalidation['origin'] != self.origin:
+            self.local_cache.delete(invalidation['key'])
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Invalidations may have been missed while we were not subscribed
+                self.local_cache.clear()
+                for message in pubsub.listen():
+                    self._handle_invalidation(message)
+            except Exception:
+                logger.exception("Cache invalidation listener failed, resubscribing.")
+                time.sleep(1)
+
+    def start_listener(self) -> None:
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name='cache-invalidation', daemon=True)
+            self._listener.start()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.local_cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.cache.get(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self.local_cache.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any, timeout: int = None) -> None:
+        self.cache.set(key, value, timeout=timeout)
+        self.local_cache.set(key, value, timeout=timeout)
+        self._publish_invalidation(key)
+
+    def delete(self, key: str) -> None:
+        self.cache.delete(key)
+        self.local_cache.delete(key)
+        self._publish_invalidation(key)
+
+    def delete_many(self, keys: list[str]) -> None:
+        self.cache.delete_many(keys)
+        for key in keys:
+            self.local_cache.delete(key)
+        self._publish_invalidation(*keys)
+
+    def get_many(self, keys: list[str]) -> dict:
+        values = {}
+        missing = []
+        for key in keys:
+            value = self.local_cache.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                values[key] = value
+
+        if missing:
+            fetched = self.cache.get_many(missing)
+            for key, value in fetched.items():
+                self.local_cache.set(key, value)
+            values.update(fetched)
+        return values
+
+    def set_many(self, data: dict, timeout: int = None) -> None:
+        self.cache.set_many(data, timeout=timeout)
+        for key, value in data.items():
+            self.local_cache.set(key, value, timeout=timeout)
+        self._publish_invalidation(*data)
+
+
+_two_tier_cache = None
+_two_tier_cache_pid = None
+_two_tier_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the cache used by the API, or None if caching is disabled.
+    With `ENABLE_LOCAL_CACHE`, Redis is fronted by an in-process cache, one per process.
+    """
+    global _two_tier_cache, _two_tier_cache_pid
+
+    if not settings.ENABLE_REDIS_CACHE:
+        return None
+
+    if not settings.ENABLE_LOCAL_CACHE:
+        return caches['redis']
+
+    # Workers forked after the cache was created need their own local cache and listener
+    with _two_tier_cache_lock:
+        if _two_tier_cache is None or _two_tier_cache_pid != os.getpid():
+            _two_tier_cache = TwoTierCache(
+                caches['redis'],
+                LocalCache(settings.LOCAL_CACHE_MAX_ENTRIES, settings.LOCAL_CACHE_TIMEOUT),
+                settings.CACHE_INVALIDATION_CHANNEL,
+            )
+            _two_tier_cache.start_listener()
+            _two_tier_cache_pid = os.getpid()
+
+    return _two_tier_cache
+
+
+# redis.asyncio connection pools are bound to the event loop they were first used in
+_async_redis_connections = {}
+
+
+def get_async_redis_connection(alias: str = 'redis') -> aioredis.Redis:
+    """
+    Return an asyncio Redis client to the server of the `alias` cache, for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    # Under WSGI every async call runs in its own event loop, closed afterwards, their clients are dropped
+    for key in [key for key in _async_redis_connections if key[0].is_closed()]:
+        del _async_redis_connections[key]
+    if (loop, alias) not in _async_redis_connections:
+        _async_redis_connections[(loop, alias)] = aioredis.Redis.from_url(settings.CACHES[alias]['LOCATION'])
+    return _async_redis_connections[(loop, alias)]
+
+
+class AsyncCache:
+    """Non-blocking access to the entries of the API cache from async views.
+    Entries are read and written in the django-redis format, so they are shared with `get_cache()`,
+    and the local tier of a `TwoTierCache` is honoured.
+    """
+
+    def __init__(self, cache) -> None:
+        self.two_tier_cache = cache if isinstance(cache, TwoTierCache) else None
+        self.cache = cache.cache if self.two_tier_cache is not None else cache
+
+    @property
+    def client(self) -> aioredis.Redis:
+        return get_async_redis_connection()
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        if self.two_tier_cache is not None:
+            value = self.two_tier_cache.local_cache.get(key)
+            if value is not None:
+                return value
+
+        raw = await self.client.get(self.cache.make_key(key))
+        if raw is None:
+            return default
+
+        value = self.cache.client.decode(raw)
+        if self.two_tier_cache is not None:
+            self.two_tier_cache.local_cache.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any, timeout: int = None) -> None:
+        await self.client.set(self.cache.make_key(key), self.cache.client.encode(value), ex=timeout)
+
+        if self.two_tier_cache is not None:
+            self.two_tier_cache.local_cache.set(key, value, timeout=timeout)
+            await self.client.publish(
+                self.two_tier_cache.channel,
+                json.dumps({'key': key, 'origin': self.two_tier_cache.origin}),
+            )
+
+
+def get_async_cache() -> AsyncCache | None:
+    cache = get_cache()
+    return AsyncCache(cache) if cache is not None else None
+
+
+def make_cache_key(key_prefix: str, *values) -> str:
+    return f"{key_prefix}_{'_'.join(str(value) for value in values)}"
+
 
 class CacheModelViewSetMixin:
     """The mixin adds caching capabilities to a view set and overrides
     a few basic methods.
+    The serialized representation of an instance is cached under a key built from
+    `cache_key_fields`, so a cache hit is served without touching the database.
     """
 
     timeout = settings.DEFAULT_CACHE_TIMEOUT
+    # Seconds a stale representation is still served while it is revalidated
+    stale_timeout = 0
+    # Fields of the instance the cache key is built from, in order
+    cache_key_fields = ('pk',)
+    # Field of the representation holding its last update time, used to answer conditional requests
+    version_field = None
 
     def __init__(self, *args, **kwargs) -> None:
-        self.cache = None
-
-        if settings.ENABLE_REDIS_CACHE:
-            self.cache = caches['redis']
+        self.cache = get_cache()
 
         super().__init__(*args, **kwargs)
 
-    def _get_cache_key(self, instance_pk: str, key_prefix: str = None) -> str:
+    def _get_cache_key(self, *values, key_prefix: str = None) -> str:
         if key_prefix is None:
             key_prefix = self.cache_key_prefix
 
-        return f"{key_prefix}_{instance_pk}"
+        return make_cache_key(key_prefix, *values)
+
+    def get_instance_cache_key(self, instance: Model) -> str:
+        return self._get_cache_key(*(getattr(instance, field) for field in self.cache_key_fields))
+
+    def _get_lookup_cache_key(self, lookup: dict) -> str | None:
+        """
+        Build the cache key from lookup values, e.g. the view kwargs.
+        Returns None if the lookup does not carry all the `cache_key_fields`.
+        """
+        if not all(field in lookup for field in self.cache_key_fields):
+            return None
+
+        return self._get_cache_key(*(lookup[field] for field in self.cache_key_fields))
+
+    def get_fresh_until(self, data: dict) -> float:
+        """
+        Return the timestamp until which a representation is fresh.
+        By default a representation is fresh for `timeout` seconds after it is cached.
+        """
+        return time.time() + self.timeout
+
+    def revalidate(self, data: dict) -> None:
+        """
+        Called when a stale representation is served, to refresh it in the background.
+        """
+
+    def _make_cache_entry(self, data: dict) -> tuple[dict, int]:
+        """
+        Wrap a representation with its freshness.
+        Returns the entry and its cache timeout, the entry is kept `stale_timeout` seconds after it goes stale.
+        """
+        fresh_until = self.get_fresh_until(data)
+        entry = {'data': data, 'fresh_until': fresh_until}
+        return entry, max(int(fresh_until - time.time()), 0) + self.stale_timeout
+
+    def _serve_cache_entry(self, entry: dict) -> dict:
+        # Serve stale representations right away, they are refreshed in the background
+        if entry['fresh_until'] <= time.time():
+            self.revalidate(entry['data'])
+        return entry['data']
+
+    def _cache_representation(self, cache_key: str, data: dict) -> dict:
+        entry, timeout = self._make_cache_entry(data)
+        if self.cache is not None:
+            self.cache.set(cache_key, entry, timeout=timeout)
+        return entry
+
+    def cache_instance(self, instance: Model) -> None:
+        """
+        Write the representation of `instance` through to the cache, e.g. after a refresh outside of a request.
+        """
+        data = self.get_serializer_class()(instance).data
+        self._cache_representation(self.get_instance_cache_key(instance), data)
+
+    def get_cached_representations(self, cache_keys: list[str]) -> dict:
+        """
+        Return the cached representations found for `cache_keys`, with a single cache round-trip.
+        """
+        if self.cache is None:
+            return {}
+
+        entries = self.cache.get_many(cache_keys)
+        return {cache_key: self._serve_cache_entry(entry) for cache_key, entry in entries.items()}
+
+    def _cache_representations(self, representations: dict) -> None:
+        if self.cache is None or not representations:
+            return
+
+        # Entries are written with one round-trip per distinct timeout
+        entries_by_timeout = defaultdict(dict)
+        for cache_key, data in representations.items():
+            entry, timeout = self._make_cache_entry(data)
+            entries_by_timeout[timeout][cache_key] = entry
+        for timeout, entries in entries_by_timeout.items():
+            self.cache.set_many(entries, timeout=timeout)
+
+    def get_conditional_response(
+        self, response: HttpResponse, cache_key: str, entry: dict, variant: str = ''
+    ) -> HttpResponse:
+        """
+        Add the caching headers of a cache entry to its response, and answer the conditional requests.
+        Clients and CDNs may keep the response until the entry goes stale, see `get_fresh_until`.
+        With a `version_field`, the response is validated by a strong ETag and its Last-Modified time,
+        and a 304 is returned if the client already has it. `variant` tells apart the representations
+        served from the same entry, e.g. projections of it.
+        """
+        max_age = max(int(entry['fresh_until'] - time.time()), 0)
+        if self.stale_timeout:
+            patch_cache_control(response, public=True, max_age=max_age, stale_while_revalidate=self.stale_timeout)
+        else:
+            patch_cache_control(response, public=True, max_age=max_age)
+
+        if self.version_field is None:
+            return response
+
+        version = entry['data'][self.version_field]
+        etag = quote_etag(hashlib.md5(f"{cache_key}:{version}:{variant}".encode()).hexdigest())
+        # HTTP dates have a one second precision
+        last_modified = int(datetime.fromisoformat(version).timestamp())
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        # The ETag is computed from the data, whatever the format it is rendered to
+        patch_vary_headers(response, ('Accept',))
+
+        return get_conditional_response(self.request, etag=etag, last_modified=last_modified, response=response)
+
+    def get_cached_response(
+        self, cache_key: str, get_instance: Callable[[], Model], variant: str = ''
+    ) -> HttpResponse:
+        """
+        Return the cached representation stored under `cache_key`.
+        On a miss, serialize the instance returned by `get_instance` and cache it.
+        A stale representation is served as is and revalidated, see `revalidate`.
+        Conditional requests are answered from the cache entry, before the representation is rendered,
+        see `get_conditional_response`.
+        """
+        with timed('cache'):
+            entry = self.cache.get(cache_key) if self.cache is not None else None
+        CACHE_REQUESTS.inc(result='hit' if entry is not None else 'miss')
+
+        if entry is None:
+            instance = get_instance()
+            with timed('serialize'):
+                data = self.get_serializer(instance).data
+            entry = self._cache_representation(cache_key, data)
+
+        response = Response(self._serve_cache_entry(entry))
+        return self.get_conditional_response(response, cache_key, entry, variant)
 
     def perform_create(self, serializer: Serializer) -> None:
         instance = serializer.save()
 
         # Add the new instance to cache
-        if self.cache is not None:
-            self.cache.set(self._get_cache_key(instance.pk), instance, timeout=self.timeout)
+        self._cache_representation(self.get_instance_cache_key(instance), serializer.data)
 
     def retrieve(self, request: Request, *args, **kwargs) -> Response:
-        instance_obj = kwargs.get('instance', None)
-        # Retrieve the instance from cache, or if not found, cache it
-        if self.cache is not None:
-            instance = self.cache.get_or_set(self._get_cache_key(kwargs['pk']), instance_obj or self.get_object(), timeout=self.timeout)
-        else:
-            instance = instance_obj or self.get_object()
-
-        instance.refresh_from_db()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        cache_key = self._get_lookup_cache_key(kwargs)
+        if cache_key is not None:
+            return self.get_cached_response(cache_key, self.get_object)
 
-    def update(self, request: Request, *args, **kwargs) -> Response:
-        response = super().update(request, *args, **kwargs)
+        # The cache is keyed on other fields than the URL lookup, so we need the instance to build the key
+        instance = self.get_object()
+        return self.get_cached_response(self.get_instance_cache_key(instance), lambda: instance)
 
-        # Update cache with the updated instance
-        if self.cache is not None and self._get_cache_key(kwargs['pk']) in self.cache:
-            instance = self.cache.get(self._get_cache_key(kwargs['pk']))
-            instance.refresh_from_db()
-            self.cache.set(self._get_cache_key(kwargs['pk']), instance, timeout=self.timeout)
+    def perform_update(self, serializer: Serializer) -> None:
+        previous_cache_key = self.get_instance_cache_key(serializer.instance)
+        instance = serializer.save()
+        cache_key = self.get_instance_cache_key(instance)
 
-        return response
+        # Update cache with the updated instance, and drop the old entry if its key changed
+        if self.cache is not None and previous_cache_key != cache_key:
+            self.cache.delete(previous_cache_key)
+        self._cache_representation(cache_key, serializer.data)
 
-    def destroy(self, request: Request, *args, **kwargs) -> Response:
-        response = super().destroy(request, *args, **kwargs)
+    def perform_destroy(self, instance: Model) -> None:
+        cache_key = self.get_instance_cache_key(instance)
+        super().perform_destroy(instance)
 
         # Remove the instance from cache
         if self.cache is not None:
-            self.cache.delete(self._get_cache_key(kwargs['pk']))
-
-        return response
+            self.cache.delete(cache_key)
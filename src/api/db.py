@@ -0,0 +1,130 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.dispatch import receiver
+
+from celery.signals import task_prerun
+
+
+logger = logging.getLogger(__name__)
+
+# Until when the reads of the current request or task go to the primary, as it wrote recently
+_primary_pinned_until = ContextVar('primary_pinned_until', default=0.0)
+
+
+def release_connections() -> None:
+    """
+    Give the pooled database connections of this thread back to their pool before a long wait, e.g. on the
+    external API, so waiting requests do not hold connections. The next query takes one from the pool again.
+    Connections in a transaction are kept, and so are the unpooled ones, which would have to reconnect.
+    """
+    for connection in connections.all(initialized_only=True):
+        if getattr(connection, 'pool', None) is not None and not connection.in_atomic_block:
+            connection.close()
+
+
+def pin_to_primary(seconds: float) -> None:
+    _primary_pinned_until.set(max(_primary_pinned_until.get(), time.monotonic() + seconds))
+
+
+@receiver(request_started)
+@task_prerun.connect
+def reset_primary_pin(**kwargs) -> None:
+    # Threads serve one request or task after the other, a pin is not passed on to the next one
+    _primary_pinned_until.set(0.0)
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary in this block, e.g. a row another request has just written.
+    """
+    token = _primary_pinned_until.set(float('inf'))
+    try:
+        yield
+    finally:
+        _primary_pinned_until.reset(token)
+
+
+def get_replica_lag(alias: str) -> float:
+    """
+    Return how many seconds a replica is behind the primary, 0 if it replayed everything it received.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        lag, = cursor.fetchone()
+    return float(lag or 0)
+
+
+class ReplicaRouter:
+    """Route the reads of the flights to the replicas of `DATABASE_REPLICAS`, and their writes to the primary.
+    The other apps, e.g. the sessions and the admin, stay on the primary.
+    Replicas lagging more than `DATABASE_REPLICA_MAX_LAG` seconds, or failing, are skipped until their next check,
+    every `DATABASE_REPLICA_LAG_CHECK_INTERVAL` seconds per process. The reads go to the primary if none is left.
+    A request or task reads from the primary for `DATABASE_REPLICA_MAX_LAG` seconds after it writes,
+    so it reads its own writes, see `use_primary` to read the writes of others.
+    """
+
+    app_labels = ('flights',)
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._checks = {}  # alias: (checked at, healthy)
+
+    def is_healthy(self, alias: str) -> bool:
+        checked_at, healthy = self._checks.get(alias, (None, False))
+        now = time.monotonic()
+        if checked_at is not None and now - checked_at < settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+            return healthy
+
+        # A single thread checks the replicas, the others use the last results meanwhile
+        if not self._lock.acquire(blocking=False):
+            return healthy
+        try:
+            lag = get_replica_lag(alias)
+            healthy = lag <= settings.DATABASE_REPLICA_MAX_LAG
+            if not healthy:
+                logger.warning("Skipped the replica %s, it lags %.1f seconds behind the primary.", alias, lag)
+        except Exception:
+            logger.exception("Skipped the replica %s, its lag could not be checked.", alias)
+            healthy = False
+        finally:
+            self._lock.release()
+        self._checks[alias] = (now, healthy)
+        return healthy
+
+    def db_for_read(self, model, **hints) -> str | None:
+        if model._meta.app_label not in self.app_labels:
+            return None
+        if not settings.DATABASE_REPLICAS or time.monotonic() < _primary_pinned_until.get():
+            return DEFAULT_DB_ALIAS
+
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if self.is_healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints) -> str | None:
+        if model._meta.app_label not in self.app_labels:
+            return None
+        pin_to_primary(settings.DATABASE_REPLICA_MAX_LAG)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        # The replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, model_name: str = None, **hints) -> bool | None:
+        # The replicas are migrated by the replication of the primary
+        return False if db in settings.DATABASE_REPLICAS else None
@@ -0,0 +1,294 @@
+import asyncio
+import os
+import threading
+from typing import TYPE_CHECKING
+
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import Retry
+
+from django.conf import settings
+
+# Not `rest_framework.serializers`, this module is imported by the Celery workers which do not need it
+from rest_framework.exceptions import ValidationError
+
+from ..metrics import UPSTREAM_RESPONSES, timed
+from ..resilience import CircuitBreaker, CircuitOpen, RateLimitExceeded, TokenBucket
+
+
+if TYPE_CHECKING:
+    import httpx
+
+
+def get_flight_url(airline: str, flight_number: str, departure_date: str) -> str:
+    """
+    Build the external API URL of a flight, the departure date is in the format 'YYYY-MM-DD'.
+    """
+    url = settings.API_URL
+    if not url:
+        raise ValidationError("Flight API URL is not configured in settings.")
+
+    year, month, day = departure_date.split('-')
+    return url.format(
+        airline=airline,
+        flight_number=flight_number,
+        year=year,
+        month=month,
+        day=day
+    )
+
+
+def get_upstream_circuit_breaker() -> CircuitBreaker | None:
+    """
+    Return the circuit breaker of the external API, shared by all the processes through Redis.
+    Returns None if Redis is disabled.
+    """
+    if not settings.ENABLE_REDIS_CACHE:
+        return None
+
+    return CircuitBreaker(
+        'upstream',
+        failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        failure_window=settings.CIRCUIT_BREAKER_FAILURE_WINDOW,
+        recovery_timeout=settings.CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+    )
+
+
+def get_upstream_rate_limiter() -> TokenBucket | None:
+    """
+    Return the rate limiter of the external API, shared by all the processes through Redis.
+    Returns None if Redis is disabled.
+    """
+    if not settings.ENABLE_REDIS_CACHE:
+        return None
+
+    return TokenBucket('upstream', rate=settings.UPSTREAM_RATE_LIMIT, capacity=settings.UPSTREAM_RATE_LIMIT_BURST)
+
+
+def check_upstream_available() -> None:
+    """
+    Fail fast if the circuit of the external API is open, e.g. before queuing a fetch.
+    """
+    circuit_breaker = get_upstream_circuit_breaker()
+    if circuit_breaker is not None and circuit_breaker.is_open():
+        raise CircuitOpen("The flight API is unavailable, please retry later.")
+
+
+def guard_upstream_call() -> None:
+    """
+    Allow a call to the external API, or raise if the circuit is open or the rate limit is exceeded.
+    """
+    circuit_breaker = get_upstream_circuit_breaker()
+    if circuit_breaker is None:
+        return
+
+    try:
+        circuit_breaker.allow()
+    except CircuitOpen:
+        raise CircuitOpen("The flight API is unavailable, please retry later.")
+
+    if not get_upstream_rate_limiter().acquire(timeout=settings.UPSTREAM_RATE_LIMIT_WAIT):
+        raise RateLimitExceeded("Too many requests to the flight API, please retry later.")
+
+
+def record_upstream_call(status_code: int | None) -> None:
+    """
+    Record the outcome of a call to the external API, None if it did not answer.
+    Only server errors and unanswered calls count as failures.
+    """
+    UPSTREAM_RESPONSES.inc(status=status_code if status_code is not None else 'error')
+
+    circuit_breaker = get_upstream_circuit_breaker()
+    if circuit_breaker is None:
+        return
+
+    if status_code is None or status_code >= 500:
+        circuit_breaker.record_failure()
+    else:
+        circuit_breaker.record_success()
+
+
+def get_upstream_status() -> dict:
+    """
+    Return the state of the circuit breaker and rate limiter of the external API, for monitoring.
+    """
+    circuit_breaker = get_upstream_circuit_breaker()
+    rate_limiter = get_upstream_rate_limiter()
+
+    return {
+        'circuit_breaker': circuit_breaker.get_state() if circuit_breaker is not None else None,
+        'rate_limit': {
+            'rate': rate_limiter.rate,
+            'capacity': rate_limiter.capacity,
+            'tokens': rate_limiter.get_tokens(),
+        } if rate_limiter is not None else None,
+        'session': get_session_stats(),
+    }
+
+
+# Per-process counters of the pooled session, to check connections are reused across fetches
+_session_stats = {
+    'requests': 0,
+    'connections_opened': 0,
+}
+_session_stats_lock = threading.Lock()
+
+
+def _increment_session_stat(name: str) -> None:
+    with _session_stats_lock:
+        _session_stats[name] += 1
+
+
+def get_session_stats() -> dict:
+    """
+    Return the pooled session counters of this process.
+    Every request that did not open a connection reused a kept-alive one.
+    """
+    with _session_stats_lock:
+        stats = dict(_session_stats)
+    stats['connections_reused'] = max(stats['requests'] - stats['connections_opened'], 0)
+    return stats
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _increment_session_stat('connections_opened')
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _increment_session_stat('connections_opened')
+        return super()._new_conn()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTP adapter keeping connections alive, and counting the connections it opens."""
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def send(self, *args, **kwargs) -> requests.Response:
+        _increment_session_stat('requests')
+        return super().send(*args, **kwargs)
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+# Kept-alive connections per host, raised for the workers running many fetches at a time, see `set_session_pool_size`
+_session_pool_size = None
+
+
+def set_session_pool_size(size: int) -> None:
+    """
+    Keep up to `size` connections to the flight API alive in this process, and at least `UPSTREAM_POOL_SIZE`,
+    e.g. one per thread of a threaded Celery worker, its threads share the session.
+    """
+    global _session, _session_pool_size
+
+    with _session_lock:
+        _session_pool_size = max(size, settings.UPSTREAM_POOL_SIZE)
+        _session = None
+
+
+def get_session() -> requests.Session:
+    """
+    Return the HTTP session of this process, its connections to the flight API are kept alive
+    and reused across fetches. Connection errors are retried with exponential backoff and jitter.
+    """
+    global _session, _session_pid
+
+    # Connections must not be shared with a forked child, e.g. a recycled Celery worker
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            retry = Retry(
+                total=settings.UPSTREAM_MAX_RETRIES,
+                connect=settings.UPSTREAM_MAX_RETRIES,
+                read=0,
+                status=0,
+                backoff_factor=settings.UPSTREAM_BACKOFF_FACTOR,
+                backoff_jitter=settings.UPSTREAM_BACKOFF_JITTER,
+                allowed_methods=['GET'],
+            )
+            adapter = PooledHTTPAdapter(
+                pool_connections=settings.UPSTREAM_POOL_CONNECTIONS,
+                pool_maxsize=_session_pool_size or settings.UPSTREAM_POOL_SIZE,
+                max_retries=retry,
+            )
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session_pid = os.getpid()
+
+    return _session
+
+
+def fetch_flight_details(airline: str, flight_number: str, departure_date: str) -> dict:
+    """
+    Fetch flight details from the external API with the pooled session of this process.
+    The call is guarded by the circuit breaker and the rate limiter of the external API.
+    """
+    guard_upstream_call()
+    try:
+        with timed('upstream'):
+            response = get_session().get(
+                get_flight_url(airline, flight_number, departure_date),
+                timeout=settings.UPSTREAM_TIMEOUT,
+            )
+    except requests.RequestException:
+        record_upstream_call(None)
+        raise
+
+    record_upstream_call(response.status_code)
+    return {
+        "status_code": response.status_code,
+        "data": response.json()
+    }
+
+
+# httpx async clients are bound to the event loop they were first used in
+_async_clients = {}
+
+
+def get_async_client() -> 'httpx.AsyncClient':
+    # Imported on first use, only the ASGI application fetches flights asynchronously
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients.clear()
+        _async_clients[loop] = httpx.AsyncClient(
+            timeout=settings.UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=settings.UPSTREAM_POOL_SIZE),
+        )
+    return _async_clients[loop]
+
+
+async def afetch_flight_details(airline: str, flight_number: str, departure_date: str) -> dict:
+    """
+    Fetch flight details from the external API without blocking the event loop.
+    Returns the same payload as the `get_flight_details` task.
+    """
+    import httpx
+
+    # The guards only make short Redis calls, they run in a thread to keep the event loop free
+    await sync_to_async(guard_upstream_call, thread_sensitive=False)()
+    try:
+        with timed('upstream'):
+            response = await get_async_client().get(get_flight_url(airline, flight_number, departure_date))
+    except httpx.HTTPError:
+        await sync_to_async(record_upstream_call, thread_sensitive=False)(None)
+        raise
+
+    await sync_to_async(record_upstream_call, thread_sensitive=False)(response.status_code)
+    return {
+        "status_code": response.status_code,
+        "data": response.json()
+    }
@@ -0,0 +1,31 @@
+from django.conf import settings
+
+from django_filters import rest_framework as filters
+
+from flights.models import Flight
+
+from ..pagination import KeysetPagination
+
+
+class FlightFilterSet(filters.FilterSet):
+    """
+    Filter the flights on their indexed columns, see the `Flight` indexes.
+    The departure date range is given by `departure_date_after` and `departure_date_before`, both inclusive.
+    """
+    airline = filters.CharFilter(field_name='airline_code')
+    departure_airport = filters.CharFilter()
+    arrival_airport = filters.CharFilter()
+    departure_date = filters.DateFromToRangeFilter()
+    status_code = filters.CharFilter()
+
+    class Meta:
+        model = Flight
+        fields = ('airline', 'departure_airport', 'arrival_airport', 'departure_date', 'status_code')
+
+
+class FlightKeysetPagination(KeysetPagination):
+    """Page the flights in departure date order, the ordering of the search indexes."""
+
+    ordering = ('departure_date', 'pk')
+    page_size = settings.SEARCH_PAGE_SIZE
+    max_page_size = settings.SEARCH_MAX_PAGE_SIZE
@@ -0,0 +1,210 @@
+# Data that the external service would return for AA100, used by the tests and the benchmark and load test commands
+FLIGHT_DETAILS_RESPONSE = {
+    "flightId": 1321611460,
+    "flightNote": {
+    "final": False,
+    "canceled": False,
+    "hasDepartedGate": False,
+    "hasDepartedRunway": False,
+    "landed": False,
+    "message": "Tracking will begin after departure",
+    "messageCode": "S",
+    "pastExpectedTakeOff": False,
+    "tracking": False,
+    "hasPositions": False,
+    "trackingUnavailable": False,
+    "phase": None,
+    "hasActualRunwayDepartureTime": False,
+    "hasActualGateDepartureTime": False
+    },
+    "isTracking": False,
+    "isLanded": False,
+    "isScheduled": True,
+    "sortTime": "2025-06-15T22:10:00.000Z",
+    "schedule": {
+    "scheduledDeparture": "2025-06-15T18:10:00.000",
+    "scheduledDepartureUTC": "2025-06-15T22:10:00.000Z",
+    "estimatedActualDepartureRunway": False,
+    "estimatedActualDepartureTitle": "Estimated",
+    "estimatedActualDeparture": "2025-06-15T18:10:00.000",
+    "estimatedActualDepartureUTC": "2025-06-15T22:10:00.000Z",
+    "scheduledArrival": "2025-06-16T06:20:00.000",
+    "scheduledArrivalUTC": "2025-06-16T05:20:00.000Z",
+    "estimatedActualArrivalRunway": False,
+    "estimatedActualArrivalTitle": "Estimated",
+    "estimatedActualArrival": "2025-06-16T06:20:00.000",
+    "estimatedActualArrivalUTC": "2025-06-16T05:20:00.000Z",
+    "graphXAxis": {
+        "dep": "2025-06-15T18:10:00.000",
+        "depUTC": "2025-06-15T22:10:00.000Z",
+        "arr": "2025-06-16T06:20:00.000",
+        "arrUTC": "2025-06-16T05:20:00.000Z"
+    }
+    },
+    "status": {
+    "statusCode": "S",
+    "status": "Scheduled",
+    "color": "green",
+    "statusDescription": "On time",
+    "delay": {
+        "departure": {
+        "minutes": 0
+        },
+        "arrival": {
+        "minutes": 0
+        }
+    },
+    "delayStatus": {
+        "wording": "On time",
+        "minutes": 0
+    },
+    "lastUpdatedText": "Status Last Updated More Than 3 Hours Ago",
+    "diverted": False
+    },
+    "resultHeader": {
+    "statusDescription": "On time",
+    "carrier": {
+        "name": "American Airlines",
+        "fs": "AA"
+    },
+    "flightNumber": "100",
+    "status": "Scheduled",
+    "diverted": False,
+    "color": "green",
+    "departureAirportFS": "JFK",
+    "arrivalAirportFS": "LHR",
+    "divertedAirport": None
+    },
+    "ticketHeader": {
+    "carrier": {
+        "name": "American Airlines",
+        "fs": "AA"
+    },
+    "flightNumber": "100"
+    },
+    "operatedBy": None,
+    "departureAirport": {
+    "fs": "JFK",
+    "iata": "JFK",
+    "name": "New York John F. Kennedy International Airport",
+    "city": "New York",
+    "state": "NY",
+    "country": "US",
+    "timeZoneRegionName": "America/New_York",
+    "regionName": "North America",
+    "gate": "31",
+    "terminal": "8",
+    "times": {
+        "scheduled": {
+        "time": "6:10",
+        "ampm": "PM",
+        "time24": "18:10",
+        "timezone": "EDT"
+        },
+        "estimatedActual": {
+        "title": "Estimated",
+        "time": "6:10",
+        "ampm": "PM",
+        "time24": "18:10",
+        "runway": False,
+        "timezone": "EDT"
+        }
+    },
+    "date": "2025-06-15T18:10:00.000"
+    },
+    "arrivalAirport": {
+    "fs": "LHR",
+    "iata": "LHR",
+    "name": "London Heathrow Airport",
+    "city": "London",
+    "state": "EN",
+    "country": "GB",
+    "timeZoneRegionName": "Europe/London",
+    "regionName": "Europe",
+    "gate": None,
+    "terminal": "3",
+    "baggage": None,
+    "times": {
+        "scheduled": {
+        "time": "6:20",
+        "ampm": "AM",
+        "time24": "06:20",
+        "timezone": "BST"
+        },
+        "estimatedActual": {
+        "title": "Estimated",
+        "time": "6:20",
+        "ampm": "AM",
+        "time24": "06:20",
+        "runway": False,
+        "timezone": "BST"
+        }
+    },
+    "date": "2025-06-16T06:20:00.000"
+    },
+    "divertedAirport": None,
+    "additionalFlightInfo": {
+    "equipment": {
+        "iata": "77W",
+        "name": "Boeing 777-300ER",
+        "title": "Actual"
+    },
+    "flightDuration": "7h 10m"
+    },
+    "codeshares": [
+    {
+        "fs": "AS",
+        "name": "Alaska Airlines",
+        "flightNumber": "6904"
+    },
+    {
+        "fs": "AY",
+        "name": "Finnair",
+        "flightNumber": "4012"
+    },
+    {
+        "fs": "BA",
+        "name": "British Airways",
+        "flightNumber": "1511"
+    },
+    {
+        "fs": "GF",
+        "name": "Gulf Air",
+        "flightNumber": "6654"
+    },
+    {
+        "fs": "IB",
+        "name": "Iberia",
+        "flightNumber": "4218"
+    },
+    {
+        "fs": "UL",
+        "name": "SriLankan Airlines",
+        "flightNumber": "2026"
+    }
+    ],
+    "positional": {
+    "departureAirportCode": "JFK",
+    "arrivalAirportCode": "LHR",
+    "divertedAirportCode": None,
+    "flexFlightStatus": "S",
+    "flexTrack": {
+        "flightId": 1321611460,
+        "carrierFsCode": "AA",
+        "flightNumber": "100",
+        "tailNumber": "N721AN",
+        "departureAirportFsCode": "JFK",
+        "arrivalAirportFsCode": "LHR",
+        "departureDate": {
+        "dateUtc": "2025-06-15T22:10:00.000Z",
+        "dateLocal": "2025-06-15T18:10:00.000"
+        },
+        "equipment": "77W",
+        "bearing": 51.3509835073817,
+        "positions": [],
+        "irregularOperations": [],
+        "fleetAircraftId": 141162
+    }
+    },
+    "flightState": "currentDatePreDeparture"
+}
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from django.conf import settings
+
+
+FINAL_STATUS_CODES = ('L', 'C', 'D', 'NO')  # landed, canceled, diverted, not operational
+AIRBORNE_STATUS_CODES = ('A',)  # active
+
+
+def get_flight_state(extra_data: dict) -> str:
+    """
+    Classify a flight from its external API data, as one of the `FLIGHT_FRESHNESS_TIMEOUTS` states.
+    """
+    extra_data = extra_data or {}
+    flight_note = extra_data.get('flightNote') or {}
+    status_code = (extra_data.get('status') or {}).get('statusCode')
+
+    if flight_note.get('final') or flight_note.get('landed') or extra_data.get('isLanded') or status_code in FINAL_STATUS_CODES:
+        return 'final'
+    if status_code in AIRBORNE_STATUS_CODES or extra_data.get('isTracking') or flight_note.get('hasDepartedRunway'):
+        return 'airborne'
+    if status_code == 'S' or extra_data.get('isScheduled'):
+        return 'scheduled'
+    return 'unknown'
+
+
+def get_fresh_timeout(extra_data: dict) -> int:
+    """
+    Return how many seconds the data of a flight stays fresh after it was fetched.
+    """
+    return settings.FLIGHT_FRESHNESS_TIMEOUTS[get_flight_state(extra_data)]
+
+
+def get_fresh_until(data: dict) -> float:
+    """
+    Return the timestamp until which a serialized flight is fresh, counted from its last fetch.
+    """
+    updated_at = datetime.fromisoformat(data['updated_at'])
+    return updated_at.timestamp() + get_fresh_timeout(data['extra_data'])
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from flights.models import Flight
+
+from ..cache import get_async_redis_connection
+from ..db import release_connections
+from ..renderers import ORJSONRenderer
+from .serializers import FlightSerializer
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_update_channel(airline: str, flight_number: str, departure_date: str) -> str:
+    return f"{settings.FLIGHT_UPDATES_CHANNEL_PREFIX}{airline}_{flight_number}_{departure_date}"
+
+
+def render_flight(flight: Flight) -> str:
+    return ORJSONRenderer().render(FlightSerializer(flight).data).decode()
+
+
+def publish_flight_update(flight: Flight) -> None:
+    """
+    Push the representation of a flight to its subscribers on every node, see `FlightUpdateHub`.
+    """
+    if not settings.ENABLE_REDIS_CACHE:
+        return
+    get_redis_connection('redis').publish(get_update_channel(*flight.natural_key), render_flight(flight))
+
+
+class FlightUpdateHub:
+    """Fan the flight updates published on Redis out to the subscribers of this process.
+    A single Redis connection is subscribed to the channels of the flights followed by at least one subscriber,
+    so an idle subscription costs a queue and no connection. The updates are dropped from oldest
+    for the subscribers reading slower than they come, only the latest state of a flight matters.
+    """
+
+    def __init__(self) -> None:
+        self.pubsub = get_async_redis_connection().pubsub(ignore_subscribe_messages=True)
+        self.subscribers = defaultdict(set)  # channel: queues
+        self._listener = None
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[asyncio.Queue]:
+        queue = asyncio.Queue(maxsize=settings.FLIGHT_UPDATES_QUEUE_SIZE)
+        subscribers = self.subscribers[channel]
+        subscribers.add(queue)
+        try:
+            if len(subscribers) == 1:
+                await self.pubsub.subscribe(channel)
+            if self._listener is None:
+                self._listener = asyncio.create_task(self._listen())
+            yield queue
+        finally:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self.subscribers[channel]
+                await self.pubsub.unsubscribe(channel)
+
+    async def _listen(self) -> None:
+        try:
+            while self.subscribers:
+                try:
+                    message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+                except Exception:
+                    # The connection is reopened and its channels subscribed again by the next read
+                    logger.exception("Failed to read the flight updates.")
+                    await asyncio.sleep(1)
+                    continue
+                if message is not None and message['type'] == 'message':
+                    self._dispatch(message['channel'].decode(), message['data'].decode())
+        finally:
+            self._listener = None
+
+    def _dispatch(self, channel: str, data: str) -> None:
+        for queue in self.subscribers.get(channel, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(data)
+
+
+# The hubs are bound to the event loop of their Redis connection, see `get_async_redis_connection`
+_hubs = {}
+
+
+def get_flight_update_hub() -> FlightUpdateHub:
+    loop = asyncio.get_running_loop()
+    # The hubs of the closed event loops have no subscribers left, they are dropped
+    for closed_loop in [hub_loop for hub_loop in _hubs if hub_loop.is_closed()]:
+        del _hubs[closed_loop]
+    if loop not in _hubs:
+        _hubs[loop] = FlightUpdateHub()
+    return _hubs[loop]
+
+
+def format_event(data: str) -> str:
+    return f"event: flight\ndata: {data}\n\n"
+
+
+async def stream_flight_updates(airline: str, flight_number: str, departure_date: str) -> AsyncIterator[str]:
+    """
+    Stream the updates of a flight as Server-Sent Events, starting with its stored state if any.
+    A comment is sent every `FLIGHT_UPDATES_HEARTBEAT` seconds so idle streams are not closed by proxies.
+    """
+    hub = get_flight_update_hub()
+    # Subscribed before reading the stored flight, so no update is missed in between
+    async with hub.subscribe(get_update_channel(airline, flight_number, departure_date)) as queue:
+        flight = await Flight.objects.filter(
+            airline_code=airline,
+            flight_number=flight_number,
+            departure_date=departure_date,
+        ).afirst()
+        # The stream may stay open for hours, without holding a database connection
+        await sync_to_async(release_connections)()
+        if flight is not None:
+            yield format_event(render_flight(flight))
+
+        while True:
+            try:
+                data = await asyncio.wait_for(queue.get(), timeout=settings.FLIGHT_UPDATES_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+            else:
+                yield format_event(data)
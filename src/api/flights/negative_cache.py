@@ -0,0 +1,69 @@
+from django.conf import settings
+
+from ..cache import get_cache, make_cache_key
+from ..resilience import CircuitOpen, RateLimitExceeded
+from ..singleflight import SingleFlightError
+
+
+def get_negative_cache_key(airline: str, flight_number: str, departure_date: str) -> str:
+    return make_cache_key('flight_negative', airline, flight_number, departure_date)
+
+
+def get_negative_kind(error: Exception) -> str | None:
+    """
+    Return the `NEGATIVE_CACHE_TIMEOUTS` kind of a failed lookup, or None if it must not be cached.
+    Failures of the circuit breaker, the rate limiter and the single-flight are local and transient,
+    the waiting requests get the error of their leader, which caches it.
+    """
+    if isinstance(error, (CircuitOpen, RateLimitExceeded, SingleFlightError)):
+        return None
+    return getattr(error, 'negative_cache_kind', 'error')
+
+
+def get_negative_result(airline: str, flight_number: str, departure_date: str) -> str | None:
+    """
+    Return the error message of a recent failed lookup of the flight, if any.
+    """
+    cache = get_cache()
+    if cache is None:
+        return None
+    return cache.get(get_negative_cache_key(airline, flight_number, departure_date))
+
+
+def get_negative_results(lookups: list[tuple]) -> dict[tuple, str]:
+    """
+    Return the error messages of the recent failed lookups among `lookups`, with a single cache round-trip.
+    """
+    cache = get_cache()
+    if cache is None or not lookups:
+        return {}
+
+    cache_keys = {get_negative_cache_key(*lookup): lookup for lookup in lookups}
+    return {cache_keys[cache_key]: message for cache_key, message in cache.get_many(list(cache_keys)).items()}
+
+
+def set_negative_result(airline: str, flight_number: str, departure_date: str, error: Exception, message: str) -> None:
+    """
+    Cache the error message of a failed lookup, for the timeout of its kind.
+    """
+    cache = get_cache()
+    kind = get_negative_kind(error)
+    if cache is None or kind is None:
+        return
+
+    cache.set(
+        get_negative_cache_key(airline, flight_number, departure_date),
+        message,
+        timeout=settings.NEGATIVE_CACHE_TIMEOUTS[kind],
+    )
+
+
+def clear_negative_results(lookups: list[tuple]) -> None:
+    """
+    Forget the failed lookups of flights that were just stored.
+    """
+    cache = get_cache()
+    if cache is None or not lookups:
+        return
+
+    cache.delete_many([get_negative_cache_key(*lookup) for lookup in lookups])
@@ -1,15 +1,70 @@
-import requests
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import cached_property
+
+from asgiref.sync import sync_to_async
+from celery import group
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from celery.result import AsyncResult
 
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 
-from flights.models import Flight
+from flights.models import HOT_FIELDS, Flight, FlightVersion
 
+from ..db import release_connections, use_primary
+from ..metrics import timed
+from ..singleflight import SingleFlight
+from .client import afetch_flight_details, check_upstream_available
+from .negative_cache import clear_negative_results, get_negative_result, get_negative_results, set_negative_result
 from .tasks import get_flight_details
 
 
+async def await_task_result(result: AsyncResult, timeout: int) -> dict:
+    """
+    Wait for a Celery task result without blocking the event loop.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+
+    while not await sync_to_async(result.ready)():
+        if time.monotonic() >= deadline:
+            raise CeleryTimeoutError("The operation timed out.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+    return await sync_to_async(result.get)(timeout=timeout)
+
+
+class FlightLookupError(serializers.ValidationError):
+    """A flight the external API could not return, cached for its `NEGATIVE_CACHE_TIMEOUTS` kind."""
+
+    def __init__(self, detail: str, negative_cache_kind: str) -> None:
+        super().__init__(detail)
+        self.negative_cache_kind = negative_cache_kind
+
+
 class FlightSerializer(serializers.ModelSerializer):
+    """
+    Serialize a flight, or only the requested `fields` of it.
+    Flights are represented through a lean read path, see `to_representation`.
+    """
+    # Fields loaded only when they are requested, see `get_deferred_fields`
+    deferrable_fields = ('extra_data',)
+    # Fields whose DRF representation is a plain conversion, applied directly by the lean read path.
+    # The ISO 8601 datetimes are converted by `_represent_datetime`.
+    lean_representations = {
+        serializers.CharField: str,
+        serializers.IntegerField: int,
+        serializers.JSONField: None,
+        serializers.DateTimeField: datetime,
+    }
 
     class Meta:
         model = Flight
@@ -19,27 +74,189 @@ class FlightSerializer(serializers.ModelSerializer):
             'flight_number',
             'departure_date',
             'extra_data',
+            'updated_at',
+            *HOT_FIELDS,
         )
 
+    def __init__(self, *args, fields: list[str] | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.requested_fields = fields
+
+    def get_fields(self) -> dict:
+        fields = super().get_fields()
+        if self.requested_fields is not None:
+            fields = {name: field for name, field in fields.items() if name in self.requested_fields}
+        return fields
+
+    @classmethod
+    def _get_lean_representation(cls, field: serializers.Field):
+        representation = cls.lean_representations.get(type(field), field.to_representation)
+
+        if getattr(field, 'binary', False) or len(field.source_attrs) != 1:
+            return field.to_representation
+        if representation is datetime:
+            iso_8601 = getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601
+            if not (iso_8601 and settings.USE_TZ and 'timezone' not in field.__dict__):
+                return field.to_representation
+        return representation
+
+    @classmethod
+    def _get_lean_fields(cls) -> list[tuple]:
+        """
+        Return the (name, attribute, representation) of the readable fields, introspected once per class.
+        The representation is None for the values represented as is.
+        """
+        if '_lean_fields' not in cls.__dict__:
+            cls._lean_fields = [
+                (name, field.source_attrs[0], cls._get_lean_representation(field))
+                for name, field in cls().fields.items() if not field.write_only
+            ]
+        return cls._lean_fields
+
+    @cached_property
+    def _timezone(self):
+        return timezone.get_current_timezone()
+
+    def _represent_datetime(self, value: datetime) -> str:
+        # Same output as `DateTimeField.to_representation`, the current timezone is looked up once per serializer
+        value = value.astimezone(self._timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    def to_representation(self, instance: Flight) -> dict:
+        """
+        Lean version of `ModelSerializer.to_representation`, with the same output.
+        The fields are introspected once per class instead of once per serializer,
+        and the plain model attributes are read and converted without the per-field DRF machinery.
+        """
+        data = {}
+        for name, attribute, representation in self._get_lean_fields():
+            if self.requested_fields is not None and name not in self.requested_fields:
+                continue
+            value = getattr(instance, attribute)
+            if value is None or representation is None:
+                data[name] = value
+            elif representation is datetime:
+                data[name] = self._represent_datetime(value)
+            else:
+                data[name] = representation(value)
+        return data
+
+    @classmethod
+    def parse_fields(cls, fields: str | None) -> list[str] | None:
+        """
+        Validate a comma-separated `fields` projection, e.g. the `fields` query parameter.
+        Returns None if no projection is requested.
+        """
+        if not fields:
+            return None
+
+        field_names = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in field_names if field not in cls.Meta.fields]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown fields: {', '.join(unknown)}. Available fields are: {', '.join(cls.Meta.fields)}."
+            )
+        return field_names
+
+    @classmethod
+    def get_deferred_fields(cls, fields: list[str] | None) -> list[str]:
+        """
+        Return the model fields a queryset can defer for the `fields` projection.
+        """
+        if fields is None:
+            return []
+        return [field for field in cls.deferrable_fields if field not in fields]
+
+    @staticmethod
+    def project(data: dict, fields: list[str] | None) -> dict:
+        """
+        Keep only the `fields` of a representation, e.g. a cached one.
+        """
+        if fields is None:
+            return data
+        return {field: data[field] for field in fields if field in data}
+
     def _fetch_from_api(self, airline: str, flight_number: str, departure_date: str) -> dict:
         """
         Fetch flight details from an external API.
         will use celery if CELERY_ENABLED is set to True.
+        Fails fast without queuing a fetch while the circuit of the external API is open.
+        No database connection is held while waiting on the external API, see `release_connections`.
         """
+        check_upstream_available()
+        release_connections()
         if settings.CELERY_ENABLED:
             # If Celery is enabled, use the task to fetch flight details
-            result = get_flight_details.delay(airline, flight_number, departure_date)
-            results = result.get(timeout=30)  # waits up to 30 seconds for the result
+            with timed('celery'):
+                result = get_flight_details.delay(airline, flight_number, departure_date)
+                results = result.get(timeout=30)  # waits up to 30 seconds for the result
         else:
             # If Celery is not enabled, fetch flight details directly
             results = get_flight_details(airline, flight_number, departure_date)
 
+        return self._get_api_data(results)
+
+    async def _afetch_from_api(self, airline: str, flight_number: str, departure_date: str) -> dict:
+        """
+        Async version of `_fetch_from_api`, waits for the external API without blocking the event loop.
+        """
+        await sync_to_async(check_upstream_available, thread_sensitive=False)()
+        # The connections are held by the thread running the ORM calls of the request
+        await sync_to_async(release_connections)()
+        if settings.CELERY_ENABLED:
+            with timed('celery'):
+                result = await sync_to_async(get_flight_details.delay)(airline, flight_number, departure_date)
+                results = await await_task_result(result, timeout=30)
+        else:
+            results = await afetch_flight_details(airline, flight_number, departure_date)
+
+        return self._get_api_data(results)
+
+    def _fetch_many_from_api(self, lookups: list[tuple]) -> dict[tuple, dict | Exception]:
+        """
+        Fetch several flights from the external API, at most `BATCH_UPSTREAM_CONCURRENCY` at a time.
+        Returns the API results, or the error, of each (airline, flight_number, departure_date) lookup.
+        """
+        concurrency = settings.BATCH_UPSTREAM_CONCURRENCY
+        results = {}
+
+        try:
+            check_upstream_available()
+        except Exception as e:
+            return {lookup: e for lookup in lookups}
+        release_connections()
+
+        if settings.CELERY_ENABLED:
+            # Fan each chunk out as a group of tasks, and wait for it before sending the next one
+            for start in range(0, len(lookups), concurrency):
+                chunk = lookups[start:start + concurrency]
+                group_result = group(get_flight_details.s(*lookup) for lookup in chunk).apply_async()
+                try:
+                    chunk_results = group_result.get(timeout=30, propagate=False)
+                except CeleryTimeoutError as e:
+                    chunk_results = [result.result if result.ready() else e for result in group_result.results]
+                results.update(zip(chunk, chunk_results))
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {lookup: executor.submit(get_flight_details, *lookup) for lookup in lookups}
+            for lookup, future in futures.items():
+                try:
+                    results[lookup] = future.result()
+                except Exception as e:
+                    results[lookup] = e
+
+        return results
+
+    def _get_api_data(self, results: dict) -> dict:
+        """
+        Return the flight data of an external API response, or raise if the flight could not be fetched.
+        """
         response = results['data']
         status_code = results['status_code']
         if status_code == 500:
-            raise serializers.ValidationError("External API error.")
+            raise FlightLookupError("External API error.", 'error')
         elif status_code != 200:
-            raise serializers.ValidationError("No flight found with the provided parameters.")
+            raise FlightLookupError("No flight found with the provided parameters.", 'status')
 
         return response
 
@@ -47,37 +264,228 @@ class FlightSerializer(serializers.ModelSerializer):
         """
         Fetch flight details from an external API.
         This method should be implemented to call the actual API and return a Flight instance.
-        Store the flight data in the database if it does not exist.
+        Store the flight data in the database, or update it if the flight was stored concurrently,
+        and record it in the history of the flight, see `FlightVersion`.
         """
         data = self._fetch_from_api(airline, flight_number, departure_date)
 
         if not data:
-            raise serializers.ValidationError("No flight data found.")
-        flight = Flight.objects.create(
-            airline_code=airline,
-            flight_number=flight_number,
-            departure_date=departure_date,
-            extra_data=data,
-        )
+            raise FlightLookupError("No flight data found.", 'not_found')
+        flight = self._store_flight(airline, flight_number, departure_date, data)
+        clear_negative_results([flight.natural_key])
         return flight
 
-    def get_flight_details(self, airline: str, flight_number: str, departure_date: str) -> Flight:
+    def _store_flight(self, airline: str, flight_number: str, departure_date: str, data: dict) -> Flight:
         """
-        Fetch flight details based on airline, flight number, and departure date.
-        This method can be overridden to implement custom logic for fetching flight details.
+        Store the flight data and record it in the history of the flight in one transaction,
+        so a flight is never stored without its version.
         """
-        try:
-            return Flight.objects.get(
+        with transaction.atomic():
+            flight = Flight.objects.upsert(
+                airline_code=airline,
+                flight_number=flight_number,
+                departure_date=departure_date,
+                extra_data=data,
+            )
+            FlightVersion.objects.record(flight)
+        return flight
+
+    async def _aget_flight_from_api(self, airline: str, flight_number: str, departure_date: str) -> Flight:
+        """
+        Async version of `_get_flight_from_api`.
+        """
+        data = await self._afetch_from_api(airline, flight_number, departure_date)
+
+        if not data:
+            raise FlightLookupError("No flight data found.", 'not_found')
+        flight = await sync_to_async(self._store_flight)(airline, flight_number, departure_date, data)
+        await sync_to_async(clear_negative_results, thread_sensitive=False)([flight.natural_key])
+        return flight
+
+    def _get_flight_from_api_once(self, airline: str, flight_number: str, departure_date: str) -> Flight:
+        """
+        Fetch flight details from the external API once for all concurrent requests of the same flight.
+        The first request leads the fetch and the insert, the others wait for its result
+        and read the stored flight, see `SingleFlight`.
+        """
+        if not settings.ENABLE_REDIS_CACHE:
+            return self._get_flight_from_api(airline, flight_number, departure_date)
+
+        fetched = {}
+
+        def fetch() -> None:
+            # A previous leader may have stored the flight while we were waiting for the lock
+            flight = Flight.objects.filter(
+                airline_code=airline,
+                flight_number=flight_number,
+                departure_date=departure_date
+            ).first()
+            fetched['flight'] = flight or self._get_flight_from_api(airline, flight_number, departure_date)
+
+        # The followers wait on the leader without holding a database connection, and read the flight it stored
+        # from the primary, the replicas may not have it yet. The id does not locate the partition of the flight,
+        # its natural key does
+        release_connections()
+        with use_primary():
+            SingleFlight(key_prefix='flight').do(f"{airline}_{flight_number}_{departure_date}", fetch)
+            return fetched.get('flight') or Flight.objects.get(
+                airline_code=airline,
+                flight_number=flight_number,
+                departure_date=departure_date
+            )
+
+    async def _aget_flight_from_api_once(self, airline: str, flight_number: str, departure_date: str) -> Flight:
+        """
+        Async version of `_get_flight_from_api_once`, sharing the same flights with sync requests.
+        """
+        if not settings.ENABLE_REDIS_CACHE:
+            return await self._aget_flight_from_api(airline, flight_number, departure_date)
+
+        fetched = {}
+
+        async def fetch() -> None:
+            flight = await Flight.objects.filter(
+                airline_code=airline,
+                flight_number=flight_number,
+                departure_date=departure_date
+            ).afirst()
+            fetched['flight'] = flight or await self._aget_flight_from_api(airline, flight_number, departure_date)
+
+        await sync_to_async(release_connections)()
+        with use_primary():
+            await SingleFlight(key_prefix='flight').ado(f"{airline}_{flight_number}_{departure_date}", fetch)
+            return fetched.get('flight') or await Flight.objects.aget(
                 airline_code=airline,
                 flight_number=flight_number,
                 departure_date=departure_date
             )
+
+    def get_flight_details(self, airline: str, flight_number: str, departure_date: str) -> Flight:
+        """
+        Fetch flight details based on airline, flight number, and departure date.
+        This method can be overridden to implement custom logic for fetching flight details.
+        The failed lookups of the external API are cached for a short while, see `NEGATIVE_CACHE_TIMEOUTS`.
+        """
+        try:
+            with timed('db'):
+                return Flight.objects.get(
+                    airline_code=airline,
+                    flight_number=flight_number,
+                    departure_date=departure_date
+                )
+        except Flight.DoesNotExist:
+            message = get_negative_result(airline, flight_number, departure_date)
+            if message is not None:
+                raise serializers.ValidationError(message)
+            try:
+                return self._get_flight_from_api_once(airline, flight_number, departure_date)
+            except Exception as e:
+                message = f"An error occurred while fetching flight details: {str(e)}"
+                set_negative_result(airline, flight_number, departure_date, e, message)
+                raise serializers.ValidationError(message)
+        except Exception as e:
+            raise serializers.ValidationError(f"An error occurred while fetching flight details: {str(e)}")
+
+    def get_many_flight_details(self, lookups: list[tuple]) -> dict[tuple, Flight | str]:
+        """
+        Fetch the flight details of several (airline, flight_number, departure_date) lookups.
+        The stored flights are read with a single query, the others are fetched from the external API
+        in parallel and stored with a single upsert. The recently failed lookups are not fetched again.
+        Returns the flight, or an error message, of each lookup.
+        """
+        flights = {flight.natural_key: flight for flight in Flight.objects.filter_natural_keys(lookups)}
+        missing = [lookup for lookup in lookups if lookup not in flights]
+
+        errors = get_negative_results(missing)
+        missing = [lookup for lookup in missing if lookup not in errors]
+
+        fetched = []
+        for lookup, results in self._fetch_many_from_api(missing).items():
+            try:
+                if isinstance(results, Exception):
+                    raise results
+                data = self._get_api_data(results)
+                if not data:
+                    raise FlightLookupError("No flight data found.", 'not_found')
+            except Exception as e:
+                errors[lookup] = f"An error occurred while fetching flight details: {str(e)}"
+                set_negative_result(*lookup, e, errors[lookup])
+            else:
+                airline, flight_number, departure_date = lookup
+                fetched.append(Flight(
+                    airline_code=airline,
+                    flight_number=flight_number,
+                    departure_date=departure_date,
+                    extra_data=data,
+                ))
+
+        with transaction.atomic():
+            for flight in Flight.objects.upsert_many(fetched):
+                flights[flight.natural_key] = flight
+                FlightVersion.objects.record(flight)
+        clear_negative_results([flight.natural_key for flight in fetched])
+
+        return {lookup: flights.get(lookup) or errors[lookup] for lookup in lookups}
+
+    async def aget_flight_details(self, airline: str, flight_number: str, departure_date: str) -> Flight:
+        """
+        Async version of `get_flight_details`, for async views.
+        """
+        try:
+            with timed('db'):
+                return await Flight.objects.aget(
+                    airline_code=airline,
+                    flight_number=flight_number,
+                    departure_date=departure_date
+                )
         except Flight.DoesNotExist:
+            message = await sync_to_async(get_negative_result, thread_sensitive=False)(
+                airline, flight_number, departure_date
+            )
+            if message is not None:
+                raise serializers.ValidationError(message)
             try:
-                return self._get_flight_from_api(airline, flight_number, departure_date)
+                return await self._aget_flight_from_api_once(airline, flight_number, departure_date)
             except Exception as e:
-                raise serializers.ValidationError(f"An error occurred while fetching flight details: {str(e)}")
-        except Flight.MultipleObjectsReturned:
-            raise serializers.ValidationError("Multiple flights found with the provided parameters. Please refine your search.")
+                message = f"An error occurred while fetching flight details: {str(e)}"
+                await sync_to_async(set_negative_result, thread_sensitive=False)(
+                    airline, flight_number, departure_date, e, message
+                )
+                raise serializers.ValidationError(message)
         except Exception as e:
             raise serializers.ValidationError(f"An error occurred while fetching flight details: {str(e)}")
+
+
+class FlightVersionSerializer(serializers.ModelSerializer):
+    """
+    Serialize a version of a flight, with its data rebuilt by `FlightVersionQuerySet.get_version_at`.
+    """
+    extra_data = serializers.JSONField()
+
+    class Meta:
+        model = FlightVersion
+        fields = (
+            'airline_code',
+            'flight_number',
+            'departure_date',
+            'version',
+            'recorded_at',
+            'status_code',
+            'extra_data',
+        )
+
+
+class FlightTransitionSerializer(serializers.ModelSerializer):
+    """
+    Serialize a status transition of a flight, see `FlightVersionQuerySet.get_transitions`.
+    """
+    previous_status_code = serializers.CharField()
+
+    class Meta:
+        model = FlightVersion
+        fields = (
+            'version',
+            'recorded_at',
+            'previous_status_code',
+            'status_code',
+        )
@@ -0,0 +1,74 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubFlightAPI:
+    """A local fake of the flightstats API, to load test the service without calling the real one.
+    Every flight is answered with the same `payload` after `latency` seconds,
+    or with a 500 error for the `error_rate` share of the requests.
+    Point `API_URL` at `url` to use it. The latency and error rate can be changed while it runs.
+    """
+
+    path = '/v2/api-next/flight-tracker/{airline}/{flight_number}/{year}/{month}/{day}/'
+
+    def __init__(self, payload: dict, latency: float = 0, error_rate: float = 0, host: str = '127.0.0.1', port: int = 0):
+        self.payload = json.dumps(payload).encode()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.path}"
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, as the real API
+            # The headers and body are written apart, without it they wait on the delayed ACK of the client
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency)
+
+                if random.random() < stub.error_rate:
+                    status, body = 500, b'{}'
+                else:
+                    status, body = 200, stub.payload
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'StubFlightAPI':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-flight-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> 'StubFlightAPI':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
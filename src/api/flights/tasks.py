@@ -1,35 +1,170 @@
-import requests
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 
 from celery import shared_task
-from rest_framework import serializers
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_init
+from celery_once import QueueOnce
+
+from flights.models import Flight, FlightVersion
+
+from ..db import use_primary
+from ..metrics import QUEUE_WAIT, flush_metrics
+from .client import check_upstream_available, fetch_flight_details, get_session_stats, set_session_pool_size
+from .freshness import AIRBORNE_STATUS_CODES, get_fresh_timeout
+
+
+__all__ = ['get_flight_details', 'get_session_stats', 'prewarm_flights', 'refresh_flight', 'refresh_flight_details']
+
+logger = logging.getLogger(__name__)
+
+
+@worker_init.connect
+def size_session_pool(sender=None, **kwargs) -> None:
+    # The tasks running at the same time in a process share its session, e.g. in a threaded worker
+    set_session_pool_size(sender.concurrency)
+
+
+@before_task_publish.connect
+def stamp_published_at(headers: dict = None, **kwargs) -> None:
+    # Custom headers are copied to the request of the task, see `record_queue_wait`
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs) -> None:
+    """
+    Record the time the task waited in the queue, from its publication or its ETA if it was delayed.
+    """
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at is None:
+        return
+
+    eta = task.request.eta
+    if eta is not None:
+        # The ETA is an ISO 8601 string in the message protocol 2
+        eta = datetime.fromisoformat(eta) if isinstance(eta, str) else eta
+        published_at = max(published_at, eta.timestamp())
+    QUEUE_WAIT.observe(max(time.time() - published_at, 0), task=task.name)
+
+
+@task_postrun.connect
+def flush_task_metrics(**kwargs) -> None:
+    flush_metrics()
 
 
 @shared_task(name='flights.get_flight_details')
 def get_flight_details(airline: str, flight_number: str, departure_date: str) -> dict:
     """
     Task to fetch flight details from an external API.
+    The connections to the API are pooled per worker process, see `get_session_stats`.
     """
-    url = settings.API_URL
-    if not url:
-        raise serializers.ValidationError("Flight API URL is not configured in settings.")
+    return fetch_flight_details(airline, flight_number, departure_date)
 
-    year = departure_date.split('-')[0]
-    month = departure_date.split('-')[1]
-    day = departure_date.split('-')[2]
 
-    response = requests.get(
-        url.format(
-            airline=airline,
+@shared_task(
+    name='flights.refresh_flight_details',
+    base=QueueOnce,
+    once={'graceful': True, 'timeout': settings.FLIGHT_REFRESH_LOCK_TIMEOUT},
+    ignore_result=True,
+)
+def refresh_flight_details(airline: str, flight_number: str, departure_date: str) -> None:
+    """
+    Task to refresh a stored flight from the external API, and write it through to the cache.
+    Its changes are recorded in its history, see `FlightVersion`,
+    and sent to its subscribers, see `publish_flight_update`.
+    The stored flight is kept as is if the API fails, it will be refreshed again once requested.
+    """
+    from .live import publish_flight_update
+    from .views import FlightViewSet
+
+    try:
+        results = fetch_flight_details(airline, flight_number, departure_date)
+    except Exception:
+        logger.exception("Failed to refresh flight %s %s on %s.", airline, flight_number, departure_date)
+        return
+
+    if results['status_code'] != 200 or not results['data']:
+        logger.warning(
+            "Failed to refresh flight %s %s on %s, the API answered %s.",
+            airline, flight_number, departure_date, results['status_code'],
+        )
+        return
+
+    with use_primary():
+        previous_data = Flight.objects.filter(
+            airline_code=airline,
             flight_number=flight_number,
-            year=year,
-            month=month,
-            day=day
-        ),
-        timeout=10,
-    )
-    return {
-        "status_code": response.status_code,
-        "data": response.json()
-    }
+            departure_date=departure_date,
+        ).values_list('extra_data', flat=True).first()
+
+    with transaction.atomic():
+        flight = Flight.objects.upsert(airline, flight_number, departure_date, results['data'])
+        if flight.extra_data != previous_data:
+            FlightVersion.objects.record(flight)
+    FlightViewSet().cache_instance(flight)
+    if flight.extra_data != previous_data:
+        publish_flight_update(flight)
+
+
+def refresh_flight(airline: str, flight_number: str, departure_date: str) -> None:
+    """
+    Queue a refresh of a stored flight, at most once per flight at a time.
+    Without Celery there is no background worker, the flight is refreshed right away.
+    """
+    if settings.CELERY_ENABLED:
+        refresh_flight_details.delay(airline, flight_number, departure_date)
+    else:
+        refresh_flight_details(airline, flight_number, departure_date)
+
+
+@shared_task(name='flights.prewarm_flights', ignore_result=True)
+def prewarm_flights() -> int:
+    """
+    Periodic task refreshing ahead of demand the flights departing in the next `PREWARM_HORIZON_HOURS` hours
+    and the airborne flights, so their first lookups are cache hits.
+    Only the flights going stale before the next run are refreshed. They are queued in batches of
+    `PREWARM_BATCH_SIZE` flights per airline, one batch every `PREWARM_BATCH_INTERVAL` seconds,
+    to spread the load on the external API. Nothing is queued while the circuit of the external API is open.
+    Returns the number of queued flights.
+    """
+    # Stale flights keep being served until the external API is back
+    try:
+        check_upstream_available()
+    except Exception as e:
+        logger.warning("Skipped prewarming: %s", e)
+        return 0
+
+    now = timezone.now()
+    horizon = now + timedelta(hours=settings.PREWARM_HORIZON_HOURS)
+    next_run = time.time() + settings.PREWARM_INTERVAL
+
+    # Airborne flights departed at most two local days before, the date bounds only scan the partitions of these days
+    flights = Flight.objects.filter(
+        departure_date__range=(now.date() - timedelta(days=2), horizon.date()),
+    ).filter(
+        Q(departure_date__gte=now.date(), scheduled_departure__lte=horizon)
+        | Q(status_code__in=AIRBORNE_STATUS_CODES)
+    ).only('airline_code', 'flight_number', 'departure_date', 'extra_data', 'updated_at')
+
+    lookups_by_airline = defaultdict(list)
+    for flight in flights.iterator():
+        if flight.updated_at.timestamp() + get_fresh_timeout(flight.extra_data) <= next_run:
+            lookups_by_airline[flight.airline_code].append(flight.natural_key)
+
+    queued = 0
+    for lookups in lookups_by_airline.values():
+        for index, lookup in enumerate(lookups):
+            countdown = index // settings.PREWARM_BATCH_SIZE * settings.PREWARM_BATCH_INTERVAL
+            refresh_flight_details.apply_async(lookup, countdown=countdown)
+            queued += 1
+
+    logger.info("Queued %s flights for prewarming.", queued)
+    return queued
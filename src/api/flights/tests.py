@@ -1,10 +1,54 @@
-from datetime import date
+from datetime import date, datetime, timedelta
+import base64
+import contextvars
+import gzip
+import io
 import json
+import tempfile
+import time
+import uuid
 
-from django.test import TestCase, Client, override_settings
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, Client, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from unittest.mock import patch
+from unittest import skipUnless
+from unittest.mock import AsyncMock, Mock, patch
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import ModelSerializer
+
+from api import cache as api_cache
+from api.cache import LocalCache, TwoTierCache, get_async_redis_connection
+from api.db import ReplicaRouter, release_connections, reset_primary_pin, use_primary
+from api.flights import live
+from api.flights.client import (
+    fetch_flight_details, get_session, get_upstream_circuit_breaker, record_upstream_call, set_session_pool_size,
+)
+from api.flights.fixtures import FLIGHT_DETAILS_RESPONSE
+from api.flights.freshness import get_flight_state
+from api.flights.live import get_flight_update_hub, get_update_channel, publish_flight_update
+from api.flights.negative_cache import get_negative_result
+from api.flights.serializers import FlightSerializer
+from api.flights.stub import StubFlightAPI
+from api.flights.tasks import prewarm_flights, refresh_flight_details, size_session_pool
+from api.metrics import CACHE_REQUESTS
+from api.parsers import ORJSONParser
+from api.renderers import ORJSONRenderer
+from api.singleflight import SingleFlight, SingleFlightError
+from flights.diff import apply_patch, make_patch
+from flights.models import Flight, FlightVersion, extract_hot_fields
+from flights.partitions import (
+    add_months, archive_partitions, create_partition, create_partitions, get_month, get_partition_months,
+)
+from flightstats.celery import app as celery_app
 
 # Get today's date for dynamic testing
 TODAY_DATE_STR = date.today().strftime('%Y-%m-%d')
@@ -15,6 +59,8 @@ class FlightStatusAPITest(TestCase):
     def setUp(self):
         self.client = Client()
         self.url = reverse('api:flight-service:flights-list')
+        if settings.ENABLE_REDIS_CACHE:
+            caches['redis'].delete_pattern('flight_*')
 
     @patch('api.flights.serializers.FlightSerializer._fetch_from_api')
     def test_successful_flight_lookup(self, mock_fetch_data):
@@ -22,217 +68,7 @@ class FlightStatusAPITest(TestCase):
         Tests that the API successfully returns flight status for a valid flight.
         Mocks the external API call to return predefined data.
         """
-        # Mocked data that the external service would return for AA100
-        mock_external_api_response = {
-            "flightId": 1321611460,
-            "flightNote": {
-            "final": False,
-            "canceled": False,
-            "hasDepartedGate": False,
-            "hasDepartedRunway": False,
-            "landed": False,
-            "message": "Tracking will begin after departure",
-            "messageCode": "S",
-            "pastExpectedTakeOff": False,
-            "tracking": False,
-            "hasPositions": False,
-            "trackingUnavailable": False,
-            "phase": None,
-            "hasActualRunwayDepartureTime": False,
-            "hasActualGateDepartureTime": False
-            },
-            "isTracking": False,
-            "isLanded": False,
-            "isScheduled": True,
-            "sortTime": "2025-06-15T22:10:00.000Z",
-            "schedule": {
-            "scheduledDeparture": "2025-06-15T18:10:00.000",
-            "scheduledDepartureUTC": "2025-06-15T22:10:00.000Z",
-            "estimatedActualDepartureRunway": False,
-            "estimatedActualDepartureTitle": "Estimated",
-            "estimatedActualDeparture": "2025-06-15T18:10:00.000",
-            "estimatedActualDepartureUTC": "2025-06-15T22:10:00.000Z",
-            "scheduledArrival": "2025-06-16T06:20:00.000",
-            "scheduledArrivalUTC": "2025-06-16T05:20:00.000Z",
-            "estimatedActualArrivalRunway": False,
-            "estimatedActualArrivalTitle": "Estimated",
-            "estimatedActualArrival": "2025-06-16T06:20:00.000",
-            "estimatedActualArrivalUTC": "2025-06-16T05:20:00.000Z",
-            "graphXAxis": {
-                "dep": "2025-06-15T18:10:00.000",
-                "depUTC": "2025-06-15T22:10:00.000Z",
-                "arr": "2025-06-16T06:20:00.000",
-                "arrUTC": "2025-06-16T05:20:00.000Z"
-            }
-            },
-            "status": {
-            "statusCode": "S",
-            "status": "Scheduled",
-            "color": "green",
-            "statusDescription": "On time",
-            "delay": {
-                "departure": {
-                "minutes": 0
-                },
-                "arrival": {
-                "minutes": 0
-                }
-            },
-            "delayStatus": {
-                "wording": "On time",
-                "minutes": 0
-            },
-            "lastUpdatedText": "Status Last Updated More Than 3 Hours Ago",
-            "diverted": False
-            },
-            "resultHeader": {
-            "statusDescription": "On time",
-            "carrier": {
-                "name": "American Airlines",
-                "fs": "AA"
-            },
-            "flightNumber": "100",
-            "status": "Scheduled",
-            "diverted": False,
-            "color": "green",
-            "departureAirportFS": "JFK",
-            "arrivalAirportFS": "LHR",
-            "divertedAirport": None
-            },
-            "ticketHeader": {
-            "carrier": {
-                "name": "American Airlines",
-                "fs": "AA"
-            },
-            "flightNumber": "100"
-            },
-            "operatedBy": None,
-            "departureAirport": {
-            "fs": "JFK",
-            "iata": "JFK",
-            "name": "New York John F. Kennedy International Airport",
-            "city": "New York",
-            "state": "NY",
-            "country": "US",
-            "timeZoneRegionName": "America/New_York",
-            "regionName": "North America",
-            "gate": "31",
-            "terminal": "8",
-            "times": {
-                "scheduled": {
-                "time": "6:10",
-                "ampm": "PM",
-                "time24": "18:10",
-                "timezone": "EDT"
-                },
-                "estimatedActual": {
-                "title": "Estimated",
-                "time": "6:10",
-                "ampm": "PM",
-                "time24": "18:10",
-                "runway": False,
-                "timezone": "EDT"
-                }
-            },
-            "date": "2025-06-15T18:10:00.000"
-            },
-            "arrivalAirport": {
-            "fs": "LHR",
-            "iata": "LHR",
-            "name": "London Heathrow Airport",
-            "city": "London",
-            "state": "EN",
-            "country": "GB",
-            "timeZoneRegionName": "Europe/London",
-            "regionName": "Europe",
-            "gate": None,
-            "terminal": "3",
-            "baggage": None,
-            "times": {
-                "scheduled": {
-                "time": "6:20",
-                "ampm": "AM",
-                "time24": "06:20",
-                "timezone": "BST"
-                },
-                "estimatedActual": {
-                "title": "Estimated",
-                "time": "6:20",
-                "ampm": "AM",
-                "time24": "06:20",
-                "runway": False,
-                "timezone": "BST"
-                }
-            },
-            "date": "2025-06-16T06:20:00.000"
-            },
-            "divertedAirport": None,
-            "additionalFlightInfo": {
-            "equipment": {
-                "iata": "77W",
-                "name": "Boeing 777-300ER",
-                "title": "Actual"
-            },
-            "flightDuration": "7h 10m"
-            },
-            "codeshares": [
-            {
-                "fs": "AS",
-                "name": "Alaska Airlines",
-                "flightNumber": "6904"
-            },
-            {
-                "fs": "AY",
-                "name": "Finnair",
-                "flightNumber": "4012"
-            },
-            {
-                "fs": "BA",
-                "name": "British Airways",
-                "flightNumber": "1511"
-            },
-            {
-                "fs": "GF",
-                "name": "Gulf Air",
-                "flightNumber": "6654"
-            },
-            {
-                "fs": "IB",
-                "name": "Iberia",
-                "flightNumber": "4218"
-            },
-            {
-                "fs": "UL",
-                "name": "SriLankan Airlines",
-                "flightNumber": "2026"
-            }
-            ],
-            "positional": {
-            "departureAirportCode": "JFK",
-            "arrivalAirportCode": "LHR",
-            "divertedAirportCode": None,
-            "flexFlightStatus": "S",
-            "flexTrack": {
-                "flightId": 1321611460,
-                "carrierFsCode": "AA",
-                "flightNumber": "100",
-                "tailNumber": "N721AN",
-                "departureAirportFsCode": "JFK",
-                "arrivalAirportFsCode": "LHR",
-                "departureDate": {
-                "dateUtc": "2025-06-15T22:10:00.000Z",
-                "dateLocal": "2025-06-15T18:10:00.000"
-                },
-                "equipment": "77W",
-                "bearing": 51.3509835073817,
-                "positions": [],
-                "irregularOperations": [],
-                "fleetAircraftId": 141162
-            }
-            },
-            "flightState": "currentDatePreDeparture"
-        }
-        mock_fetch_data.return_value = mock_external_api_response
+        mock_fetch_data.return_value = FLIGHT_DETAILS_RESPONSE
 
         # Make the request to your Django API endpoint
         response = self.client.get(
@@ -345,3 +181,1036 @@ class FlightStatusAPITest(TestCase):
         self.assertEqual(response.status_code, 400)
         response_data = json.loads(response.content)
         self.assertIn('Invalid date format', response_data[0])
+
+
+    @skipUnless(settings.ENABLE_REDIS_CACHE, "Caching requires Redis.")
+    @patch('api.flights.serializers.FlightSerializer._fetch_from_api')
+    def test_cached_flight_lookup_skips_database(self, mock_fetch_data):
+        """
+        Tests that a second lookup of the same flight is served from cache without any SQL query.
+        """
+        mock_fetch_data.return_value = {'status': {'statusCode': 'S', 'status': "Scheduled"}}
+        params = {
+            'airline': 'AA',
+            'flight_number': '100',
+            'departure_date': TODAY_DATE_STR
+        }
+
+        first_response = self.client.get(self.url, params, follow=True)
+        with self.assertNumQueries(0):
+            second_response = self.client.get(self.url, params, follow=True)
+
+        self.assertEqual(second_response.status_code, 200)
+        self.assertEqual(json.loads(second_response.content), json.loads(first_response.content))
+        mock_fetch_data.assert_called_once_with('AA', '100', TODAY_DATE_STR)
+
+
+    @patch('api.flights.views.refresh_flight')
+    def test_stale_flight_is_served_and_refreshed(self, mock_refresh_flight):
+        """
+        Tests that a stale stored flight is served right away and queued for refresh.
+        """
+        flight = Flight.objects.create(
+            airline_code='AA',
+            flight_number='100',
+            departure_date=TODAY_DATE_STR,
+            extra_data={'status': {'statusCode': 'A', 'status': "Departed"}}
+        )
+        Flight.objects.filter(pk=flight.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        response = self.client.get(
+            self.url,
+            {
+                'airline': 'AA',
+                'flight_number': '100',
+                'departure_date': TODAY_DATE_STR
+            },
+            follow=True
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['extra_data']['status']['status'], "Departed")
+        mock_refresh_flight.assert_called_once_with('AA', '100', TODAY_DATE_STR)
+
+
+    @skipUnless(settings.ENABLE_REDIS_CACHE, "Caching requires Redis.")
+    @patch('api.flights.serializers.FlightSerializer._fetch_from_api')
+    def test_flight_not_found_is_cached_until_stored(self, mock_fetch_data):
+        """
+        Tests that a repeated lookup of an unknown flight does not call the external service again,
+        and that the cached failure is dropped once the flight is stored.
+        """
+        mock_fetch_data.return_value = {}
+        serializer = FlightSerializer()
+
+        for _ in range(2):
+            with self.assertRaisesMessage(ValidationError, 'No flight data found'):
+                serializer.get_flight_details('ZZ', '99999', TODAY_DATE_STR)
+        mock_fetch_data.assert_called_once_with('ZZ', '99999', TODAY_DATE_STR)
+
+        mock_fetch_data.return_value = {'status': {'statusCode': 'S', 'status': "Scheduled"}}
+        serializer._get_flight_from_api('ZZ', '99999', TODAY_DATE_STR)
+
+        self.assertIsNone(get_negative_result('ZZ', '99999', TODAY_DATE_STR))
+
+
+    def test_conditional_get(self):
+        """
+        Tests that a flight is served with its validators and freshness, and that a client
+        already holding it gets a 304 without the body.
+        """
+        Flight.objects.create(
+            airline_code='AA',
+            flight_number='100',
+            departure_date=TODAY_DATE_STR,
+            extra_data={'status': {'statusCode': 'L'}, 'isLanded': True}
+        )
+        params = {
+            'airline': 'AA',
+            'flight_number': '100',
+            'departure_date': TODAY_DATE_STR
+        }
+
+        response = self.client.get(self.url, params, follow=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response.headers['Cache-Control'])
+        self.assertIn(f"max-age={settings.FLIGHT_FRESHNESS_TIMEOUTS['final'] - 1}", response.headers['Cache-Control'])
+
+        not_modified = self.client.get(self.url, params, follow=True, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified.headers['ETag'], response.headers['ETag'])
+
+        not_modified = self.client.get(
+            self.url, params, follow=True, headers={'If-Modified-Since': response.headers['Last-Modified']}
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+        projected = self.client.get(self.url, {**params, 'fields': 'status_code'}, follow=True)
+        self.assertNotEqual(projected.headers['ETag'], response.headers['ETag'])
+
+    def test_field_projection(self):
+        """
+        Tests that only the requested fields are returned, and that unknown fields are rejected.
+        """
+        Flight.objects.create(
+            airline_code='AA',
+            flight_number='100',
+            departure_date=TODAY_DATE_STR,
+            extra_data={'status': {'statusCode': 'A', 'delay': {'departure': {'minutes': 25}}}}
+        )
+        params = {
+            'airline': 'AA',
+            'flight_number': '100',
+            'departure_date': TODAY_DATE_STR,
+            'fields': 'status_code,departure_delay'
+        }
+
+        response = self.client.get(self.url, params, follow=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'status_code': 'A', 'departure_delay': 25})
+
+        response = self.client.get(self.url, {**params, 'fields': 'status_code,unknown'}, follow=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown fields: unknown', json.loads(response.content)[0])
+
+
+class FlightSerializerTest(TestCase):
+    def test_lean_representation_matches_model_serializer(self):
+        """
+        Tests that the lean read path represents a flight exactly as the stock `ModelSerializer` does,
+        and that it is rendered and parsed back unchanged by the orjson classes.
+        """
+        Flight.objects.upsert('AA', '100', TODAY_DATE_STR, FLIGHT_DETAILS_RESPONSE)
+        flight = Flight.objects.get()
+        serializer = FlightSerializer(flight)
+
+        data = serializer.data
+        self.assertEqual(data, ModelSerializer.to_representation(serializer, flight))
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(ORJSONRenderer().render(data))), data)
+        self.assertEqual(FlightSerializer(flight, fields=['pk', 'status_code']).data, {'pk': flight.pk, 'status_code': 'S'})
+
+
+class FlightFreshnessTest(TestCase):
+    def test_flight_state(self):
+        """
+        Tests that flights are classified from their status for the freshness policy.
+        """
+        self.assertEqual(get_flight_state({'status': {'statusCode': 'S'}, 'isScheduled': True}), 'scheduled')
+        self.assertEqual(get_flight_state({'status': {'statusCode': 'A'}}), 'airborne')
+        self.assertEqual(get_flight_state({'status': {'statusCode': 'L'}, 'isLanded': True}), 'final')
+        self.assertEqual(get_flight_state({'flightNote': {'final': True}}), 'final')
+        self.assertEqual(get_flight_state({}), 'unknown')
+
+
+class PrewarmFlightsTest(TestCase):
+    def _create_flight(self, airline: str, departure: datetime, status_code: str, age: timedelta) -> None:
+        flight = Flight.objects.create(
+            airline_code=airline,
+            flight_number='100',
+            departure_date=departure.date(),
+            extra_data={
+                'status': {'statusCode': status_code},
+                'schedule': {'scheduledDepartureUTC': departure.isoformat()},
+            }
+        )
+        Flight.objects.filter(pk=flight.pk).update(updated_at=timezone.now() - age)
+
+    @override_settings(PREWARM_BATCH_SIZE=1, PREWARM_BATCH_INTERVAL=10)
+    @patch('api.flights.tasks.refresh_flight_details.apply_async')
+    def test_prewarm_upcoming_and_airborne_flights(self, mock_apply_async):
+        """
+        Tests that upcoming and airborne flights going stale are queued, in batches per airline.
+        """
+        now = timezone.now()
+        self._create_flight('AA', now + timedelta(hours=1), 'S', timedelta(hours=1))
+        self._create_flight('BA', now + timedelta(hours=1), 'S', timedelta(hours=1))
+        self._create_flight('BA', now - timedelta(days=1), 'A', timedelta(hours=1))
+        # Fresh, landed and far away flights are not refreshed
+        self._create_flight('AF', now + timedelta(hours=1), 'S', timedelta(0))
+        self._create_flight('LH', now + timedelta(hours=1), 'L', timedelta(hours=1))
+        self._create_flight('KL', now + timedelta(days=30), 'S', timedelta(hours=1))
+
+        self.assertEqual(prewarm_flights(), 3)
+
+        queued = sorted((call.args[0][0], call.kwargs['countdown']) for call in mock_apply_async.call_args_list)
+        self.assertEqual(queued, [('AA', 0), ('BA', 0), ('BA', 10)])
+
+    @override_settings(PREWARM_HORIZON_HOURS=6)
+    @patch('api.flights.tasks.refresh_flight_details.apply_async')
+    def test_prewarm_skips_flights_past_the_horizon(self, mock_apply_async):
+        """
+        Tests that flights of the days of the horizon departing after it are not queued.
+        """
+        now = timezone.now()
+        self._create_flight('AA', now + timedelta(hours=5), 'S', timedelta(hours=1))
+        self._create_flight('BA', now + timedelta(hours=7), 'S', timedelta(hours=1))
+        # Still within the departure dates scanned, whatever the time of the day
+        Flight.objects.filter(airline_code='BA').update(departure_date=now.date())
+
+        self.assertEqual(prewarm_flights(), 1)
+        self.assertEqual(mock_apply_async.call_args.args[0][0], 'AA')
+
+
+class FlightPartitionsTest(TestCase):
+    def test_add_months(self):
+        """
+        Tests that months are added across years, in both directions.
+        """
+        self.assertEqual(add_months(date(2025, 11, 1), 3), date(2026, 2, 1))
+        self.assertEqual(add_months(date(2025, 1, 1), -13), date(2023, 12, 1))
+        self.assertEqual(get_month(date(2025, 6, 15)), date(2025, 6, 1))
+
+    @skipUnless(connection.vendor != 'postgresql', "The flights are not partitioned on other databases.")
+    def test_unpartitioned_table_is_left_as_is(self):
+        """
+        Tests that partitions are neither created nor archived if the table is not partitioned.
+        """
+        self.assertEqual(create_partitions(3), [])
+        self.assertEqual(archive_partitions(0, '/nonexistent'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', "The flights are partitioned on PostgreSQL.")
+    def test_partitions_are_created_and_archived(self):
+        """
+        Tests that partitions are created ahead with the flights of the default partition,
+        and that partitions past the retention are archived then dropped, with the versions of their flights.
+        """
+        current = get_month(timezone.now().date())
+        future = add_months(current, 24)
+        Flight.objects.upsert('AA', '100', future.isoformat(), FLIGHT_DETAILS_RESPONSE)
+
+        created = create_partitions(24)
+        self.assertIn(f"flights_flight_{future:%Y_%m}", created)
+        self.assertIn(future, get_partition_months(connection))
+        self.assertTrue(Flight.objects.filter(departure_date=future).exists())
+
+        past = add_months(current, -30)
+        create_partition(connection, past)
+        FlightVersion.objects.record(Flight.objects.upsert('AA', '100', past.isoformat(), FLIGHT_DETAILS_RESPONSE))
+        with tempfile.TemporaryDirectory() as archive_dir:
+            archived = archive_partitions(24, archive_dir)
+
+            self.assertEqual(
+                [path.name for path in archived],
+                [f"flights_flight_{past:%Y_%m}.csv.gz", f"flights_flightversion_{past:%Y_%m}.csv.gz"],
+            )
+            for path in archived:
+                with gzip.open(path, 'rt') as archive:
+                    self.assertEqual(len(archive.readlines()), 2)
+        self.assertNotIn(past, get_partition_months(connection))
+        self.assertFalse(Flight.objects.filter(departure_date=past).exists())
+        self.assertFalse(FlightVersion.objects.filter(departure_date=past).exists())
+
+
+@override_settings(CELERY_ENABLED=False)
+class FlightBatchAPITest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.url = reverse('api:flight-service:flights-batch')
+        if settings.ENABLE_REDIS_CACHE:
+            caches['redis'].delete_pattern('flight_*')
+
+    @patch('api.flights.serializers.get_flight_details')
+    def test_batch_lookup(self, mock_get_flight_details):
+        """
+        Tests that a batch returns the stored flights, fetches the missing ones,
+        and reports an error for the flights that could not be found.
+        """
+        Flight.objects.create(airline_code='AA', flight_number='100', departure_date=TODAY_DATE_STR, extra_data={'stored': True})
+        mock_get_flight_details.side_effect = lambda airline, flight_number, departure_date: {
+            'status_code': 200 if airline == 'BA' else 404,
+            'data': {'fetched': True} if airline == 'BA' else {},
+        }
+
+        response = self.client.post(
+            self.url,
+            {
+                'flights': [
+                    {'airline': 'AA', 'flight_number': '100', 'departure_date': TODAY_DATE_STR},
+                    ['BA', '117', TODAY_DATE_STR],
+                    ['ZZ', '99999', TODAY_DATE_STR],
+                    ['AA', '100', 'invalid-date-format'],
+                ]
+            },
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0]['result']['extra_data'], {'stored': True})
+        self.assertEqual(results[1]['result']['extra_data'], {'fetched': True})
+        self.assertIn('No flight found', results[2]['error'])
+        self.assertIn('Invalid date format', results[3]['error'])
+        self.assertTrue(Flight.objects.filter(airline_code='BA', flight_number='117').exists())
+        self.assertEqual(mock_get_flight_details.call_count, 2)
+
+    def test_batch_too_large(self):
+        """
+        Tests that a batch larger than BATCH_MAX_SIZE is rejected.
+        """
+        with self.settings(BATCH_MAX_SIZE=1):
+            response = self.client.post(
+                self.url,
+                {'flights': [['AA', '100', TODAY_DATE_STR], ['BA', '117', TODAY_DATE_STR]]},
+                content_type='application/json',
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Too many flights', json.loads(response.content)[0])
+
+
+class FlightSearchAPITest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.url = reverse('api:flight-service:flights-search')
+        for day in range(3):
+            for flight_number in ('100', '104'):
+                Flight.objects.upsert('AA', flight_number, date(2025, 6, 15 + day), {
+                    'status': {'statusCode': 'S'},
+                    'departureAirport': {'fs': 'JFK'},
+                    'arrivalAirport': {'fs': 'LHR'},
+                })
+        Flight.objects.upsert('BA', '117', date(2025, 6, 15), {'departureAirport': {'fs': 'LHR'}})
+
+    def test_search_pages_with_cursor(self):
+        """
+        Tests that the filtered flights are listed in departure date order, page by page through the `Link` header.
+        """
+        response = self.client.get(self.url, {
+            'departure_airport': 'JFK',
+            'departure_date_after': '2025-06-16',
+            'page_size': 3,
+            'fields': 'flight_number,departure_date',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [
+            {'flight_number': '100', 'departure_date': '2025-06-16'},
+            {'flight_number': '104', 'departure_date': '2025-06-16'},
+            {'flight_number': '100', 'departure_date': '2025-06-17'},
+        ])
+
+        next_url = response.headers['Link'].split(';')[0].strip('<>')
+        response = self.client.get(next_url)
+
+        self.assertEqual(json.loads(response.content), [{'flight_number': '104', 'departure_date': '2025-06-17'}])
+        self.assertNotIn('Link', response.headers)
+
+    def test_invalid_cursor(self):
+        """
+        Tests that cursors which are not the values of the ordering fields are rejected.
+        """
+        cursors = [
+            'invalid',
+            base64.urlsafe_b64encode(b'["garbage", "x"]').decode(),
+            base64.urlsafe_b64encode(b'["2024-01-01", "x"]').decode(),
+            base64.urlsafe_b64encode(b'["2024-01-01", null]').decode(),
+            base64.urlsafe_b64encode(b'[["2024-01-01"], 1]').decode(),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CELERY_ENABLED=False)
+class AsyncFlightStatusAPITest(TestCase):
+    def setUp(self):
+        self.client = AsyncClient()
+        self.url = reverse('api:flight-service:flights-async')
+        if settings.ENABLE_REDIS_CACHE:
+            caches['redis'].delete_pattern('flight_*')
+
+    def test_clients_of_closed_loops_are_dropped(self):
+        """
+        Tests that the Redis clients of the event loops closed after each call under WSGI are not kept.
+        """
+        async def get_connection():
+            return get_async_redis_connection()
+
+        first = async_to_sync(get_connection)()
+        second = async_to_sync(get_connection)()
+        self.assertIsNot(first, second)
+        self.assertNotIn(first, api_cache._async_redis_connections.values())
+
+    @patch('api.flights.serializers.FlightSerializer._afetch_from_api', new_callable=AsyncMock)
+    async def test_successful_flight_lookup(self, mock_fetch_data):
+        """
+        Tests that the async endpoint fetches, stores and returns the flight.
+        """
+        mock_fetch_data.return_value = {'status': {'statusCode': 'S', 'status': "Scheduled"}}
+
+        response = await self.client.get(
+            self.url,
+            {
+                'airline': 'AA',
+                'flight_number': '100',
+                'departure_date': TODAY_DATE_STR
+            }
+        )
+
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['airline_code'], 'AA')
+        self.assertEqual(response_data['extra_data']['status']['status'], 'Scheduled')
+        self.assertTrue(await Flight.objects.filter(pk=response_data['pk']).aexists())
+        mock_fetch_data.assert_awaited_once_with('AA', '100', TODAY_DATE_STR)
+
+    async def test_missing_parameters(self):
+        """
+        Tests that the async endpoint validates the parameters like the sync one.
+        """
+        response = await self.client.get(self.url, {'airline': 'AA', 'departure_date': TODAY_DATE_STR})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Missing required query parameters', json.loads(response.content)[0])
+
+
+class FlightUpdatesTest(TestCase):
+    @patch('api.flights.live.publish_flight_update')
+    @patch('api.flights.tasks.fetch_flight_details')
+    def test_refresh_publishes_changes(self, mock_fetch_flight_details, mock_publish_flight_update):
+        """
+        Tests that a refresh publishes the flight to its subscribers only if its data changed.
+        """
+        Flight.objects.upsert('AA', '100', TODAY_DATE_STR, FLIGHT_DETAILS_RESPONSE)
+        mock_fetch_flight_details.return_value = {'status_code': 200, 'data': FLIGHT_DETAILS_RESPONSE}
+
+        refresh_flight_details('AA', '100', TODAY_DATE_STR)
+        mock_publish_flight_update.assert_not_called()
+
+        mock_fetch_flight_details.return_value['data'] = {**FLIGHT_DETAILS_RESPONSE, 'status': {'statusCode': 'A'}}
+        refresh_flight_details('AA', '100', TODAY_DATE_STR)
+        flight, = mock_publish_flight_update.call_args.args
+        self.assertEqual(flight.status_code, 'A')
+
+    async def test_missing_parameters(self):
+        """
+        Tests that the live endpoint validates the parameters like the lookups.
+        """
+        response = await AsyncClient().get(reverse('api:flight-service:flights-live'), {'airline': 'AA'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_hubs_of_closed_loops_are_dropped(self):
+        """
+        Tests that the hubs of the event loops closed after each call under WSGI are not kept.
+        """
+        async def get_hub():
+            return get_flight_update_hub()
+
+        first = async_to_sync(get_hub)()
+        second = async_to_sync(get_hub)()
+        self.assertIsNot(first, second)
+        self.assertNotIn(first, live._hubs.values())
+
+    @skipUnless(settings.ENABLE_REDIS_CACHE, "Live updates require Redis.")
+    async def test_updates_are_streamed(self):
+        """
+        Tests that the stream sends the stored flight, then the updates published for it.
+        """
+        flight = await Flight.objects.aupsert('AA', '100', TODAY_DATE_STR, FLIGHT_DETAILS_RESPONSE)
+        response = await AsyncClient().get(
+            reverse('api:flight-service:flights-live'),
+            {'airline': 'AA', 'flight_number': '100', 'departure_date': TODAY_DATE_STR},
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+
+        event = await anext(events)
+        self.assertTrue(event.startswith(b'event: flight\ndata: '))
+        self.assertEqual(json.loads(event.split(b'data: ')[1])['pk'], flight.pk)
+
+        flight.extra_data = {'status': {'statusCode': 'A'}}
+        await sync_to_async(publish_flight_update)(flight)
+        event = await anext(events)
+        self.assertEqual(json.loads(event.split(b'data: ')[1])['extra_data'], flight.extra_data)
+
+        # Closing the streaming content leaves the stream open, the ASGI handler cancels it when the client leaves
+        await events.aclose()
+        await response._iterator.aclose()
+        channel = get_update_channel('AA', '100', TODAY_DATE_STR)
+        self.assertNotIn(channel, get_flight_update_hub().subscribers)
+
+
+class FlightHistoryTest(TestCase):
+    def record(self, status_code: str, **extra_data) -> FlightVersion:
+        flight = Flight.objects.upsert(
+            'AA', '100', TODAY_DATE_STR, {**FLIGHT_DETAILS_RESPONSE, 'status': {'statusCode': status_code}, **extra_data}
+        )
+        return FlightVersion.objects.record(flight)
+
+    def test_patch_round_trip(self):
+        """
+        Tests that applying the patch between two documents turns the first one into the second one.
+        """
+        source = {'a/b': 1, 'c~d': {'e': [1, 2], 'f': None}, 'g': 'h', 'i': {'j': 1}}
+        target = {'a/b': 2, 'c~d': {'e': [1, 2, 3]}, 'i': 'j', 'k': {'l': True}}
+
+        patch = make_patch(source, target)
+        self.assertEqual(apply_patch(source, patch), target)
+        self.assertIn({'op': 'replace', 'path': '/a~1b', 'value': 2}, patch)
+        self.assertIn({'op': 'remove', 'path': '/c~0d/f'}, patch)
+        self.assertEqual(make_patch(source, source), [])
+        self.assertEqual(source['g'], 'h')
+
+    @override_settings(FLIGHT_HISTORY_SNAPSHOT_INTERVAL=3)
+    def test_versions_are_patches_between_snapshots(self):
+        """
+        Tests that the changes of a flight are recorded as patches, with a full snapshot every few versions.
+        """
+        versions = [self.record(status_code) for status_code in ('S', 'A', 'A', 'L', 'L')]
+        self.assertIsNone(versions[2])
+        self.assertEqual(FlightVersion.objects.count(), 3)
+        self.assertEqual(
+            list(FlightVersion.objects.order_by('version').values_list('version', 'is_snapshot', 'status_code')),
+            [(1, True, 'S'), (2, False, 'A'), (3, False, 'L')],
+        )
+        self.assertEqual(versions[1].data, [{'op': 'replace', 'path': '/status/statusCode', 'value': 'A'}])
+
+        self.record('C')
+        self.record('C', resultHeader={'departureAirportFS': 'JFK'})
+        self.assertTrue(FlightVersion.objects.get(version=4).is_snapshot)
+
+    @override_settings(FLIGHT_HISTORY_SNAPSHOT_INTERVAL=3)
+    def test_version_at_time(self):
+        """
+        Tests that a flight is rebuilt as it was at any time, from the snapshot before it.
+        """
+        start = timezone.now()
+        for index, status_code in enumerate(('S', 'A', 'L', 'C', 'D')):
+            version = self.record(status_code)
+            FlightVersion.objects.filter(pk=version.pk).update(recorded_at=start + timedelta(minutes=index))
+
+        lookup = ('AA', '100', TODAY_DATE_STR)
+        self.assertIsNone(FlightVersion.objects.get_version_at(lookup, start - timedelta(minutes=1)))
+        with self.assertNumQueries(2):
+            version = FlightVersion.objects.get_version_at(lookup, start + timedelta(minutes=2, seconds=30))
+        self.assertEqual(version.version, 3)
+        self.assertEqual(version.extra_data['status'], {'statusCode': 'L'})
+        self.assertEqual(FlightVersion.objects.get_version_at(lookup).extra_data, Flight.objects.get().extra_data)
+
+    @patch('api.flights.live.publish_flight_update')
+    @patch('api.flights.tasks.fetch_flight_details')
+    def test_history_api(self, mock_fetch_flight_details, mock_publish_flight_update):
+        """
+        Tests that the refreshes are recorded, and that the history and transitions of a flight are served.
+        """
+        Flight.objects.upsert('AA', '100', TODAY_DATE_STR, FLIGHT_DETAILS_RESPONSE)
+        for status_code in ('S', 'S', 'A', 'L'):
+            mock_fetch_flight_details.return_value = {
+                'status_code': 200,
+                'data': {**FLIGHT_DETAILS_RESPONSE, 'status': {'statusCode': status_code}},
+            }
+            refresh_flight_details('AA', '100', TODAY_DATE_STR)
+        FlightVersion.objects.filter(version=3).update(recorded_at=timezone.now() + timedelta(hours=1))
+
+        params = {'airline': 'AA', 'flight_number': '100', 'departure_date': TODAY_DATE_STR}
+        response = self.client.get(reverse('api:flight-service:flights-transitions'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(transition['previous_status_code'], transition['status_code']) for transition in response.json()],
+            [('', 'S'), ('S', 'A'), ('A', 'L')],
+        )
+
+        response = self.client.get(reverse('api:flight-service:flights-history'), {**params, 'at': timezone.now()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 2)
+        self.assertEqual(response.json()['extra_data']['status'], {'statusCode': 'A'})
+
+        response = self.client.get(reverse('api:flight-service:flights-history'), {**params, 'at': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FlightUpsertTest(TestCase):
+    def test_upsert_updates_existing_flight(self):
+        """
+        Tests that upserting a stored flight updates it instead of creating a duplicate.
+        """
+        first = Flight.objects.upsert('AA', '100', TODAY_DATE_STR, {'status': {'statusCode': 'S'}})
+        second = Flight.objects.upsert('AA', '100', TODAY_DATE_STR, {'status': {'statusCode': 'A'}})
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Flight.objects.count(), 1)
+        self.assertEqual(Flight.objects.get().extra_data['status']['statusCode'], 'A')
+        self.assertEqual(Flight.objects.get().status_code, 'A')
+
+    def test_hot_fields_are_extracted(self):
+        """
+        Tests that the hot fields are extracted from the external API data, and left empty when missing or malformed.
+        """
+        hot_fields = extract_hot_fields({
+            'status': {'statusCode': 'A', 'delay': {'departure': {'minutes': 12}, 'arrival': {'minutes': 'late'}}},
+            'schedule': {'scheduledDepartureUTC': "2025-06-15T22:10:00.000Z", 'scheduledArrivalUTC': "unknown"},
+            'resultHeader': {'departureAirportFS': 'JFK', 'arrivalAirportFS': 'LHR'},
+            'departureAirport': {'fs': 'JFK', 'gate': 'B12'},
+        })
+
+        self.assertEqual(hot_fields['status_code'], 'A')
+        self.assertEqual(hot_fields['departure_airport'], 'JFK')
+        self.assertEqual(hot_fields['arrival_airport'], 'LHR')
+        self.assertEqual(hot_fields['departure_gate'], 'B12')
+        self.assertEqual(hot_fields['arrival_gate'], '')
+        self.assertEqual(hot_fields['scheduled_departure'].isoformat(), '2025-06-15T22:10:00+00:00')
+        self.assertIsNone(hot_fields['scheduled_arrival'])
+        self.assertEqual(hot_fields['departure_delay'], 12)
+        self.assertIsNone(hot_fields['arrival_delay'])
+
+
+class FlightImportExportTest(TestCase):
+    def _import(self, lines: list, *args) -> str:
+        stdout = io.StringIO()
+        with patch('sys.stdin', io.StringIO(''.join(lines))):
+            call_command('import_flights', '-', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_import_upserts_on_the_natural_key(self):
+        """
+        Tests that imported records update the stored flights, and that invalid records fail the import or are skipped.
+        """
+        Flight.objects.upsert('AA', '100', TODAY_DATE_STR, {})
+        records = [
+            json.dumps({'airline_code': 'AA', 'flight_number': str(number), 'departure_date': TODAY_DATE_STR,
+                        'extra_data': FLIGHT_DETAILS_RESPONSE}) + '\n'
+            for number in (100, 101, 102, 101)
+        ]
+
+        message = "Line 5: departure_date must be a YYYY-MM-DD date. Imported 4 flights before line 5"
+        with self.assertRaisesMessage(CommandError, message):
+            self._import([*records, '{"airline_code": "AA", "flight_number": "103"}\n'], '--batch-size', '2')
+        self.assertEqual(Flight.objects.filter(airline_code='AA').count(), 3)
+
+        output = self._import([*records, '\n', 'not json\n'], '--skip-invalid')
+        self.assertIn("Imported 3 flights from 5 records in 1 batches", output)
+        self.assertEqual(Flight.objects.get(airline_code='AA', flight_number='100').departure_airport, 'JFK')
+
+        with self.assertRaisesMessage(CommandError, "is already stored"):
+            self._import(records, '--on-conflict', 'error')
+
+    def test_export_round_trips(self):
+        """
+        Tests that the CSV and NDJSON exports are imported back as they were.
+        """
+        Flight.objects.upsert('AA', '100', TODAY_DATE_STR, FLIGHT_DETAILS_RESPONSE)
+        Flight.objects.upsert('BA', '200', TODAY_DATE_STR, {})
+
+        for format in ('csv', 'ndjson'):
+            with self.subTest(format=format):
+                stdout = io.StringIO()
+                call_command('export_flights', '--format', format, '--airline', 'AA', stdout=stdout)
+                Flight.objects.filter(airline_code='AA').delete()
+
+                self._import([stdout.getvalue()], '--format', format)
+                flight = Flight.objects.get(airline_code='AA')
+                self.assertEqual(flight.natural_key, ('AA', '100', TODAY_DATE_STR))
+                self.assertEqual(flight.extra_data, FLIGHT_DETAILS_RESPONSE)
+
+    def test_export_of_null_extra_data_round_trips(self):
+        """
+        Tests that the flights without extra data are exported and imported back with an empty one.
+        """
+        Flight.objects.upsert('AA', '100', TODAY_DATE_STR, {})
+        Flight.objects.filter(airline_code='AA').update(extra_data=None)
+
+        for format in ('csv', 'ndjson'):
+            with self.subTest(format=format):
+                stdout = io.StringIO()
+                call_command('export_flights', '--format', format, '--airline', 'AA', stdout=stdout)
+                Flight.objects.filter(airline_code='AA').delete()
+
+                self._import([stdout.getvalue()], '--format', format)
+                self.assertEqual(Flight.objects.get(airline_code='AA').extra_data, {})
+
+
+class StubFlightAPITest(TestCase):
+    @patch('api.flights.client.guard_upstream_call')
+    def test_stub_answers_flights_and_errors(self, mock_guard_upstream_call):
+        """
+        Tests that the stub answers the flight URLs with its payload, or with errors at its error rate.
+        """
+        with StubFlightAPI(FLIGHT_DETAILS_RESPONSE) as stub, override_settings(API_URL=stub.url):
+            results = fetch_flight_details('AA', '100', TODAY_DATE_STR)
+            self.assertEqual(results, {'status_code': 200, 'data': FLIGHT_DETAILS_RESPONSE})
+
+            stub.error_rate = 1
+            self.assertEqual(fetch_flight_details('AA', '100', TODAY_DATE_STR)['status_code'], 500)
+            self.assertEqual(stub.requests, 2)
+
+
+class MetricsTest(TestCase):
+    @patch('api.flights.serializers.FlightSerializer._fetch_from_api')
+    def test_stages_are_timed_and_exposed(self, mock_fetch_data):
+        """
+        Tests that responses report the duration of their stages, and that the metrics are exposed to Prometheus.
+        """
+        mock_fetch_data.return_value = FLIGHT_DETAILS_RESPONSE
+
+        response = self.client.get(
+            reverse('api:flight-service:flights-list'),
+            {'airline': 'MT', 'flight_number': uuid.uuid4().hex[:6], 'departure_date': TODAY_DATE_STR},
+        )
+        self.assertEqual(response.status_code, 200)
+        stages = [timing.split(';')[0] for timing in response.headers['Server-Timing'].split(', ')]
+        self.assertIn('db', stages)
+        self.assertIn('serialize', stages)
+        self.assertEqual(stages[-1], 'total')
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        metrics = response.content.decode()
+        self.assertIn('flightstats_cache_requests_total{result="miss"}', metrics)
+        self.assertIn(
+            'flightstats_request_duration_seconds_count{route="api:flight-service:flights-list",status="200"}', metrics
+        )
+        self.assertIn('flightstats_stage_duration_seconds_bucket{stage="db",le="+Inf"}', metrics)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_access_is_restricted(self):
+        """
+        Tests that the metrics are only exposed to the allowed networks, or with the token.
+        """
+        remote = {'REMOTE_ADDR': '203.0.113.7'}
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('metrics'), **remote).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong', **remote).status_code, 403
+        )
+        self.assertEqual(
+            self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret', **remote).status_code, 200
+        )
+
+    def test_label_values_are_escaped(self):
+        """
+        Tests that the label values are escaped in the Prometheus text format.
+        """
+        lines = CACHE_REQUESTS.render({('', ('a\\b"c\nd',), ()): 1})
+        self.assertEqual(lines[-1], 'flightstats_cache_requests_total{result="a\\\\b\\"c\\nd"} 1')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], DATABASE_REPLICA_MAX_LAG=2)
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        reset_primary_pin()
+
+    @patch('api.db.get_replica_lag')
+    def test_reads_go_to_up_to_date_replicas(self, mock_get_replica_lag):
+        """
+        Tests that flights are read from the replicas, except the lagging or failing ones, and written to the primary.
+        """
+        mock_get_replica_lag.side_effect = lambda alias: {'replica1': 0.5, 'replica2': 10}[alias]
+        self.assertEqual({self.router.db_for_read(Flight) for _ in range(10)}, {'replica1'})
+        self.assertIsNone(self.router.db_for_read(Session))
+
+        # The lag is checked once per interval
+        self.assertEqual(mock_get_replica_lag.call_count, 2)
+
+        self.router = ReplicaRouter()
+        mock_get_replica_lag.side_effect = ConnectionError
+        with self.assertLogs('api.db', 'ERROR'):
+            self.assertEqual(self.router.db_for_read(Flight), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'flights'))
+
+    @patch('api.db.get_replica_lag', return_value=0)
+    def test_reads_follow_writes_on_the_primary(self, mock_get_replica_lag):
+        """
+        Tests that reads go to the primary after a write, and in a `use_primary` block.
+        """
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Flight), 'default')
+        self.assertIn(self.router.db_for_read(Flight), ('replica1', 'replica2'))
+
+        def write_then_read():
+            self.assertEqual(self.router.db_for_write(Flight), 'default')
+            return self.router.db_for_read(Flight)
+
+        # The pin is kept in the context of the request that wrote
+        self.assertEqual(contextvars.copy_context().run(write_then_read), 'default')
+        self.assertIn(self.router.db_for_read(Flight), ('replica1', 'replica2'))
+
+    @patch('api.db.get_replica_lag', return_value=0)
+    def test_versions_are_recorded_on_the_primary(self, mock_get_replica_lag):
+        """
+        Tests that the previous version is read from the primary, where the next one is written,
+        even if nothing pinned the reads to it before.
+        """
+        with use_primary():
+            flight = Flight.objects.upsert('AA', '100', TODAY_DATE_STR, FLIGHT_DETAILS_RESPONSE)
+
+        def record():
+            reset_primary_pin()
+            return FlightVersion.objects.record(flight)
+
+        self.assertEqual(contextvars.copy_context().run(record).version, 1)
+        flight.extra_data = {**FLIGHT_DETAILS_RESPONSE, 'status': {'statusCode': 'A'}}
+        self.assertEqual(contextvars.copy_context().run(record).version, 2)
+
+
+class ReleaseConnectionsTest(TestCase):
+    @patch('api.db.connections')
+    def test_only_idle_pooled_connections_are_released(self, mock_connections):
+        """
+        Tests that pooled connections outside a transaction are given back, and that the others are kept.
+        """
+        pooled = Mock(pool=Mock(), in_atomic_block=False)
+        in_transaction = Mock(pool=Mock(), in_atomic_block=True)
+        unpooled = Mock(pool=None, in_atomic_block=False)
+        mock_connections.all.return_value = [pooled, in_transaction, unpooled]
+
+        release_connections()
+
+        mock_connections.all.assert_called_once_with(initialized_only=True)
+        pooled.close.assert_called_once_with()
+        in_transaction.close.assert_not_called()
+        unpooled.close.assert_not_called()
+
+    @patch('api.flights.serializers.release_connections')
+    @patch('api.flights.serializers.get_flight_details')
+    def test_connections_are_released_before_fetching(self, mock_get_flight_details, mock_release_connections):
+        """
+        Tests that the connections are released before waiting on the external API.
+        """
+        def fetch(*args) -> dict:
+            mock_release_connections.assert_called_once_with()
+            return {'status_code': 200, 'data': FLIGHT_DETAILS_RESPONSE}
+
+        mock_get_flight_details.side_effect = fetch
+
+        with override_settings(CELERY_ENABLED=False):
+            data = FlightSerializer()._fetch_from_api('AA', '100', TODAY_DATE_STR)
+        self.assertEqual(data, FLIGHT_DETAILS_RESPONSE)
+
+
+class PooledSessionTest(TestCase):
+    def test_session_is_shared_and_retries_connection_errors(self):
+        """
+        Tests that fetches share a single session per process, which retries connection errors with backoff.
+        """
+        session = get_session()
+        retry = session.get_adapter('https://www.flightstats.com/').max_retries
+
+        self.assertIs(get_session(), session)
+        self.assertEqual(retry.connect, settings.UPSTREAM_MAX_RETRIES)
+        self.assertEqual(retry.backoff_factor, settings.UPSTREAM_BACKOFF_FACTOR)
+        self.assertEqual(retry.backoff_jitter, settings.UPSTREAM_BACKOFF_JITTER)
+
+    def test_session_pool_fits_worker_concurrency(self):
+        """
+        Tests that the session keeps a connection alive per task a worker runs at a time, e.g. per thread.
+        """
+        self.addCleanup(set_session_pool_size, 0)
+
+        size_session_pool(sender=Mock(concurrency=settings.UPSTREAM_POOL_SIZE * 5))
+        adapter = get_session().get_adapter('https://www.flightstats.com/')
+        self.assertEqual(adapter._pool_maxsize, settings.UPSTREAM_POOL_SIZE * 5)
+
+        size_session_pool(sender=Mock(concurrency=1))
+        adapter = get_session().get_adapter('https://www.flightstats.com/')
+        self.assertEqual(adapter._pool_maxsize, settings.UPSTREAM_POOL_SIZE)
+
+    def test_celery_app_reads_settings(self):
+        """
+        Tests that the Celery app is configured from the `CELERY_` settings, which it does not read on import.
+        """
+        self.assertEqual(celery_app.conf.broker_url, settings.CELERY_BROKER_URL)
+        self.assertEqual(celery_app.conf.ONCE, settings.CELERY_ONCE)
+
+
+@skipUnless(settings.ENABLE_REDIS_CACHE, "Single-flight requires Redis.")
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        self.single_flight = SingleFlight(key_prefix='test_flight', wait_timeout=1)
+        self.key = uuid.uuid4().hex
+
+    def _hold_lock(self, token: str, outcome: dict) -> None:
+        client = self.single_flight.client
+        client.set(self.single_flight._get_lock_key(self.key), token, ex=5)
+        client.set(self.single_flight._get_result_key(self.key, token), json.dumps(outcome), ex=5)
+
+    def test_leader_runs_function(self):
+        """
+        Tests that the first caller runs the function and releases the lock.
+        """
+        func = Mock(return_value=42)
+
+        self.assertEqual(self.single_flight.do(self.key, func), 42)
+        func.assert_called_once_with()
+        self.assertIsNone(self.single_flight.client.get(self.single_flight._get_lock_key(self.key)))
+
+    def test_follower_waits_for_leader_result(self):
+        """
+        Tests that a caller arriving while a leader holds the lock gets the leader's result
+        without running the function itself.
+        """
+        self._hold_lock('leader', {'value': 42})
+        func = Mock(return_value=0)
+
+        self.assertEqual(self.single_flight.do(self.key, func), 42)
+        func.assert_not_called()
+
+    def test_follower_gets_leader_error(self):
+        """
+        Tests that the leader's error is raised to the followers.
+        """
+        self._hold_lock('leader', {'error': "Service Unavailable"})
+        func = Mock(return_value=0)
+
+        with self.assertRaisesMessage(SingleFlightError, "Service Unavailable"):
+            self.single_flight.do(self.key, func)
+        func.assert_not_called()
+
+
+@skipUnless(settings.ENABLE_REDIS_CACHE, "The circuit breaker requires Redis.")
+@override_settings(CELERY_ENABLED=False, CIRCUIT_BREAKER_FAILURE_THRESHOLD=2)
+class UpstreamCircuitBreakerTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        caches['redis'].delete_pattern('flight_*')
+        self.addCleanup(get_upstream_circuit_breaker().reset)
+
+    @patch('api.flights.serializers.get_flight_details')
+    def test_open_circuit_fails_fast(self, mock_get_flight_details):
+        """
+        Tests that lookups fail without calling the external API once it failed too many times,
+        and that the open circuit is reported.
+        """
+        record_upstream_call(500)
+        record_upstream_call(None)
+
+        response = self.client.get(
+            reverse('api:flight-service:flights-list'),
+            {
+                'airline': 'AA',
+                'flight_number': '100',
+                'departure_date': TODAY_DATE_STR
+            },
+            follow=True
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('The flight API is unavailable', json.loads(response.content)[0])
+        mock_get_flight_details.assert_not_called()
+
+        response = self.client.get(reverse('api:flight-service:flights-upstream-status'))
+        self.assertEqual(json.loads(response.content)['circuit_breaker']['state'], 'open')
+
+    def test_intermittent_failures_open_circuit(self):
+        """
+        Tests that successful calls between the failures do not reset them.
+        """
+        record_upstream_call(500)
+        record_upstream_call(404)
+        record_upstream_call(500)
+
+        self.assertEqual(get_upstream_circuit_breaker().get_state()['state'], 'open')
+
+    def test_successful_probe_closes_circuit(self):
+        """
+        Tests that a successful probe of the half-open circuit closes it and resets the failures.
+        """
+        circuit_breaker = get_upstream_circuit_breaker()
+        record_upstream_call(500)
+        record_upstream_call(500)
+        circuit_breaker.client.set(circuit_breaker._get_key('opened_until'), time.time() - 1)
+
+        circuit_breaker.allow()
+        record_upstream_call(404)
+
+        self.assertEqual(circuit_breaker.get_state(), {'state': 'closed', 'failures': 0, 'opened_until': None})
+
+
+class LocalCacheTest(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        """
+        Tests that the least recently used entry is evicted once the cache is full.
+        """
+        local_cache = LocalCache(max_entries=2, timeout=60)
+        local_cache.set('a', 1)
+        local_cache.set('b', 2)
+        local_cache.get('a')
+        local_cache.set('c', 3)
+
+        self.assertEqual(local_cache.get('a'), 1)
+        self.assertIsNone(local_cache.get('b'))
+        self.assertEqual(local_cache.get('c'), 3)
+
+    @patch('api.cache.time.monotonic')
+    def test_expired_entry_is_dropped(self, mock_monotonic):
+        """
+        Tests that entries expire after the shortest of their own and the local timeout.
+        """
+        mock_monotonic.return_value = 0
+        local_cache = LocalCache(max_entries=2, timeout=60)
+        local_cache.set('a', 1, timeout=900)
+
+        mock_monotonic.return_value = 61
+        self.assertIsNone(local_cache.get('a'))
+
+    def test_invalidation_from_other_process_drops_entry(self):
+        """
+        Tests that an invalidation published by another process drops the local copy,
+        while our own invalidations keep it.
+        """
+        cache = TwoTierCache(Mock(), LocalCache(max_entries=2, timeout=60), 'test_invalidation')
+        cache.local_cache.set('flight_AA_100', {'pk': 1})
+
+        cache._handle_invalidation({'data': json.dumps({'key': 'flight_AA_100', 'origin': cache.origin})})
+        self.assertEqual(cache.get('flight_AA_100'), {'pk': 1})
+
+        cache._handle_invalidation({'data': json.dumps({'key': 'flight_AA_100', 'origin': 'other'})})
+        self.assertIsNone(cache.local_cache.get('flight_AA_100'))
+
+    def test_cached_none_is_a_hit(self):
+        """
+        Tests that a cached None is served from the local cache, without reading Redis again.
+        """
+        redis_cache = Mock()
+        redis_cache.get.return_value = None
+        cache = TwoTierCache(redis_cache, LocalCache(max_entries=2, timeout=60), 'test_invalidation')
+
+        self.assertIsNone(cache.get('flight_AA_100', 'missing'))
+        self.assertIsNone(cache.get('flight_AA_100', 'missing'))
+        self.assertEqual(redis_cache.get.call_count, 1)
+        self.assertEqual(len(cache.local_cache), 1)
@@ -1,3 +1,5 @@
+from django.urls import path
+
 from rest_framework import routers
 
 from . import views
@@ -8,4 +10,7 @@ app_name = 'api.flights'
 router = routers.DefaultRouter()
 router.register(r'flights', views.FlightViewSet, 'flights')
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('async/flights/', views.AsyncFlightView.as_view(), name='flights-async'),
+    path('live/flights/', views.FlightUpdatesView.as_view(), name='flights-live'),
+] + router.urls
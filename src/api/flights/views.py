@@ -1,12 +1,62 @@
+import time
 from datetime import datetime
 
-from rest_framework import viewsets
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.views import View
+
+from django_filters.rest_framework import DjangoFilterBackend
+
+from rest_framework import serializers, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from flights.models import Flight, FlightVersion
+
+from ..cache import CacheModelViewSetMixin, get_async_cache, make_cache_key
+from .client import get_upstream_status
+from .filters import FlightFilterSet, FlightKeysetPagination
+from .freshness import get_fresh_until
+from .live import stream_flight_updates
+from .serializers import FlightSerializer, FlightTransitionSerializer, FlightVersionSerializer
+from .tasks import refresh_flight
+
+
+def get_flight_lookup(query_params: dict) -> tuple[str, str, str]:
+    """
+    Validate the flight lookup query parameters.
+    Returns the airline, flight number and departure date, normalized to 'YYYY-MM-DD'.
+    """
+    airline = query_params.get('airline')
+    flight_number = query_params.get('flight_number')
+    departure_date = query_params.get('departure_date')
+
+    if not all([airline, flight_number, departure_date]):
+        raise ValidationError("Missing required query parameters: airline, flight_number, and departure_date are all required.")
+
+    try:
+        departure_date = datetime.strptime(departure_date, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise ValidationError("Invalid date format for departure_date. Use 'YYYY-MM-DD'.")
 
-from flights.models import Flight
+    return airline, flight_number, departure_date
 
-from ..cache import CacheModelViewSetMixin
-from .serializers import FlightSerializer
+
+def render_json(data, status: int = 200) -> HttpResponse:
+    """
+    Render `data` outside of DRF with the first JSON renderer of `REST_FRAMEWORK`, e.g. `ORJSONRenderer`.
+    """
+    renderer_class = next(
+        (renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES if issubclass(renderer, JSONRenderer)),
+        JSONRenderer,
+    )
+    renderer = renderer_class()
+    return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type)
 
 
 class FlightViewSet(CacheModelViewSetMixin, viewsets.ModelViewSet):
@@ -19,6 +69,7 @@ class FlightViewSet(CacheModelViewSetMixin, viewsets.ModelViewSet):
     - `airline`: The airline code (e.g., 'AA' for American Airlines).
     - `flight_number`: The flight number (e.g., '123').
     - `departure_date`: The date of departure in the format 'YYYY-MM-DD' (e.g., '2023-10-01').
+    - `fields`: Optional comma-separated fields to return (e.g., 'status_code,departure_gate,departure_delay').
     The serializer used is `FlightSerializer`, which defines the fields to be serialized.
     The queryset is set to retrieve all Flight objects from the database if any.
     """
@@ -26,31 +77,217 @@ class FlightViewSet(CacheModelViewSetMixin, viewsets.ModelViewSet):
     serializer_class = FlightSerializer
     queryset = Flight.objects.all()
     cache_key_prefix = 'flight'
+    cache_key_fields = ('airline_code', 'flight_number', 'departure_date')
+    version_field = 'updated_at'
+    stale_timeout = settings.FLIGHT_STALE_TIMEOUT
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = FlightFilterSet
+    pagination_class = FlightKeysetPagination
+
+    def get_fresh_until(self, data: dict) -> float:
+        # Flights are fresh for a time depending on their status, see `FLIGHT_FRESHNESS_TIMEOUTS`
+        return get_fresh_until(data)
+
+    def revalidate(self, data: dict) -> None:
+        refresh_flight(data['airline_code'], data['flight_number'], data['departure_date'])
 
     def list(self, request, *args, **kwargs):
         """
         Handle query parameters to fetch flight information.
         """
-        airline = request.query_params.get('airline')
-        flight_number = request.query_params.get('flight_number')
-        departure_date = request.query_params.get('departure_date')
+        airline, flight_number, departure_date = get_flight_lookup(request.query_params)
+        fields = self.serializer_class.parse_fields(request.query_params.get('fields'))
+
+        def get_flight() -> Flight:
+            # Get flight details from API or database
+            flight = self.serializer_class().get_flight_details(
+                airline=airline,
+                flight_number=flight_number,
+                departure_date=departure_date
+            )
+            if not flight:
+                raise ValidationError("Flight not found with the provided parameters.")
+            return flight
+
+        # Serve the cached flight without touching the database, the cache is keyed on the natural key
+        cache_key = self._get_lookup_cache_key({
+            'airline_code': airline,
+            'flight_number': flight_number,
+            'departure_date': departure_date,
+        })
+        # The full representation is cached, the projection is applied to the served copy
+        response = self.get_cached_response(cache_key, get_flight, variant=','.join(fields or ()))
+        if isinstance(response, Response):
+            response.data = self.serializer_class.project(response.data, fields)
+        return response
+
+    @action(detail=False)
+    def search(self, request, *args, **kwargs):
+        """
+        List the flights matching the `FlightFilterSet` filters, e.g. all the departures of an airport over a week.
+        The flights are read straight from the database in departure date order, with keyset pagination:
+        the next page is linked in the `Link` header and costs the same however deep it is.
+        The `fields` query parameter limits the fields of the results, as for the lookup.
+        """
+        fields = self.serializer_class.parse_fields(request.query_params.get('fields'))
+        queryset = self.filter_queryset(self.get_queryset()).defer(*self.serializer_class.get_deferred_fields(fields))
+
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True, fields=fields).data)
+
+    @action(detail=False)
+    def history(self, request, *args, **kwargs):
+        """
+        Return a flight as it was recorded at the `at` query parameter, an ISO 8601 datetime, or its latest version.
+        The flight is looked up with the parameters of the lookup, it is not fetched from the external API.
+        """
+        lookup = get_flight_lookup(request.query_params)
+        at = request.query_params.get('at')
+        if at is not None:
+            at = serializers.DateTimeField().to_internal_value(at)
+
+        version = FlightVersion.objects.get_version_at(lookup, at)
+        if version is None:
+            raise ValidationError("No history found for the flight at this time.")
+        return Response(FlightVersionSerializer(version).data)
+
+    @action(detail=False)
+    def transitions(self, request, *args, **kwargs):
+        """
+        List the status transitions of a flight, oldest first, with the version and time they were recorded at.
+        The flight is looked up with the parameters of the lookup.
+        """
+        lookup = get_flight_lookup(request.query_params)
+        return Response(FlightTransitionSerializer(FlightVersion.objects.get_transitions(lookup), many=True).data)
+
+    @action(detail=False, url_path='upstream-status')
+    def upstream_status(self, request, *args, **kwargs):
+        """
+        Return the state of the circuit breaker and rate limiter of the external API, for monitoring.
+        """
+        return Response(get_upstream_status())
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request, *args, **kwargs):
+        """
+        Look up a batch of flights at once.
+        The body is `{"flights": [...]}`, each flight being either an object with the `airline`,
+        `flight_number` and `departure_date` keys or an `[airline, flight_number, departure_date]` list.
+        The cache is read with a single multi-get, the stored flights with a single query,
+        and the missing flights are fetched from the external API in parallel.
+        The response lists the `result` or the `error` of each flight, in the request order.
+        The `fields` query parameter limits the fields of the results, as for the lookup.
+        """
+        fields = self.serializer_class.parse_fields(request.query_params.get('fields'))
+        items = request.data.get('flights') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            raise ValidationError("Missing flights: a non-empty list of flights is required.")
+        if len(items) > settings.BATCH_MAX_SIZE:
+            raise ValidationError(f"Too many flights: at most {settings.BATCH_MAX_SIZE} flights can be looked up at once.")
+
+        lookups = []
+        for item in items:
+            if isinstance(item, list):
+                item = dict(zip(('airline', 'flight_number', 'departure_date'), item))
+            try:
+                if not isinstance(item, dict):
+                    raise ValidationError("Invalid flight: use an object or a list.")
+                lookups.append(get_flight_lookup(item))
+            except ValidationError as e:
+                # Keep the error message in place of the lookup
+                lookups.append(e.detail[0])
+
+        cache_keys = {
+            lookup: self._get_lookup_cache_key(dict(zip(self.cache_key_fields, lookup)))
+            for lookup in lookups if not isinstance(lookup, str)
+        }
+        representations = self.get_cached_representations(list(cache_keys.values()))
+
+        missing = [lookup for lookup, cache_key in cache_keys.items() if cache_key not in representations]
+        flights = self.serializer_class().get_many_flight_details(missing) if missing else {}
+
+        fetched = {
+            cache_keys[lookup]: self.get_serializer(flight).data
+            for lookup, flight in flights.items() if isinstance(flight, Flight)
+        }
+        self._cache_representations(fetched)
+        representations.update(fetched)
+
+        results = []
+        for lookup in lookups:
+            if isinstance(lookup, str):
+                results.append({'error': lookup})
+                continue
+
+            result = dict(zip(('airline', 'flight_number', 'departure_date'), lookup))
+            if cache_keys[lookup] in representations:
+                result['result'] = self.serializer_class.project(representations[cache_keys[lookup]], fields)
+            else:
+                result['error'] = flights[lookup]
+            results.append(result)
+
+        return Response(results)
 
-        if not all([airline, flight_number, departure_date]):
-            raise ValidationError("Missing required query parameters: airline, flight_number, and departure_date are all required.")
 
+class AsyncFlightView(View):
+    """
+    Async version of `FlightViewSet.list`, to be served by the ASGI application.
+    The cache, database and external API are all awaited without blocking,
+    so a single process can keep many lookups waiting on the external API.
+    The API endpoint is `/api/flight-service/async/flights/` and takes the same parameters.
+    """
+    http_method_names = ['get']
+
+    async def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        try:
+            airline, flight_number, departure_date = get_flight_lookup(request.GET)
+            fields = FlightSerializer.parse_fields(request.GET.get('fields'))
+
+            viewset = FlightViewSet()
+            cache = get_async_cache()
+            cache_key = make_cache_key(FlightViewSet.cache_key_prefix, airline, flight_number, departure_date)
+            entry = await cache.get(cache_key) if cache is not None else None
+
+            if entry is None:
+                flight = await FlightSerializer().aget_flight_details(
+                    airline=airline,
+                    flight_number=flight_number,
+                    departure_date=departure_date
+                )
+                entry, timeout = viewset._make_cache_entry(FlightSerializer(flight).data)
+                if cache is not None:
+                    await cache.set(cache_key, entry, timeout=timeout)
+        except ValidationError as e:
+            return render_json(e.detail, status=400)
+
+        # Serve stale flights right away, they are refreshed in the background
+        if entry['fresh_until'] <= time.time():
+            await sync_to_async(viewset.revalidate)(entry['data'])
+
+        viewset.request = request
+        response = render_json(FlightSerializer.project(entry['data'], fields))
+        return viewset.get_conditional_response(response, cache_key, entry, variant=','.join(fields or ()))
+
+
+class FlightUpdatesView(View):
+    """
+    Push the status of a flight to the client as Server-Sent Events, to be served by the ASGI application.
+    The stored flight is sent first, then each change of it brought by a refresh, see `publish_flight_update`.
+    The API endpoint is `/api/flight-service/live/flights/` and takes the `airline`, `flight_number`
+    and `departure_date` parameters of the lookups.
+    """
+    http_method_names = ['get']
+
+    async def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
         try:
-            datetime.strptime(departure_date, "%Y-%m-%d")
-        except ValueError:
-            raise ValidationError("Invalid date format for departure_date. Use 'YYYY-MM-DD'.")
-
-        # Get flight details from API or database
-        flight = self.serializer_class().get_flight_details(
-            airline=airline,
-            flight_number=flight_number,
-            departure_date=departure_date
-        )
-        if not flight:
-            raise ValidationError("Flight not found with the provided parameters.")
-        # Use the retrieve method to return the flight details
-        # Cache will be handled by the mixin
-        return self.retrieve(pk=flight.pk, instance=flight, request=request, *args, **kwargs)
+            lookup = get_flight_lookup(request.GET)
+        except ValidationError as e:
+            return render_json(e.detail, status=400)
+        if not settings.ENABLE_REDIS_CACHE:
+            return render_json(["Live updates are not available."], status=503)
+
+        response = StreamingHttpResponse(stream_flight_updates(*lookup), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Do not let nginx buffer the events
+        response['X-Accel-Buffering'] = 'no'
+        return response
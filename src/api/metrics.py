@@ -0,0 +1,297 @@
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+from django_redis import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+# Durations of the stages of the current request, reported in its Server-Timing header
+_stage_timings = ContextVar('stage_timings', default=None)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+    """A Prometheus metric recorded in process.
+    The values recorded since the last flush are kept apart, so they can be added
+    to the totals shared by all the processes in Redis, see `flush_metrics`.
+    """
+
+    type = None
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _get_label_values(self, labels: dict) -> tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _add(self, samples: dict) -> None:
+        with self._lock:
+            for sample, value in samples.items():
+                self._values[sample] = self._values.get(sample, 0) + value
+                self._pending[sample] = self._pending.get(sample, 0) + value
+
+    def pop_pending(self) -> dict:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def get_values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def _format_sample(self, sample: tuple) -> str:
+        suffix, label_values, extra_labels = sample
+        labels = [*zip(self.labels, label_values), *extra_labels]
+        formatted = ','.join(f'{label}="{_escape_label_value(value)}"' for label, value in labels)
+        return f"{self.name}{suffix}{{{formatted}}}" if formatted else f"{self.name}{suffix}"
+
+    def render(self, values: dict) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for sample, value in sorted(values.items()):
+            lines.append(f"{self._format_sample(sample)} {value:g}")
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self._add({('', self._get_label_values(labels), ()): amount})
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = (*buckets, float('inf'))
+
+    def observe(self, value: float, **labels) -> None:
+        label_values = self._get_label_values(labels)
+        # Buckets are cumulative, an observation counts in every bucket it fits in
+        samples = {
+            ('_bucket', label_values, (('le', f'{bucket:g}' if bucket != float('inf') else '+Inf'),)): 1
+            for bucket in self.buckets if value <= bucket
+        }
+        samples[('_sum', label_values, ())] = value
+        samples[('_count', label_values, ())] = 1
+        self._add(samples)
+
+    def render(self, values: dict) -> list[str]:
+        # Sort the buckets by bound, not alphabetically
+        def sort_key(item):
+            (suffix, label_values, extra_labels), _ = item
+            bound = float(extra_labels[0][1].replace('+Inf', 'inf')) if extra_labels else 0
+            return label_values, suffix, bound
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for sample, value in sorted(values.items(), key=sort_key):
+            lines.append(f"{self._format_sample(sample)} {value:g}")
+        return lines
+
+
+REGISTRY = []
+
+REQUEST_DURATION = Histogram(
+    'flightstats_request_duration_seconds', "Duration of the API requests.", labels=('route', 'status'),
+)
+STAGE_DURATION = Histogram(
+    'flightstats_stage_duration_seconds',
+    "Duration of the stages of the lookups: cache, db, celery, upstream and serialize.",
+    labels=('stage',),
+)
+CACHE_REQUESTS = Counter(
+    'flightstats_cache_requests_total', "Lookups of the API cache, by result: hit or miss.", labels=('result',),
+)
+UPSTREAM_RESPONSES = Counter(
+    'flightstats_upstream_responses_total',
+    "Responses of the flight API by status code, 'error' if it did not answer.",
+    labels=('status',),
+)
+QUEUE_WAIT = Histogram(
+    'flightstats_celery_queue_wait_seconds', "Time the Celery tasks waited in the queue.", labels=('task',),
+)
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Measure a stage of the current request, e.g. `with timed('db'):`.
+    The duration is recorded in `STAGE_DURATION` and reported in the Server-Timing header of the request.
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started_at
+        STAGE_DURATION.observe(duration, stage=stage)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0) + duration
+
+
+def _encode_sample(sample: tuple) -> str:
+    return json.dumps(sample)
+
+
+def _decode_sample(field: bytes) -> tuple:
+    suffix, label_values, extra_labels = json.loads(field)
+    return suffix, tuple(label_values), tuple(tuple(label) for label in extra_labels)
+
+
+_last_flush = 0
+_last_flush_pid = None
+_flush_lock = threading.Lock()
+
+
+def flush_metrics(force: bool = False) -> None:
+    """
+    Add the values recorded by this process to the totals shared in Redis,
+    at most every `METRICS_FLUSH_INTERVAL` seconds, with a single round-trip.
+    """
+    global _last_flush, _last_flush_pid
+
+    if not settings.ENABLE_REDIS_CACHE:
+        return
+
+    with _flush_lock:
+        now = time.monotonic()
+        # A forked process starts with the values of its parent, they were flushed by it
+        if _last_flush_pid != os.getpid():
+            if _last_flush_pid is not None:
+                for metric in REGISTRY:
+                    metric.pop_pending()
+            _last_flush, _last_flush_pid = now, os.getpid()
+        if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        _last_flush = now
+
+    try:
+        pipeline = get_redis_connection('redis').pipeline(transaction=False)
+        for metric in REGISTRY:
+            for sample, value in metric.pop_pending().items():
+                pipeline.hincrbyfloat(f"metrics_{metric.name}", _encode_sample(sample), value)
+        pipeline.execute()
+    except Exception:
+        # Metrics must never fail a request, the values of this flush are lost
+        logger.exception("Failed to flush the metrics.")
+
+
+def render_metrics() -> str:
+    """
+    Render the metrics in the Prometheus text format.
+    The totals of all the processes are read from Redis, or those of this process if Redis is disabled.
+    """
+    if settings.ENABLE_REDIS_CACHE:
+        flush_metrics(force=True)
+        pipeline = get_redis_connection('redis').pipeline(transaction=False)
+        for metric in REGISTRY:
+            pipeline.hgetall(f"metrics_{metric.name}")
+        all_values = [
+            {_decode_sample(field): float(value) for field, value in values.items()}
+            for values in pipeline.execute()
+        ]
+    else:
+        all_values = [metric.get_values() for metric in REGISTRY]
+
+    lines = []
+    for metric, values in zip(REGISTRY, all_values):
+        lines.extend(metric.render(values))
+    return '\n'.join(lines) + '\n'
+
+
+def _is_metrics_access_allowed(request: HttpRequest) -> bool:
+    """
+    Allow the clients of `METRICS_ALLOWED_NETWORKS`, or those sending the `METRICS_TOKEN` as a bearer token.
+    """
+    if settings.METRICS_TOKEN:
+        authorization = request.headers.get('Authorization', '')
+        if hmac.compare_digest(authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+            return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Expose the metrics to Prometheus.
+    """
+    if not _is_metrics_access_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ServerTimingMiddleware:
+    """Time the requests, and report the duration of their stages in a Server-Timing header, see `timed`.
+    It runs in both modes, so the async views are not pushed to a thread by it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timings = {}
+        token = _stage_timings.set(timings)
+        started_at = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _stage_timings.reset(token)
+        return self.process_response(request, response, timings, time.perf_counter() - started_at)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        timings = {}
+        token = _stage_timings.set(timings)
+        started_at = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _stage_timings.reset(token)
+        # The flush blocks on Redis, but only once every `METRICS_FLUSH_INTERVAL` seconds
+        return self.process_response(request, response, timings, time.perf_counter() - started_at)
+
+    def process_response(self, request: HttpRequest, response: HttpResponse, timings: dict, duration: float):
+        timings['total'] = duration
+        response.headers['Server-Timing'] = ', '.join(
+            f"{stage};dur={stage_duration * 1000:.1f}" for stage, stage_duration in timings.items()
+        )
+
+        resolver_match = request.resolver_match
+        route = resolver_match.view_name if resolver_match is not None else 'unknown'
+        REQUEST_DURATION.observe(duration, route=route, status=response.status_code)
+        flush_metrics()
+        return response
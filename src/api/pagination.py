@@ -0,0 +1,105 @@
+import base64
+import binascii
+import json
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Model, Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginate a queryset on the values of its `ordering` fields instead of an OFFSET.
+    The cursor of the next page holds the ordering values of the last row of the page,
+    so every page is read with an index range scan and deep pages cost the same as the first one.
+    The last field of `ordering` must be unique, e.g. the primary key, all fields are ascending.
+    The results are returned as a list, the next page is linked in the `Link` header.
+    """
+
+    ordering = ('pk',)
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = "Invalid cursor."
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, values: list) -> str:
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request: Request, model: type[Model]) -> list | None:
+        """
+        Return the ordering values of the cursor, parsed by the fields of `model`, or None on the first page.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        fields = [model._meta.pk if name == 'pk' else model._meta.get_field(name) for name in self.ordering]
+        try:
+            values = [field.to_python(value) for field, value in zip(fields, values)]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_keyset_filter(self, values: list) -> Q:
+        """
+        Match the rows after `values` in the `ordering`, i.e. `(a, b) > (x, y)` as `a > x OR (a = x AND b > y)`.
+        """
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            equal = {ordering_field: values[i] for i, ordering_field in enumerate(self.ordering[:index])}
+            conditions.append(Q(**equal, **{f'{field}__gt': values[index]}))
+        return reduce(lambda a, b: a | b, conditions)
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view=None) -> list:
+        self.request = request
+        page_size = self.get_page_size(request)
+        values = self.decode_cursor(request, queryset.model)
+
+        queryset = queryset.order_by(*self.ordering)
+        if values is not None:
+            # The redundant bound on the leading field lets the database start the scan at the cursor
+            queryset = queryset.filter(**{f'{self.ordering[0]}__gte': values[0]}).filter(self.get_keyset_filter(values))
+
+        # One extra row tells whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        page = rows[:page_size]
+
+        self.next_values = None
+        if self.has_next:
+            self.next_values = [str(getattr(page[-1], field)) for field in self.ordering]
+        return page
+
+    def get_next_link(self) -> str | None:
+        if self.next_values is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_values))
+
+    def get_paginated_response(self, data: list) -> Response:
+        headers = {}
+        next_link = self.get_next_link()
+        if next_link is not None:
+            headers['Link'] = f'<{next_link}>; rel="next"'
+        return Response(data, headers=headers)
@@ -0,0 +1,18 @@
+import orjson
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from .renderers import ORJSONRenderer
+
+
+class ORJSONParser(JSONParser):
+    """Parse JSON request bodies with orjson, see `ORJSONRenderer`."""
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type: str = None, parser_context: dict = None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as e:
+            raise ParseError(f"JSON parse error - {e}")
@@ -0,0 +1,24 @@
+import orjson
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Render JSON with orjson, several times faster than the standard library on large nested data.
+    The types orjson does not know, e.g. `Decimal` or lazy strings, are encoded as by the DRF `JSONRenderer`.
+    The indentation requested in the `Accept` header is always 2 spaces, the only one orjson supports.
+    """
+
+    def __init__(self) -> None:
+        self._encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type: str = None, renderer_context: dict = None) -> bytes:
+        if data is None:
+            return b''
+
+        option = orjson.OPT_NON_STR_KEYS
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+
+        return orjson.dumps(data, default=self._encoder.default, option=option)
@@ -0,0 +1,179 @@
+import time
+
+from django_redis import get_redis_connection
+
+
+# Refill the bucket for the time elapsed since the last call, then take the tokens if there are enough.
+# The Redis server clock is used, so all the processes share the same time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('time')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('hmget', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - updated_at, 0) * rate)
+
+local allowed = 0
+if tokens >= requested then
+    tokens = tokens - requested
+    allowed = 1
+end
+
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('expire', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when no token could be taken from a `TokenBucket` in time."""
+
+
+class CircuitOpen(Exception):
+    """Raised when a call is refused by an open `CircuitBreaker`."""
+
+
+class TokenBucket:
+    """A token bucket rate limiter shared by all the processes through Redis.
+    The bucket holds up to `capacity` tokens and is refilled with `rate` tokens per second.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: int, alias: str = 'redis') -> None:
+        self.key = f"rate_limit_{name}"
+        self.rate = rate
+        self.capacity = capacity
+        self.alias = alias
+
+    @property
+    def client(self):
+        return get_redis_connection(self.alias)
+
+    def _take(self, tokens: int) -> tuple[bool, float]:
+        allowed, remaining = self.client.eval(TOKEN_BUCKET_SCRIPT, 1, self.key, self.rate, self.capacity, tokens)
+        return bool(allowed), float(remaining)
+
+    def acquire(self, tokens: int = 1, timeout: float = 0) -> bool:
+        """
+        Take `tokens` from the bucket, waiting up to `timeout` seconds for them.
+        Returns False if the tokens could not be taken in time.
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            allowed, remaining = self._take(tokens)
+            if allowed:
+                return True
+
+            # Sleep until enough tokens should have been refilled
+            delay = (tokens - remaining) / self.rate
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+
+    def get_tokens(self) -> float:
+        tokens, updated_at = self.client.hmget(self.key, 'tokens', 'updated_at')
+        if tokens is None:
+            return float(self.capacity)
+        return min(self.capacity, float(tokens) + max(time.time() - float(updated_at), 0) * self.rate)
+
+
+class CircuitBreaker:
+    """A circuit breaker shared by all the processes through Redis.
+    The circuit opens after `failure_threshold` failures within `failure_window` seconds,
+    and refuses every call for `recovery_timeout` seconds. Then it is half-open:
+    a single probe call is let through, its success closes the circuit and its failure opens it again.
+    The successes of a closed circuit leave its failures to expire with their window,
+    so an external API failing intermittently still opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        failure_window: int,
+        recovery_timeout: int,
+        alias: str = 'redis',
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.recovery_timeout = recovery_timeout
+        self.alias = alias
+
+    @property
+    def client(self):
+        return get_redis_connection(self.alias)
+
+    def _get_key(self, name: str) -> str:
+        return f"circuit_breaker_{self.name}_{name}"
+
+    def get_state(self) -> dict:
+        """
+        Return the state of the circuit, one of 'closed', 'open' and 'half_open', for monitoring.
+        """
+        failures, opened_until = self.client.mget(self._get_key('failures'), self._get_key('opened_until'))
+        opened_until = float(opened_until) if opened_until is not None else None
+
+        if opened_until is None:
+            state = 'closed'
+        elif opened_until > time.time():
+            state = 'open'
+        else:
+            state = 'half_open'
+
+        return {
+            'state': state,
+            'failures': int(failures or 0),
+            'opened_until': opened_until,
+        }
+
+    def is_open(self) -> bool:
+        return self.get_state()['state'] == 'open'
+
+    def allow(self) -> None:
+        """
+        Raise `CircuitOpen` unless the call is allowed.
+        """
+        state = self.get_state()['state']
+        if state == 'open':
+            raise CircuitOpen(f"The {self.name} circuit is open.")
+
+        # Only one process probes a half-open circuit, the others keep failing fast
+        if state == 'half_open' and not self.client.set(self._get_key('probe'), 1, nx=True, ex=self.recovery_timeout):
+            raise CircuitOpen(f"The {self.name} circuit is half-open.")
+
+    def record_success(self) -> None:
+        # Only the success of the probe of a half-open circuit closes it
+        if self.client.get(self._get_key('opened_until')) is not None:
+            self.reset()
+
+    def reset(self) -> None:
+        """
+        Close the circuit and forget its failures.
+        """
+        self.client.delete(self._get_key('failures'), self._get_key('opened_until'), self._get_key('probe'))
+
+    def record_failure(self) -> None:
+        pipeline = self.client.pipeline()
+        pipeline.incr(self._get_key('failures'))
+        pipeline.get(self._get_key('opened_until'))
+        failures, opened_until = pipeline.execute()
+        # The failures are counted over a window starting with the first one
+        if failures == 1:
+            self.client.expire(self._get_key('failures'), self.failure_window)
+
+        # A failed probe opens the circuit again right away
+        if failures >= self.failure_threshold or opened_until is not None:
+            pipeline = self.client.pipeline()
+            # Kept long enough to stay half-open until the next probe
+            pipeline.set(
+                self._get_key('opened_until'),
+                time.time() + self.recovery_timeout,
+                ex=self.recovery_timeout + self.failure_window,
+            )
+            pipeline.delete(self._get_key('probe'))
+            pipeline.execute()
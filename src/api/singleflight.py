@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from django.conf import settings
+
+from django_redis import get_redis_connection
+
+from .cache import get_async_redis_connection
+
+
+# Only release the lock if we still own it, so a leader that overran its
+# lock timeout cannot delete the lock of the next leader.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlightError(Exception):
+    """Raised to followers when the leader failed to compute the result."""
+
+
+class SingleFlightTimeout(SingleFlightError):
+    """Raised to followers when the leader did not publish a result in time."""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key across processes.
+
+    The first caller for a key becomes the leader: it takes a lock in Redis,
+    runs the function and publishes the outcome under a short-lived result key.
+    Every other caller waits for that outcome instead of running the function
+    again, so N concurrent misses cost a single call.
+    The function result must be JSON serializable.
+    """
+
+    def __init__(
+        self,
+        key_prefix: str = 'singleflight',
+        lock_timeout: int = None,
+        wait_timeout: int = None,
+        result_timeout: int = None,
+        alias: str = 'redis',
+    ) -> None:
+        self.key_prefix = key_prefix
+        self.lock_timeout = lock_timeout or settings.SINGLE_FLIGHT_LOCK_TIMEOUT
+        self.wait_timeout = wait_timeout or settings.SINGLE_FLIGHT_WAIT_TIMEOUT
+        self.result_timeout = result_timeout or settings.SINGLE_FLIGHT_RESULT_TIMEOUT
+        self.alias = alias
+
+    @property
+    def client(self):
+        return get_redis_connection(self.alias)
+
+    @property
+    def async_client(self):
+        return get_async_redis_connection(self.alias)
+
+    def _get_lock_key(self, key: str) -> str:
+        return f"{self.key_prefix}_lock_{key}"
+
+    def _get_result_key(self, key: str, token: str) -> str:
+        return f"{self.key_prefix}_result_{key}_{token}"
+
+    def _lead(self, key: str, token: str, func: Callable[[], Any]) -> Any:
+        result_key = self._get_result_key(key, token)
+        try:
+            value = func()
+        except Exception as e:
+            self.client.set(result_key, json.dumps({'error': str(e)}), ex=self.result_timeout)
+            raise
+        else:
+            self.client.set(result_key, json.dumps({'value': value}), ex=self.result_timeout)
+            return value
+        finally:
+            self.client.eval(RELEASE_LOCK_SCRIPT, 1, self._get_lock_key(key), token)
+
+    def _load_outcome(self, raw: bytes) -> dict:
+        outcome = json.loads(raw)
+        if 'error' in outcome:
+            raise SingleFlightError(outcome['error'])
+        return outcome
+
+    def _wait(self, key: str, token: bytes, deadline: float) -> dict | None:
+        """
+        Wait for the leader holding `token` to publish its outcome.
+        Returns None if the leader went away without publishing one.
+        """
+        result_key = self._get_result_key(key, token.decode())
+        delay = 0.01
+
+        while True:
+            raw = self.client.get(result_key)
+            if raw is not None:
+                return self._load_outcome(raw)
+
+            # The leader publishes before releasing the lock, so a lock that changed
+            # hands without a result means the leader crashed or overran its timeout
+            if self.client.get(self._get_lock_key(key)) != token:
+                return None
+
+            if time.monotonic() >= deadline:
+                raise SingleFlightTimeout(f"Timed out waiting for the result of {key}.")
+
+            time.sleep(delay)
+            delay = min(delay * 2, 0.25)
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        Run `func` once for all concurrent callers of `key` and return its result.
+        Followers get the leader's value, or a `SingleFlightError` with the leader's error message.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            token = uuid.uuid4().hex
+            if self.client.set(self._get_lock_key(key), token, nx=True, ex=self.lock_timeout):
+                return self._lead(key, token, func)
+
+            leader_token = self.client.get(self._get_lock_key(key))
+            if leader_token is None:
+                # The leader finished between our two calls, try to lead the next flight
+                continue
+
+            outcome = self._wait(key, leader_token, deadline)
+            if outcome is not None:
+                return outcome['value']
+
+    async def _alead(self, key: str, token: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        result_key = self._get_result_key(key, token)
+        try:
+            value = await func()
+        except Exception as e:
+            await self.async_client.set(result_key, json.dumps({'error': str(e)}), ex=self.result_timeout)
+            raise
+        else:
+            await self.async_client.set(result_key, json.dumps({'value': value}), ex=self.result_timeout)
+            return value
+        finally:
+            await self.async_client.eval(RELEASE_LOCK_SCRIPT, 1, self._get_lock_key(key), token)
+
+    async def _await(self, key: str, token: bytes, deadline: float) -> dict | None:
+        """
+        Async version of `_wait`, waits without blocking the event loop.
+        """
+        result_key = self._get_result_key(key, token.decode())
+        delay = 0.01
+
+        while True:
+            raw = await self.async_client.get(result_key)
+            if raw is not None:
+                return self._load_outcome(raw)
+
+            if await self.async_client.get(self._get_lock_key(key)) != token:
+                return None
+
+            if time.monotonic() >= deadline:
+                raise SingleFlightTimeout(f"Timed out waiting for the result of {key}.")
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.25)
+
+    async def ado(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Async version of `do`, `func` is a coroutine function.
+        Async and sync callers of the same key share the same flight.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            token = uuid.uuid4().hex
+            if await self.async_client.set(self._get_lock_key(key), token, nx=True, ex=self.lock_timeout):
+                return await self._alead(key, token, func)
+
+            leader_token = await self.async_client.get(self._get_lock_key(key))
+            if leader_token is None:
+                continue
+
+            outcome = await self._await(key, leader_token, deadline)
+            if outcome is not None:
+                return outcome['value']
@@ -1,4 +1,5 @@
 from django.contrib import admin
-from .models import Flight
+from .models import Flight, FlightVersion
 
 admin.site.register(Flight)
+admin.site.register(FlightVersion)
@@ -0,0 +1,236 @@
+import csv
+import io
+from datetime import date, datetime
+from itertools import islice
+from typing import IO, Iterable, Iterator
+
+import orjson
+from django.db import connections, router, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import HOT_FIELDS, NATURAL_KEY_FIELDS, Flight
+
+
+FORMATS = ('ndjson', 'csv')
+CONFLICT_ACTIONS = ('update', 'ignore', 'error')
+# Columns of the imported and exported records, `extra_data` is JSON encoded in CSV
+COLUMNS = (*NATURAL_KEY_FIELDS, 'extra_data')
+
+
+class InvalidRecord(ValueError):
+    def __init__(self, line: int, message: str) -> None:
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+
+def read_records(stream: IO[str], format: str) -> Iterator[tuple[int, dict | str]]:
+    """
+    Read the (line, record) of an NDJSON or CSV stream lazily, one line at a time.
+    NDJSON records are read as text, they are decoded by `build_flight`.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line, text in enumerate(stream, 1):
+        if text.strip():
+            yield line, text
+
+
+def _load_json(line: int, value: str, name: str):
+    try:
+        return orjson.loads(value)
+    except orjson.JSONDecodeError as e:
+        raise InvalidRecord(line, f"invalid JSON {name}, {e}.")
+
+
+def build_flight(line: int, record: dict | str) -> Flight:
+    """
+    Build an unsaved flight from a record, raise `InvalidRecord` if it does not fit the columns.
+    The record and its extra data may be JSON encoded.
+    """
+    if isinstance(record, str):
+        record = _load_json(line, record, 'record')
+    if not isinstance(record, dict):
+        raise InvalidRecord(line, "a record must be an object.")
+
+    values = {}
+    for field in ('airline_code', 'flight_number'):
+        value = record.get(field)
+        max_length = Flight._meta.get_field(field).max_length
+        if not isinstance(value, str) or not value or len(value) > max_length:
+            raise InvalidRecord(line, f"{field} must be a string of 1 to {max_length} characters.")
+        values[field] = value
+
+    try:
+        values['departure_date'] = parse_date(str(record.get('departure_date')))
+    except ValueError:
+        values['departure_date'] = None
+    if values['departure_date'] is None:
+        raise InvalidRecord(line, "departure_date must be a YYYY-MM-DD date.")
+
+    extra_data = record.get('extra_data') or {}
+    if isinstance(extra_data, str):
+        extra_data = _load_json(line, extra_data, 'extra_data')
+    # A NULL extra data is exported as 'null' in CSV, and accepted like an empty one
+    if extra_data is None:
+        extra_data = {}
+    if not isinstance(extra_data, dict):
+        raise InvalidRecord(line, "extra_data must be an object.")
+
+    return Flight(**values, extra_data=extra_data)
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, dict):
+        return orjson.dumps(value).decode()
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+class FlightImporter:
+    """Import flight records in batches of `batch_size`, with bounded memory whatever the number of records.
+    Records are matched on their natural key, the stored flights are updated, kept or raise an `IntegrityError`
+    depending on `on_conflict`. The last record of a natural key wins within a batch.
+    Each batch is written in its own transaction, with a `bulk_create`, or with a Postgres `COPY`
+    into a temporary table merged by a single `INSERT ... SELECT` if `use_copy` is set.
+    """
+
+    copy_columns = (*COLUMNS, 'created_at', 'updated_at', *HOT_FIELDS)
+
+    def __init__(self, batch_size: int = 1000, on_conflict: str = 'update', use_copy: bool = False,
+                 skip_invalid: bool = False, using: str = None) -> None:
+        self.batch_size = batch_size
+        self.on_conflict = on_conflict
+        self.use_copy = use_copy
+        self.skip_invalid = skip_invalid
+        self.using = using or router.db_for_write(Flight)
+        self.stats = {'read': 0, 'invalid': 0, 'written': 0, 'batches': 0}
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def _build_flights(self, records: Iterable[tuple[int, dict | str]]) -> Iterator[Flight]:
+        for line, record in records:
+            self.stats['read'] += 1
+            try:
+                yield build_flight(line, record)
+            except InvalidRecord:
+                if not self.skip_invalid:
+                    raise
+                self.stats['invalid'] += 1
+
+    def run(self, records: Iterable[tuple[int, dict | str]]) -> dict:
+        if self.use_copy and self.connection.vendor != 'postgresql':
+            raise ValueError("COPY is only supported on PostgreSQL.")
+
+        try:
+            for batch in _batched(self._build_flights(records), self.batch_size):
+                # ON CONFLICT cannot affect the same row twice in a statement
+                flights = list({flight.natural_key: flight for flight in batch}.values())
+                with transaction.atomic(using=self.using):
+                    if self.use_copy:
+                        self.stats['written'] += self._copy(flights)
+                    else:
+                        self.stats['written'] += self._bulk_create(flights)
+                self.stats['batches'] += 1
+        finally:
+            if self.use_copy:
+                self._drop_copy_table()
+        return self.stats
+
+    def _bulk_create(self, flights: list[Flight]) -> int:
+        queryset = Flight.objects.using(self.using)
+        if self.on_conflict == 'update':
+            queryset.upsert_many(flights)
+            return len(flights)
+
+        for flight in flights:
+            flight.set_hot_fields()
+        queryset.bulk_create(flights, ignore_conflicts=self.on_conflict == 'ignore')
+        return len(flights)
+
+    @property
+    def copy_table(self) -> str:
+        return self.connection.ops.quote_name(f'{Flight._meta.db_table}_import')
+
+    def _copy(self, flights: list[Flight]) -> int:
+        quote_name = self.connection.ops.quote_name
+        table = quote_name(Flight._meta.db_table)
+        columns = ', '.join(quote_name(column) for column in self.copy_columns)
+
+        now = timezone.now()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for flight in flights:
+            flight.set_hot_fields()
+            flight.created_at = flight.updated_at = now
+            writer.writerow([_copy_value(getattr(flight, column)) for column in self.copy_columns])
+
+        conflict = ''
+        if self.on_conflict == 'update':
+            updates = ', '.join(
+                f'{quote_name(column)} = EXCLUDED.{quote_name(column)}'
+                for column in ('extra_data', 'updated_at', *HOT_FIELDS)
+            )
+            conflict = f"ON CONFLICT ({', '.join(NATURAL_KEY_FIELDS)}) DO UPDATE SET {updates}"
+        elif self.on_conflict == 'ignore':
+            conflict = 'ON CONFLICT DO NOTHING'
+
+        with self.connection.cursor() as cursor:
+            # The table keeps the column types of the flights, without their constraints
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {self.copy_table} AS "
+                f"SELECT {columns} FROM {table} WITH NO DATA"
+            )
+            cursor.execute(f"TRUNCATE {self.copy_table}")
+            # Unquoted \N is NULL, the text values are never \N
+            copy_sql = f"COPY {self.copy_table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+            with cursor.cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+            cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {self.copy_table} {conflict}")
+        return len(flights)
+
+    def _drop_copy_table(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.copy_table}")
+
+
+def export_records(queryset: QuerySet, format: str, chunk_size: int = 2000) -> Iterator[str]:
+    """
+    Stream the flights of a queryset as NDJSON or CSV lines, in the `COLUMNS` of the imports.
+    Rows are fetched `chunk_size` at a time, through a server-side cursor on PostgreSQL,
+    and never loaded as model instances.
+    """
+    rows = queryset.order_by('pk').values_list(*COLUMNS).iterator(chunk_size=chunk_size)
+
+    if format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(COLUMNS)
+        for *values, extra_data in rows:
+            yield writer.writerow([*values, orjson.dumps(extra_data).decode()])
+        return
+
+    for row in rows:
+        yield orjson.dumps(dict(zip(COLUMNS, row))).decode() + '\n'
+
+
+class _Echo:
+    """File-like object returning what is written, to stream the lines of a `csv.writer`."""
+
+    def write(self, value: str) -> str:
+        return value
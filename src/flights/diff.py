@@ -0,0 +1,66 @@
+import copy
+
+
+def _escape(key: str) -> str:
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(token: str) -> str:
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def _split_pointer(pointer: str) -> list[str]:
+    if not pointer:
+        return []
+    if not pointer.startswith('/'):
+        raise ValueError(f"Invalid JSON pointer {pointer!r}.")
+    return [_unescape(token) for token in pointer[1:].split('/')]
+
+
+def make_patch(source, target, pointer: str = '') -> list[dict]:
+    """
+    Return the JSON patch (RFC 6902) turning `source` into `target`, with `add`, `remove` and `replace` operations.
+    Objects are compared key by key, other values, lists included, are replaced as a whole.
+    """
+    if source == target and type(source) is type(target):
+        return []
+    if not isinstance(source, dict) or not isinstance(target, dict):
+        return [{'op': 'replace', 'path': pointer, 'value': target}]
+
+    patch = []
+    for key in source.keys() - target.keys():
+        patch.append({'op': 'remove', 'path': f"{pointer}/{_escape(key)}"})
+    for key, value in target.items():
+        path = f"{pointer}/{_escape(key)}"
+        if key not in source:
+            patch.append({'op': 'add', 'path': path, 'value': value})
+        else:
+            patch.extend(make_patch(source[key], value, path))
+    return patch
+
+
+def apply_patch(document, patch: list[dict]):
+    """
+    Apply a JSON patch made by `make_patch` to a copy of `document`, and return it.
+    """
+    document = copy.deepcopy(document)
+    for operation in patch:
+        *parents, key = _split_pointer(operation['path']) or [None]
+        if key is None:
+            # The whole document is replaced
+            document = copy.deepcopy(operation['value'])
+            continue
+
+        parent = document
+        for token in parents:
+            parent = parent[int(token) if isinstance(parent, list) else token]
+        if isinstance(parent, list):
+            key = int(key)
+
+        if operation['op'] == 'remove':
+            del parent[key]
+        elif operation['op'] in ('add', 'replace'):
+            parent[key] = copy.deepcopy(operation['value'])
+        else:
+            raise ValueError(f"Unsupported JSON patch operation {operation['op']!r}.")
+    return document
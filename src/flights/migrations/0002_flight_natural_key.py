@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 20:29
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_flights(apps, schema_editor):
+    """
+    Keep only the most recently updated flight of each natural key,
+    so the unique constraint can be created.
+    """
+    Flight = apps.get_model('flights', 'Flight')
+    natural_key = ('airline_code', 'flight_number', 'departure_date')
+
+    duplicates = (
+        Flight.objects
+        .values(*natural_key)
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        flights = Flight.objects.filter(**{field: duplicate[field] for field in natural_key})
+        latest = flights.order_by('-updated_at', '-id').first()
+        flights.exclude(pk=latest.pk).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_flights, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='flight',
+            constraint=models.UniqueConstraint(fields=('airline_code', 'flight_number', 'departure_date'), name='flights_flight_natural_key'),
+        ),
+        migrations.AlterField(
+            model_name='flight',
+            name='airline_code',
+            field=models.CharField(max_length=10, verbose_name='Airline code'),
+        ),
+    ]
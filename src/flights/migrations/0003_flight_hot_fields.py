@@ -0,0 +1,161 @@
+# Generated by Django 5.2 on 2026-10-18 20:41
+
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+
+# Frozen copy of `flights.models` as of this migration, later changes to the models must not change it
+HOT_FIELDS = (
+    'status_code',
+    'departure_airport',
+    'arrival_airport',
+    'departure_gate',
+    'arrival_gate',
+    'scheduled_departure',
+    'estimated_departure',
+    'scheduled_arrival',
+    'estimated_arrival',
+    'departure_delay',
+    'arrival_delay',
+)
+
+
+def _get_path(data: dict, *path: str):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _get_code(value, max_length: int = 10) -> str:
+    return str(value)[:max_length] if value else ''
+
+
+def _get_datetime(value):
+    try:
+        return parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        return None
+
+
+def _get_minutes(value) -> int | None:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_hot_fields(extra_data: dict) -> dict:
+    """
+    Extract the `HOT_FIELDS` values from the external API data of a flight.
+    Missing or malformed values are left empty, the raw data is kept as is in `extra_data`.
+    """
+    extra_data = extra_data or {}
+    schedule = extra_data.get('schedule')
+    result_header = extra_data.get('resultHeader')
+    delay = _get_path(extra_data, 'status', 'delay')
+
+    return {
+        'status_code': _get_code(_get_path(extra_data, 'status', 'statusCode'), max_length=5),
+        'departure_airport': _get_code(
+            _get_path(extra_data, 'departureAirport', 'fs') or _get_path(result_header, 'departureAirportFS')
+        ),
+        'arrival_airport': _get_code(
+            _get_path(extra_data, 'arrivalAirport', 'fs') or _get_path(result_header, 'arrivalAirportFS')
+        ),
+        'departure_gate': _get_code(_get_path(extra_data, 'departureAirport', 'gate')),
+        'arrival_gate': _get_code(_get_path(extra_data, 'arrivalAirport', 'gate')),
+        'scheduled_departure': _get_datetime(_get_path(schedule, 'scheduledDepartureUTC')),
+        'estimated_departure': _get_datetime(_get_path(schedule, 'estimatedActualDepartureUTC')),
+        'scheduled_arrival': _get_datetime(_get_path(schedule, 'scheduledArrivalUTC')),
+        'estimated_arrival': _get_datetime(_get_path(schedule, 'estimatedActualArrivalUTC')),
+        'departure_delay': _get_minutes(_get_path(delay, 'departure', 'minutes')),
+        'arrival_delay': _get_minutes(_get_path(delay, 'arrival', 'minutes')),
+    }
+
+
+def backfill_hot_fields(apps, schema_editor):
+    """
+    Extract the hot fields of the stored flights, in batches to bound memory.
+    """
+    Flight = apps.get_model('flights', 'Flight')
+    batch_size = 1000
+
+    batch = []
+    for flight in Flight.objects.only('pk', 'extra_data').iterator(chunk_size=batch_size):
+        for field, value in extract_hot_fields(flight.extra_data).items():
+            setattr(flight, field, value)
+        batch.append(flight)
+        if len(batch) >= batch_size:
+            Flight.objects.bulk_update(batch, HOT_FIELDS)
+            batch = []
+
+    if batch:
+        Flight.objects.bulk_update(batch, HOT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0002_flight_natural_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='arrival_airport',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=10, verbose_name='Arrival airport'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='arrival_delay',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Arrival delay (minutes)'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='arrival_gate',
+            field=models.CharField(blank=True, default='', max_length=10, verbose_name='Arrival gate'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='departure_airport',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=10, verbose_name='Departure airport'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='departure_delay',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Departure delay (minutes)'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='departure_gate',
+            field=models.CharField(blank=True, default='', max_length=10, verbose_name='Departure gate'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='estimated_arrival',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Estimated or actual arrival (UTC)'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='estimated_departure',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Estimated or actual departure (UTC)'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='scheduled_arrival',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Scheduled arrival (UTC)'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='scheduled_departure',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Scheduled departure (UTC)'),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='status_code',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=5, verbose_name='Status code'),
+        ),
+        migrations.RunPython(backfill_hot_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 21:02
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The indexes are built without locking the table against writes
+    atomic = False
+
+    dependencies = [
+        ('flights', '0003_flight_hot_fields'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='flight',
+            index=models.Index(fields=['departure_airport', 'departure_date', 'id'], name='flights_dep_airport_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='flight',
+            index=models.Index(fields=['arrival_airport', 'departure_date', 'id'], name='flights_arr_airport_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='flight',
+            index=models.Index(fields=['airline_code', 'departure_date', 'id'], name='flights_airline_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='flight',
+            name='arrival_airport',
+            field=models.CharField(blank=True, default='', max_length=10, verbose_name='Arrival airport'),
+        ),
+        migrations.AlterField(
+            model_name='flight',
+            name='departure_airport',
+            field=models.CharField(blank=True, default='', max_length=10, verbose_name='Departure airport'),
+        ),
+    ]
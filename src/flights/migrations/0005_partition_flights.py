@@ -0,0 +1,81 @@
+# Generated by Django 5.2 on 2026-10-18 22:10
+
+from datetime import date
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+
+# Frozen copy of `flights.partitions` as of this migration, later changes to it must not change it
+def get_month(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_flights(apps, schema_editor):
+    """
+    Rebuild the flights table as a table partitioned by month of departure date, on PostgreSQL only.
+    The table is copied, so it is locked against writes while it is rebuilt.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        # The indexes are rebuilt after the copy, the constraints must hold the partition key
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = 'flights_flight' AND indexname NOT IN ("
+            "SELECT conname FROM pg_constraint WHERE conrelid = 'flights_flight'::regclass)"
+        )
+        index_definitions = [definition for definition, in cursor.fetchall()]
+        cursor.execute("SELECT min(departure_date) FROM flights_flight")
+        first_departure_date, = cursor.fetchone()
+
+        cursor.execute("ALTER TABLE flights_flight RENAME TO flights_flight_unpartitioned")
+        cursor.execute(
+            "CREATE TABLE flights_flight (LIKE flights_flight_unpartitioned INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (departure_date)"
+        )
+        cursor.execute("CREATE TABLE flights_flight_default PARTITION OF flights_flight DEFAULT")
+
+        # Every month has its partition, those older than the retention are archived by `archive_flight_partitions`
+        current = get_month(timezone.now().date())
+        month = get_month(first_departure_date or current)
+        while month <= add_months(current, settings.FLIGHT_PARTITIONS_AHEAD):
+            cursor.execute(
+                f"CREATE TABLE flights_flight_{month:%Y_%m} PARTITION OF flights_flight FOR VALUES FROM (%s) TO (%s)",
+                [month.isoformat(), add_months(month, 1).isoformat()],
+            )
+            month = add_months(month, 1)
+
+        cursor.execute("INSERT INTO flights_flight SELECT * FROM flights_flight_unpartitioned")
+        cursor.execute("DROP TABLE flights_flight_unpartitioned")
+
+        # Partitioned tables cannot have identity columns before PostgreSQL 17
+        cursor.execute("CREATE SEQUENCE flights_flight_id_seq AS bigint OWNED BY flights_flight.id")
+        cursor.execute("SELECT setval('flights_flight_id_seq', coalesce(max(id), 0) + 1, false) FROM flights_flight")
+        cursor.execute("ALTER TABLE flights_flight ALTER COLUMN id SET DEFAULT nextval('flights_flight_id_seq')")
+
+        cursor.execute("ALTER TABLE flights_flight ADD CONSTRAINT flights_flight_pkey PRIMARY KEY (id, departure_date)")
+        cursor.execute(
+            "ALTER TABLE flights_flight ADD CONSTRAINT flights_flight_natural_key "
+            "UNIQUE (airline_code, flight_number, departure_date)"
+        )
+        for definition in index_definitions:
+            cursor.execute(definition)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0004_flight_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_flights),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0005_partition_flights'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('airline_code', models.CharField(max_length=10, verbose_name='Airline code')),
+                ('flight_number', models.CharField(max_length=10, verbose_name='Flight number')),
+                ('departure_date', models.DateField(db_index=True, verbose_name='Departure date')),
+                ('version', models.PositiveIntegerField(verbose_name='Version')),
+                ('recorded_at', models.DateTimeField(auto_now_add=True, verbose_name='Recorded at')),
+                ('status_code', models.CharField(blank=True, default='', max_length=5, verbose_name='Status code')),
+                ('is_snapshot', models.BooleanField(default=False, verbose_name='Is snapshot')),
+                ('data', models.JSONField(verbose_name='Data')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('airline_code', 'flight_number', 'departure_date', 'version'), name='flights_flightversion_version')],
+            },
+        ),
+    ]
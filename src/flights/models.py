@@ -1,11 +1,140 @@
-from django.db import models
+import logging
+import operator
+from datetime import datetime
+from functools import reduce
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, models, router, transaction
+from django.db.models.functions import Lag
+from django.utils.dateparse import parse_datetime
+
+from .diff import apply_patch, make_patch
+
+
+logger = logging.getLogger(__name__)
+
+
+NATURAL_KEY_FIELDS = ('airline_code', 'flight_number', 'departure_date')
+# Typed columns extracted from the external API data on ingest, see `extract_hot_fields`
+HOT_FIELDS = (
+    'status_code',
+    'departure_airport',
+    'arrival_airport',
+    'departure_gate',
+    'arrival_gate',
+    'scheduled_departure',
+    'estimated_departure',
+    'scheduled_arrival',
+    'estimated_arrival',
+    'departure_delay',
+    'arrival_delay',
+)
+
+
+def _get_path(data: dict, *path: str):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _get_code(value, max_length: int = 10) -> str:
+    return str(value)[:max_length] if value else ''
+
+
+def _get_datetime(value):
+    try:
+        return parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        return None
+
+
+def _get_minutes(value) -> int | None:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_hot_fields(extra_data: dict) -> dict:
+    """
+    Extract the `HOT_FIELDS` values from the external API data of a flight.
+    Missing or malformed values are left empty, the raw data is kept as is in `extra_data`.
+    """
+    extra_data = extra_data or {}
+    schedule = extra_data.get('schedule')
+    result_header = extra_data.get('resultHeader')
+    delay = _get_path(extra_data, 'status', 'delay')
+
+    return {
+        'status_code': _get_code(_get_path(extra_data, 'status', 'statusCode'), max_length=5),
+        'departure_airport': _get_code(
+            _get_path(extra_data, 'departureAirport', 'fs') or _get_path(result_header, 'departureAirportFS')
+        ),
+        'arrival_airport': _get_code(
+            _get_path(extra_data, 'arrivalAirport', 'fs') or _get_path(result_header, 'arrivalAirportFS')
+        ),
+        'departure_gate': _get_code(_get_path(extra_data, 'departureAirport', 'gate')),
+        'arrival_gate': _get_code(_get_path(extra_data, 'arrivalAirport', 'gate')),
+        'scheduled_departure': _get_datetime(_get_path(schedule, 'scheduledDepartureUTC')),
+        'estimated_departure': _get_datetime(_get_path(schedule, 'estimatedActualDepartureUTC')),
+        'scheduled_arrival': _get_datetime(_get_path(schedule, 'scheduledArrivalUTC')),
+        'estimated_arrival': _get_datetime(_get_path(schedule, 'estimatedActualArrivalUTC')),
+        'departure_delay': _get_minutes(_get_path(delay, 'departure', 'minutes')),
+        'arrival_delay': _get_minutes(_get_path(delay, 'arrival', 'minutes')),
+    }
+
+
+class FlightQuerySet(models.QuerySet):
+
+    def upsert(self, airline_code: str, flight_number: str, departure_date: str, extra_data: dict) -> 'Flight':
+        """
+        Insert the flight, or update its extra data if it already exists,
+        with a single `INSERT ... ON CONFLICT DO UPDATE` on the natural key.
+        Concurrent upserts of the same flight never create duplicates.
+        """
+        flight = self.model(
+            airline_code=airline_code,
+            flight_number=flight_number,
+            departure_date=departure_date,
+            extra_data=extra_data,
+        )
+        self.upsert_many([flight])
+        return flight
+
+    def upsert_many(self, flights: list['Flight']) -> list['Flight']:
+        """
+        Upsert several unsaved flights in a single statement, see `upsert`.
+        """
+        # bulk_create() does not call save(), the hot fields are extracted here
+        for flight in flights:
+            flight.set_hot_fields()
+
+        return self.bulk_create(
+            flights,
+            update_conflicts=True,
+            unique_fields=NATURAL_KEY_FIELDS,
+            update_fields=('extra_data', 'updated_at', *HOT_FIELDS),
+        )
+
+    def filter_natural_keys(self, natural_keys: list[tuple]) -> 'FlightQuerySet':
+        """
+        Filter the flights matching any of the (airline_code, flight_number, departure_date) natural keys.
+        """
+        lookups = (models.Q(**dict(zip(NATURAL_KEY_FIELDS, natural_key))) for natural_key in natural_keys)
+        return self.filter(reduce(operator.or_, lookups, models.Q(pk__in=[])))
+
+    async def aupsert(self, airline_code: str, flight_number: str, departure_date: str, extra_data: dict) -> 'Flight':
+        return await sync_to_async(self.upsert)(airline_code, flight_number, departure_date, extra_data)
 
 
 class Flight(models.Model):
+    # Not indexed on its own, it is the leading column of the natural key index
     airline_code = models.CharField(
         verbose_name="Airline code",
         max_length=10,
-        db_index=True
     )
     flight_number = models.CharField(
         verbose_name="Flight number",
@@ -35,5 +164,245 @@ class Flight(models.Model):
         db_index=True
     )
 
+    # Hot fields, extracted from `extra_data` so they can be filtered and read without loading it
+    status_code = models.CharField(
+        verbose_name="Status code",
+        max_length=5,
+        blank=True,
+        default='',
+        db_index=True
+    )
+    # Not indexed on its own, it is the leading column of a search index
+    departure_airport = models.CharField(
+        verbose_name="Departure airport",
+        max_length=10,
+        blank=True,
+        default=''
+    )
+    # Not indexed on its own, it is the leading column of a search index
+    arrival_airport = models.CharField(
+        verbose_name="Arrival airport",
+        max_length=10,
+        blank=True,
+        default=''
+    )
+    departure_gate = models.CharField(
+        verbose_name="Departure gate",
+        max_length=10,
+        blank=True,
+        default=''
+    )
+    arrival_gate = models.CharField(
+        verbose_name="Arrival gate",
+        max_length=10,
+        blank=True,
+        default=''
+    )
+    scheduled_departure = models.DateTimeField(
+        verbose_name="Scheduled departure (UTC)",
+        blank=True,
+        null=True
+    )
+    estimated_departure = models.DateTimeField(
+        verbose_name="Estimated or actual departure (UTC)",
+        blank=True,
+        null=True
+    )
+    scheduled_arrival = models.DateTimeField(
+        verbose_name="Scheduled arrival (UTC)",
+        blank=True,
+        null=True
+    )
+    estimated_arrival = models.DateTimeField(
+        verbose_name="Estimated or actual arrival (UTC)",
+        blank=True,
+        null=True
+    )
+    departure_delay = models.IntegerField(
+        verbose_name="Departure delay (minutes)",
+        blank=True,
+        null=True
+    )
+    arrival_delay = models.IntegerField(
+        verbose_name="Arrival delay (minutes)",
+        blank=True,
+        null=True
+    )
+
+    objects = FlightQuerySet.as_manager()
+
+    # On PostgreSQL the table is partitioned by month of departure date, see `flights.partitions`,
+    # its primary key is (id, departure_date) in the database as it must hold the partition key
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=NATURAL_KEY_FIELDS,
+                name='flights_flight_natural_key',
+            ),
+        ]
+        # Search indexes, in the (departure_date, id) order of the keyset pagination
+        indexes = [
+            models.Index(fields=('departure_airport', 'departure_date', 'id'), name='flights_dep_airport_date_idx'),
+            models.Index(fields=('arrival_airport', 'departure_date', 'id'), name='flights_arr_airport_date_idx'),
+            models.Index(fields=('airline_code', 'departure_date', 'id'), name='flights_airline_date_idx'),
+        ]
+
+    def set_hot_fields(self) -> None:
+        for field, value in extract_hot_fields(self.extra_data).items():
+            setattr(self, field, value)
+
+    def save(self, *args, **kwargs) -> None:
+        # A deferred `extra_data` is not saved, its hot fields are kept as they are
+        if 'extra_data' not in self.get_deferred_fields():
+            self.set_hot_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'extra_data' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *HOT_FIELDS}
+        super().save(*args, **kwargs)
+
+    @property
+    def natural_key(self) -> tuple[str, str, str]:
+        return self.airline_code, self.flight_number, str(self.departure_date)
+
     def __str__(self):
         return f"{self.airline_code} {self.flight_number} on {self.departure_date}"
+
+
+class FlightVersionQuerySet(models.QuerySet):
+
+    def filter_natural_key(self, natural_key: tuple) -> 'FlightVersionQuerySet':
+        return self.filter(**dict(zip(NATURAL_KEY_FIELDS, natural_key)))
+
+    def _rebuild(self, versions: list['FlightVersion']) -> 'FlightVersion | None':
+        """
+        Rebuild the data of the last of `versions`, ordered by version and starting with a snapshot.
+        """
+        if not versions:
+            return None
+        data = versions[0].data
+        for version in versions[1:]:
+            data = version.data if version.is_snapshot else apply_patch(data, version.data)
+        latest = versions[-1]
+        latest.extra_data = data
+        return latest
+
+    def get_version_at(self, natural_key: tuple, at: datetime | None = None) -> 'FlightVersion | None':
+        """
+        Return the latest version of a flight recorded at `at`, or now, with its data rebuilt in `extra_data`.
+        Only the versions from the snapshot before it are read, at most `FLIGHT_HISTORY_SNAPSHOT_INTERVAL`.
+        """
+        versions = self.filter_natural_key(natural_key)
+        if at is not None:
+            versions = versions.filter(recorded_at__lte=at)
+
+        snapshot = versions.filter(is_snapshot=True).order_by('-version').values_list('version', flat=True).first()
+        if snapshot is None:
+            return None
+        return self._rebuild(list(versions.filter(version__gte=snapshot).order_by('version')))
+
+    def get_transitions(self, natural_key: tuple) -> 'FlightVersionQuerySet':
+        """
+        Return the versions of a flight changing its status, oldest first, annotated with `previous_status_code`.
+        The transitions are found on the `status_code` column, the data of the versions is not read.
+        """
+        return (
+            self.filter_natural_key(natural_key)
+            .defer('data')
+            .annotate(previous_status_code=models.Window(
+                Lag('status_code', default=models.Value('')),
+                order_by='version',
+            ))
+            .exclude(status_code=models.F('previous_status_code'))
+            .order_by('version')
+        )
+
+    def record(self, flight: 'Flight') -> 'FlightVersion | None':
+        """
+        Record the data of a flight as its next version, if it changed since the latest one.
+        Every `FLIGHT_HISTORY_SNAPSHOT_INTERVAL` versions the full data is stored,
+        the others store the JSON patch from the previous version, see `make_patch`.
+        Returns the recorded version.
+        """
+        # The previous version is read where the next one is written, a lagging replica may not have it yet
+        using = self._db or router.db_for_write(self.model)
+        latest = self.using(using).get_version_at(flight.natural_key)
+        data = flight.extra_data or {}
+        if latest is not None and latest.extra_data == data:
+            return None
+
+        number = latest.version + 1 if latest is not None else 1
+        is_snapshot = latest is None or (number - 1) % settings.FLIGHT_HISTORY_SNAPSHOT_INTERVAL == 0
+        version = self.model(
+            airline_code=flight.airline_code,
+            flight_number=flight.flight_number,
+            departure_date=flight.departure_date,
+            version=number,
+            status_code=extract_hot_fields(data)['status_code'],
+            is_snapshot=is_snapshot,
+            data=data if is_snapshot else make_patch(latest.extra_data, data),
+        )
+        try:
+            with transaction.atomic(using=using):
+                version.save(using=using)
+        except IntegrityError:
+            # Recorded concurrently, the refreshes of a flight are queued once at a time so it hardly happens
+            logger.warning("Version %s of flight %s was recorded concurrently.", number, flight)
+            return None
+        return version
+
+
+class FlightVersion(models.Model):
+    """Version of the data of a flight, recorded each time a fetch or refresh changes it.
+    Most versions store the JSON patch from the previous one, and every `FLIGHT_HISTORY_SNAPSHOT_INTERVAL`
+    versions the full data, so any version is rebuilt from a bounded number of rows.
+    The versions are keyed on the natural key of the flight, as the flights are partitioned on PostgreSQL.
+    """
+    airline_code = models.CharField(
+        verbose_name="Airline code",
+        max_length=10,
+    )
+    flight_number = models.CharField(
+        verbose_name="Flight number",
+        max_length=10,
+    )
+    # Indexed to archive the versions with the flights of their month, see `archive_versions`
+    departure_date = models.DateField(
+        verbose_name="Departure date",
+        db_index=True
+    )
+    version = models.PositiveIntegerField(
+        verbose_name="Version",
+    )
+    recorded_at = models.DateTimeField(
+        verbose_name="Recorded at",
+        auto_now=False,
+        auto_now_add=True,
+    )
+    # Copied from the data, so the status transitions are listed without rebuilding the versions
+    status_code = models.CharField(
+        verbose_name="Status code",
+        max_length=5,
+        blank=True,
+        default='',
+    )
+    is_snapshot = models.BooleanField(
+        verbose_name="Is snapshot",
+        default=False,
+    )
+    # The full data of a snapshot, the JSON patch from the previous version otherwise
+    data = models.JSONField(
+        verbose_name="Data",
+    )
+
+    objects = FlightVersionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=(*NATURAL_KEY_FIELDS, 'version'),
+                name='flights_flightversion_version',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.airline_code} {self.flight_number} on {self.departure_date} version {self.version}"
@@ -0,0 +1,187 @@
+import gzip
+import logging
+import os
+import re
+from datetime import date
+from pathlib import Path
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import Flight, FlightVersion
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_month(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(month: date) -> str:
+    return f"{Flight._meta.db_table}_{month:%Y_%m}"
+
+
+def get_default_partition_name() -> str:
+    return f"{Flight._meta.db_table}_default"
+
+
+def get_connection(using: str = None):
+    return connections[using or router.db_for_write(Flight)]
+
+
+def is_partitioned(connection) -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [Flight._meta.db_table])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def get_partition_months(connection) -> list[date]:
+    """
+    Return the months of the attached monthly partitions, in order.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s)",
+            [Flight._meta.db_table],
+        )
+        names = [name for name, in cursor.fetchall()]
+
+    pattern = re.compile(rf'{re.escape(Flight._meta.db_table)}_(\d{{4}})_(\d{{2}})')
+    return sorted(
+        date(int(match[1]), int(match[2]), 1) for match in map(pattern.fullmatch, names) if match is not None
+    )
+
+
+def create_partition(connection, month: date) -> str:
+    """
+    Create and attach the partition of a month.
+    The flights of the month stored in the default partition meanwhile are moved to it.
+    """
+    quote_name = connection.ops.quote_name
+    table = quote_name(Flight._meta.db_table)
+    name = get_partition_name(month)
+    bounds = [month.isoformat(), add_months(month, 1).isoformat()]
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {quote_name(name)} (LIKE {table} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"WITH moved AS ("
+            f"DELETE FROM {quote_name(get_default_partition_name())} "
+            f"WHERE departure_date >= %s AND departure_date < %s RETURNING *"
+            f") INSERT INTO {quote_name(name)} SELECT * FROM moved",
+            bounds,
+        )
+        # The indexes of the table are built on the partition as it is attached
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {quote_name(name)} FOR VALUES FROM (%s) TO (%s)", bounds)
+    return name
+
+
+def create_partitions(months_ahead: int, using: str = None) -> list[str]:
+    """
+    Create the missing partitions from the current month to `months_ahead` months ahead.
+    Returns the names of the created partitions.
+    """
+    connection = get_connection(using)
+    if not is_partitioned(connection):
+        return []
+
+    existing = set(get_partition_months(connection))
+    current = get_month(timezone.now().date())
+    months = (add_months(current, offset) for offset in range(months_ahead + 1))
+    return [create_partition(connection, month) for month in months if month not in existing]
+
+
+def _copy_to_archive(connection, query: str, params: list, path: Path) -> None:
+    """
+    Write the rows of a query to a gzipped CSV file with COPY.
+    The file is written under a temporary name, so a failed copy leaves no partial archive.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = path.with_name(f"{path.name}.partial")
+    with connection.cursor() as cursor, gzip.open(partial_path, 'wb') as archive:
+        with cursor.cursor.copy(f"COPY {query} TO STDOUT WITH (FORMAT csv, HEADER)", params) as copy:
+            for data in copy:
+                archive.write(data)
+    os.replace(partial_path, path)
+
+
+def archive_partition(connection, month: date, archive_dir: Path) -> Path:
+    """
+    Detach the partition of a month, archive its rows to a gzipped CSV file, and drop it.
+    The partition is attached back if it cannot be archived. The archive can be imported with `import_flights`.
+    """
+    quote_name = connection.ops.quote_name
+    table = quote_name(Flight._meta.db_table)
+    name = get_partition_name(month)
+    bounds = [month.isoformat(), add_months(month, 1).isoformat()]
+
+    path = archive_dir / f"{name}.csv.gz"
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {quote_name(name)}")
+
+    try:
+        _copy_to_archive(connection, quote_name(name), [], path)
+    except Exception:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {quote_name(name)} FOR VALUES FROM (%s) TO (%s)", bounds
+            )
+        raise
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {quote_name(name)}")
+    return path
+
+
+def archive_versions(connection, month: date, archive_dir: Path) -> Path:
+    """
+    Delete the versions of the flights of a month, and archive them to a gzipped CSV file, see `FlightVersion`.
+    They are deleted and archived in one transaction, so none is lost if the archive cannot be written.
+    """
+    table = FlightVersion._meta.db_table
+    bounds = [month.isoformat(), add_months(month, 1).isoformat()]
+    path = archive_dir / f"{table}_{month:%Y_%m}.csv.gz"
+
+    with transaction.atomic(using=connection.alias):
+        _copy_to_archive(
+            connection,
+            f"(DELETE FROM {connection.ops.quote_name(table)} "
+            f"WHERE departure_date >= %s AND departure_date < %s RETURNING *)",
+            bounds,
+            path,
+        )
+    return path
+
+
+def archive_partitions(retention_months: int | None, archive_dir: str | Path, using: str = None) -> list[Path]:
+    """
+    Archive and drop the partitions of the months older than `retention_months` months, see `archive_partition`.
+    The versions of their flights are archived and deleted with them, see `archive_versions`.
+    Nothing is archived if `retention_months` is None. Returns the paths of the archives.
+    """
+    connection = get_connection(using)
+    if retention_months is None or not is_partitioned(connection):
+        return []
+
+    cutoff = add_months(get_month(timezone.now().date()), -retention_months)
+    archived = []
+    for month in get_partition_months(connection):
+        if month < cutoff:
+            paths = [
+                archive_partition(connection, month, Path(archive_dir)),
+                archive_versions(connection, month, Path(archive_dir)),
+            ]
+            logger.info("Archived the flights of %s to %s.", f"{month:%Y-%m}", ', '.join(map(str, paths)))
+            archived.extend(paths)
+    return archived
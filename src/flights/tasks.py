@@ -0,0 +1,27 @@
+from django.conf import settings
+
+from celery import shared_task
+from celery_once import QueueOnce
+
+from .partitions import archive_partitions, create_partitions
+
+
+__all__ = ['archive_flight_partitions', 'create_flight_partitions']
+
+
+@shared_task(name='flights.create_flight_partitions', base=QueueOnce, once={'graceful': True}, ignore_result=True)
+def create_flight_partitions() -> list[str]:
+    """
+    Periodic task creating the monthly partitions of the flights `FLIGHT_PARTITIONS_AHEAD` months ahead,
+    so new flights are not stored in the default partition.
+    """
+    return create_partitions(settings.FLIGHT_PARTITIONS_AHEAD)
+
+
+@shared_task(name='flights.archive_flight_partitions', base=QueueOnce, once={'graceful': True}, ignore_result=True)
+def archive_flight_partitions() -> list[str]:
+    """
+    Periodic task archiving to `FLIGHT_ARCHIVE_DIR` and dropping the monthly partitions of the flights
+    older than `FLIGHT_RETENTION_MONTHS` months.
+    """
+    return [str(path) for path in archive_partitions(settings.FLIGHT_RETENTION_MONTHS, settings.FLIGHT_ARCHIVE_DIR)]
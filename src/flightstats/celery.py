@@ -1,16 +1,14 @@
 import os
 
-from django.conf import settings
-
 from celery import Celery
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flightstats.settings')
 
 
-app = Celery('flightstats', broker=settings.CELERY_BROKER_URL)
-
-app.conf.ONCE = settings.CELERY_ONCE
+# The settings are read when the app is first configured, not on import, the broker and `CELERY_ONCE`
+# come with the other `CELERY_` settings
+app = Celery('flightstats')
 
 
 # Well, This means all the cofiguration related to celery will use 'CELERY_' prefix
@@ -18,6 +16,8 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # load modules from all registered Django app configs
 app.autodiscover_tasks()
+# The API is not a Django app, its tasks are listed explicitly
+app.autodiscover_tasks(['api.flights'])
 
 
 @app.task(bind=True)
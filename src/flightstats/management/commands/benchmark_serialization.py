@@ -0,0 +1,97 @@
+import io
+import json
+import time
+from datetime import date, datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from rest_framework import serializers
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.flights.fixtures import FLIGHT_DETAILS_RESPONSE
+from api.flights.serializers import FlightSerializer
+from api.parsers import ORJSONParser
+from api.renderers import ORJSONRenderer
+from flights.models import Flight
+
+
+class StockFlightSerializer(serializers.ModelSerializer):
+    """The flight serializer without the lean read path, as served before it."""
+
+    class Meta:
+        model = Flight
+        fields = FlightSerializer.Meta.fields
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the responses per second of the stock DRF serialization and JSON rendering "
+        "with the lean `FlightSerializer` and orjson, on the flight payload of the API tests. "
+        "No database is needed, the flights are built in memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=2, help="Seconds each case is run for.")
+        parser.add_argument('--page-size', type=int, default=100, help="Flights per listed page.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def _measure(self, func, duration: float) -> float:
+        func()  # warm up, e.g. the field introspection cached per class
+        count = 0
+        started_at = time.perf_counter()
+        while (elapsed := time.perf_counter() - started_at) < duration:
+            func()
+            count += 1
+        return count / elapsed
+
+    def handle(self, *args, **options):
+        flights = [
+            Flight(
+                pk=index + 1,
+                airline_code='AA',
+                flight_number=str(100 + index),
+                departure_date=date(2025, 6, 15),
+                extra_data=FLIGHT_DETAILS_RESPONSE,
+                updated_at=datetime(2025, 6, 15, 12, tzinfo=timezone.utc),
+            )
+            for index in range(options['page_size'])
+        ]
+        for flight in flights:
+            flight.set_hot_fields()
+        body = json.dumps({'flights': [['AA', flight.flight_number, '2025-06-15'] for flight in flights]}).encode()
+
+        stock = (StockFlightSerializer, JSONRenderer(), JSONParser())
+        fast = (FlightSerializer, ORJSONRenderer(), ORJSONParser())
+
+        def lookup(serializer_class, renderer, parser):
+            return lambda: renderer.render(serializer_class(flights[0]).data)
+
+        def page(serializer_class, renderer, parser):
+            return lambda: renderer.render(serializer_class(flights, many=True).data)
+
+        def parse(serializer_class, renderer, parser):
+            return lambda: parser.parse(io.BytesIO(body))
+
+        results = []
+        for name, case in (('lookup', lookup), ('page', page), ('batch_parse', parse)):
+            stock_rate = self._measure(case(*stock), options['duration'])
+            fast_rate = self._measure(case(*fast), options['duration'])
+            results.append({
+                'case': name,
+                'stock_per_second': round(stock_rate, 1),
+                'fast_per_second': round(fast_rate, 1),
+                'speedup': round(fast_rate / stock_rate, 2),
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+
+        self.stdout.write(f"{'case':<12} {'stock/s':>12} {'fast/s':>12} {'speedup':>8}")
+        for result in results:
+            self.stdout.write(
+                f"{result['case']:<12} {result['stock_per_second']:>12} "
+                f"{result['fast_per_second']:>12} {result['speedup']:>7}x"
+            )
+
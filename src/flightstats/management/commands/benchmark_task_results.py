@@ -0,0 +1,85 @@
+import json
+import statistics
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from celery import states
+from celery.app.backends import by_url
+from celery.result import AsyncResult
+
+from api.flights.fixtures import FLIGHT_DETAILS_RESPONSE
+from flightstats.celery import app
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latency of Celery result backends, from a worker storing the result of a flight lookup "
+        "to the request waiting on it reading it back, on the flight payload of the API tests. "
+        "No worker is needed, the results are stored by a thread of the command while the request waits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            action='append',
+            dest='backends',
+            help="Result backend URL to measure, may be repeated. Defaults to 'django-db' and `CELERY_RESULT_BACKEND`.",
+        )
+        parser.add_argument('--requests', type=int, default=200, help="Results per backend.")
+        parser.add_argument(
+            '--task-time', type=float, default=10, help="Milliseconds the request waits before the result is stored."
+        )
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def _measure(self, backend_url: str, requests: int, task_time: float) -> dict:
+        backend_class, url = by_url(backend_url, app.loader)
+        backend = backend_class(app=app, url=url)
+        result = {'status_code': 200, 'data': FLIGHT_DETAILS_RESPONSE}
+
+        latencies = []
+        for _ in range(requests):
+            task_id = uuid.uuid4().hex
+            stored_at = []
+
+            def store_result():
+                stored_at.append(time.perf_counter())
+                try:
+                    backend.store_result(task_id, result, states.SUCCESS)
+                finally:
+                    # The django-db backend opens a connection in each worker thread
+                    connection.close()
+
+            worker = threading.Timer(task_time / 1000, store_result)
+            worker.start()
+            AsyncResult(task_id, backend=backend, app=app).get(timeout=30)
+            latencies.append((time.perf_counter() - stored_at[0]) * 1000)
+            worker.join()
+            backend.forget(task_id)
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        return {
+            'backend': backend_url.split('://')[0],
+            'requests': requests,
+            'p50_ms': round(quantiles[49], 3),
+            'p95_ms': round(quantiles[94], 3),
+            'p99_ms': round(quantiles[98], 3),
+        }
+
+    def handle(self, *args, **options):
+        backends = options['backends'] or ['django-db', settings.CELERY_RESULT_BACKEND]
+        results = [self._measure(backend_url, options['requests'], options['task_time']) for backend_url in backends]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+
+        self.stdout.write(f"{'backend':<12} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+        for result in results:
+            self.stdout.write(
+                f"{result['backend']:<12} {result['p50_ms']:>10} {result['p95_ms']:>10} {result['p99_ms']:>10}"
+            )
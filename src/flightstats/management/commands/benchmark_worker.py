@@ -0,0 +1,147 @@
+import json
+import os
+import select
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from celery.contrib.testing.worker import start_worker
+from celery.signals import task_postrun
+
+from api.flights.fixtures import FLIGHT_DETAILS_RESPONSE
+from api.flights.stub import StubFlightAPI
+from api.flights.tasks import get_flight_details
+from flightstats.celery import app
+
+
+# Pool and options of the worker profiles of `run_celery.sh`. A prefork child runs a task at a time,
+# its throughput is measured with the solo pool, which runs the tasks the same way in a single process
+WORKER_PROFILES = {
+    'prefork': {
+        'pool': 'solo',
+        'options': ['--max-tasks-per-child=1000'],
+        'environ': {},
+    },
+    'io': {
+        'pool': 'threads',
+        'options': ['--pool=threads', '--concurrency={concurrency}', '--without-mingle', '--without-gossip'],
+        'environ': {'CELERY_SKIP_CHECKS': '1'},
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the worker profiles of `run_celery.sh`: the throughput of `get_flight_details` tasks run by "
+        "a single worker process against a local stub of the flightstats API, and the time a worker takes "
+        "from its start to consuming tasks. No broker is needed, the workers use an in-memory one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', dest='profiles', choices=WORKER_PROFILES,
+                            help="Worker profile to measure, may be repeated. Defaults to all of them.")
+        parser.add_argument('--tasks', type=int, default=200, help="Fetches per profile.")
+        parser.add_argument('--latency', type=float, default=100, help="Milliseconds the stub takes to answer.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Threads of the io profile.")
+        parser.add_argument('--startup-runs', type=int, default=3, help="Worker starts per profile.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def _measure_throughput(self, profile: str, tasks: int, concurrency: int) -> float:
+        """
+        Run `tasks` fetches through a worker of the profile started in a thread, and return the fetches per second.
+        """
+        pool = WORKER_PROFILES[profile]['pool']
+        done = threading.Semaphore(0)
+
+        def on_task_postrun(task=None, **kwargs):
+            if task.name == get_flight_details.name:
+                done.release()
+
+        task_postrun.connect(on_task_postrun, weak=False)
+        try:
+            with start_worker(app, pool=pool, concurrency=concurrency if pool == 'threads' else 1,
+                              perform_ping_check=False, loglevel='ERROR'):
+                started_at = time.perf_counter()
+                departure_date = date.today().isoformat()
+                for index in range(tasks):
+                    get_flight_details.apply_async(('BW', str(index), departure_date), ignore_result=True)
+                for _ in range(tasks):
+                    if not done.acquire(timeout=60):
+                        raise CommandError(f"The {profile} worker did not run the fetches in time.")
+                elapsed = time.perf_counter() - started_at
+        finally:
+            task_postrun.disconnect(on_task_postrun)
+        return tasks / elapsed
+
+    def _measure_startup(self, profile: str, concurrency: int) -> float:
+        """
+        Start a worker of the profile in a new process, and return the seconds until it is ready to consume tasks.
+        """
+        options = [option.format(concurrency=concurrency) for option in WORKER_PROFILES[profile]['options']]
+        command = [
+            sys.executable, '-m', 'celery', '-A', 'flightstats',
+            '--broker', 'memory://', '--result-backend', 'cache+memory://',
+            'worker', '-n', f'benchmark-{profile}@%h', '-l', 'INFO', *options,
+        ]
+        environ = {**os.environ, **WORKER_PROFILES[profile]['environ']}
+
+        started_at = time.perf_counter()
+        process = subprocess.Popen(command, env=environ, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True)
+        try:
+            while select.select([process.stderr], [], [], 60)[0]:
+                line = process.stderr.readline()
+                if not line:
+                    break
+                if line.rstrip().endswith(' ready.'):
+                    return time.perf_counter() - started_at
+            raise CommandError(f"The {profile} worker did not start, exit code {process.poll()}.")
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def handle(self, *args, **options):
+        # The tasks are sent to the workers started by the command only, the settings are namespaced.
+        # The in-memory broker is polled, unlike Redis, it must not hold the tasks back
+        app.conf.update(CELERY_BROKER_URL='memory://', CELERY_BROKER_TRANSPORT_OPTIONS={'polling_interval': 0.01})
+
+        stub = StubFlightAPI(FLIGHT_DETAILS_RESPONSE, latency=options['latency'] / 1000)
+        overrides = {
+            'API_URL': stub.url,
+            # The pools are compared, not the rate limit of the external API
+            'UPSTREAM_RATE_LIMIT': 10 ** 6,
+            'UPSTREAM_RATE_LIMIT_BURST': 10 ** 6,
+        }
+
+        results = []
+        with stub, override_settings(**overrides):
+            for profile in options['profiles'] or WORKER_PROFILES:
+                startup = [
+                    self._measure_startup(profile, options['concurrency']) for _ in range(options['startup_runs'])
+                ]
+                results.append({
+                    'profile': profile,
+                    'fetches_per_second': round(self._measure_throughput(
+                        profile, options['tasks'], options['concurrency']
+                    ), 1),
+                    'startup_s': round(statistics.median(startup), 3),
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+
+        self.stdout.write(f"{'profile':<10} {'fetches/s':>12} {'startup s':>12}")
+        for result in results:
+            self.stdout.write(
+                f"{result['profile']:<10} {result['fetches_per_second']:>12} {result['startup_s']:>12}"
+            )
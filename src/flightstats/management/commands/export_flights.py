@@ -0,0 +1,45 @@
+import gzip
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from flights.bulk import FORMATS, export_records
+from flights.models import Flight
+
+
+def open_output(path: str | None, stdout):
+    if path is None:
+        return nullcontext(stdout)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', newline='')
+    return open(path, 'w', newline='')
+
+
+class Command(BaseCommand):
+    help = (
+        "Export flights as NDJSON or CSV, in the format read by `import_flights`. "
+        "Rows are streamed through a server-side cursor, the flights are never loaded in memory at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='ndjson', help="Format of the export.")
+        parser.add_argument('--output', help="File written, gzipped if it ends with '.gz'. "
+                                             "Defaults to the standard output.")
+        parser.add_argument('--airline', help="Export the flights of this airline only.")
+        parser.add_argument('--after', type=parse_date, help="Export the flights departing on or after this date.")
+        parser.add_argument('--before', type=parse_date, help="Export the flights departing on or before this date.")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows fetched from the cursor at a time.")
+
+    def handle(self, *args, **options):
+        flights = Flight.objects.all()
+        if options['airline']:
+            flights = flights.filter(airline_code=options['airline'])
+        if options['after']:
+            flights = flights.filter(departure_date__gte=options['after'])
+        if options['before']:
+            flights = flights.filter(departure_date__lte=options['before'])
+
+        with open_output(options['output'], self.stdout) as output:
+            for line in export_records(flights, options['format'], chunk_size=options['chunk_size']):
+                output.write(line)
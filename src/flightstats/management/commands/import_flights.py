@@ -0,0 +1,75 @@
+import gzip
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from flights.bulk import CONFLICT_ACTIONS, FORMATS, FlightImporter, InvalidRecord, read_records
+
+
+def open_input(path: str):
+    if path == '-':
+        return nullcontext(sys.stdin)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, newline='')
+
+
+def get_format(path: str, format: str | None) -> str:
+    if format:
+        return format
+    return 'csv' if path.removesuffix('.gz').endswith('.csv') else 'ndjson'
+
+
+class Command(BaseCommand):
+    help = (
+        "Import flights from an NDJSON or CSV file, or the standard input, streamed in batches with bounded memory. "
+        "Each record has an `airline_code`, a `flight_number`, a `departure_date` and the `extra_data` of the "
+        "flight API, JSON encoded in CSV, as written by `export_flights`. Flights already stored are matched "
+        "on this natural key and updated, kept or reported depending on `--on-conflict`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="File to import, '-' for the standard input, "
+                                                                 "gzipped if it ends with '.gz'.")
+        parser.add_argument('--format', choices=FORMATS, help="Format of the file, guessed from its extension.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Flights written per transaction.")
+        parser.add_argument('--on-conflict', choices=CONFLICT_ACTIONS, default='update',
+                            help="Update the stored flights, ignore the imported ones or fail.")
+        parser.add_argument('--copy', action='store_true', help="Write the batches with COPY, PostgreSQL only.")
+        parser.add_argument('--skip-invalid', action='store_true', help="Skip invalid records instead of failing.")
+
+    def handle(self, *args, **options):
+        importer = FlightImporter(
+            batch_size=options['batch_size'],
+            on_conflict=options['on_conflict'],
+            use_copy=options['copy'],
+            skip_invalid=options['skip_invalid'],
+        )
+        path = options['path']
+
+        started_at = time.perf_counter()
+        try:
+            with open_input(path) as stream:
+                stats = importer.run(read_records(stream, get_format(path, options['format'])))
+        except InvalidRecord as e:
+            # The batches before the invalid record are imported
+            raise CommandError(
+                f"{e} Imported {importer.stats['written']} flights before line {e.line}, "
+                f"use --skip-invalid to skip the invalid records."
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(f"{e} Imported {importer.stats['written']} flights before it.")
+        except IntegrityError as e:
+            raise CommandError(
+                f"A flight of batch {importer.stats['batches'] + 1} is already stored: {e}. "
+                f"Imported {importer.stats['written']} flights before it."
+            )
+        elapsed = time.perf_counter() - started_at
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['written']} flights from {stats['read']} records in {stats['batches']} batches "
+            f"in {elapsed:.1f}s, {stats['invalid']} invalid records skipped."
+        ))
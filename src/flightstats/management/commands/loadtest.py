@@ -0,0 +1,228 @@
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from api.flights.client import get_upstream_circuit_breaker
+from api.flights.fixtures import FLIGHT_DETAILS_RESPONSE
+from api.flights.stub import StubFlightAPI
+from flights.models import Flight, FlightVersion
+
+
+SCENARIOS = ('hot', 'cold', 'stampede', 'batch', 'failure_storm')
+
+
+def percentile(values: list[float], percent: int) -> float:
+    """
+    Return the nearest-rank percentile of sorted `values`.
+    """
+    return round(values[min(len(values) * percent // 100, len(values) - 1)], 2)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the flight API in process against a local stub of the flightstats API, and report "
+        "the latency percentiles, throughput, SQL queries and upstream calls of each scenario as JSON. "
+        "The scenarios are: hot cache hits, cold misses, a stampede on a single flight, batches "
+        "of `--batch-size` flights and a storm of upstream failures. "
+        "Flights are created under a random airline code in the configured database and removed afterwards. "
+        "With `--celery`, the workers must run with `API_URL` pointing at the stub, see `--port`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help="Scenario to run, may be repeated. Defaults to all of them.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests sent at the same time.")
+        parser.add_argument('--batch-size', action='append', type=int, dest='batch_sizes',
+                            help="Flights per batch request, may be repeated. Defaults to 10 and 100.")
+        parser.add_argument('--latency', type=float, default=50, help="Milliseconds the stub takes to answer.")
+        parser.add_argument('--error-rate', type=float, default=0, help="Share of stub answers that are errors.")
+        parser.add_argument('--port', type=int, default=0, help="Port of the stub, a free one by default.")
+        parser.add_argument('--celery', action='store_true', help="Fetch flights through the Celery workers.")
+        parser.add_argument('--output', help="File the JSON report is written to, instead of the standard output.")
+
+    def handle(self, *args, **options):
+        self.concurrency = options['concurrency']
+        self.airline = f"LT{uuid.uuid4().hex[:4].upper()}"
+        self.departure_date = date.today().isoformat()
+        self._flight_numbers = iter(range(1, 10 ** 7))
+        self._local = threading.local()
+
+        stub = StubFlightAPI(
+            FLIGHT_DETAILS_RESPONSE,
+            latency=options['latency'] / 1000,
+            error_rate=options['error_rate'],
+            port=options['port'],
+        )
+        overrides = {
+            'API_URL': stub.url,
+            'CELERY_ENABLED': options['celery'],
+            # The test client sends its requests to this host
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+        }
+
+        results = []
+        with stub, override_settings(**overrides):
+            self.stub = stub
+            try:
+                for scenario in options['scenarios'] or SCENARIOS:
+                    if scenario == 'batch':
+                        for batch_size in options['batch_sizes'] or (10, 100):
+                            results.append(self.run_batch(options['requests'], batch_size))
+                    else:
+                        results.append(getattr(self, f'run_{scenario}')(options['requests']))
+                    self._reset_upstream()
+            finally:
+                self._cleanup()
+
+        report = json.dumps({
+            'settings': {
+                'requests': options['requests'],
+                'concurrency': self.concurrency,
+                'latency_ms': options['latency'],
+                'error_rate': options['error_rate'],
+                'celery': options['celery'],
+                'redis_cache': settings.ENABLE_REDIS_CACHE,
+                'local_cache': settings.ENABLE_LOCAL_CACHE,
+            },
+            'scenarios': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
+
+    def _new_lookup(self) -> dict:
+        return {
+            'airline': self.airline,
+            'flight_number': str(next(self._flight_numbers)),
+            'departure_date': self.departure_date,
+        }
+
+    def _send(self, method: str, path: str, data: dict) -> tuple[float, int, int]:
+        """
+        Send a request from a client of this thread.
+        Returns its latency in seconds, its status code and the number of SQL queries it ran.
+        """
+        if not hasattr(self._local, 'client'):
+            self._local.client = Client()
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            if method == 'post':
+                response = self._local.client.post(path, data, content_type='application/json')
+            else:
+                response = self._local.client.get(path, data)
+        return time.perf_counter() - started_at, response.status_code, len(queries)
+
+    def _run(self, scenario: str, requests: list[tuple], **extra) -> dict:
+        """
+        Send the (method, path, data) `requests`, `concurrency` at a time, and summarize them.
+        """
+        upstream_requests = self.stub.requests
+
+        def send(request: tuple) -> tuple[float, int, int]:
+            try:
+                return self._send(*request)
+            finally:
+                connection.close()
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            outcomes = list(executor.map(send, requests))
+        elapsed = time.perf_counter() - started_at
+
+        latencies = sorted(latency * 1000 for latency, _, _ in outcomes)
+        queries = [count for _, _, count in outcomes]
+        return {
+            'scenario': scenario,
+            **extra,
+            'requests': len(outcomes),
+            'status_codes': dict(Counter(str(status_code) for _, status_code, _ in outcomes)),
+            'throughput_rps': round(len(outcomes) / elapsed, 1),
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': round(latencies[-1], 2),
+            },
+            'queries': {
+                'total': sum(queries),
+                'per_request': round(sum(queries) / len(queries), 2),
+            },
+            'upstream_requests': self.stub.requests - upstream_requests,
+        }
+
+    def run_hot(self, requests: int) -> dict:
+        """
+        Lookups of a single flight already fetched, served from the cache.
+        """
+        lookup = self._new_lookup()
+        self._send('get', reverse('api:flight-service:flights-list'), lookup)
+        return self._run('hot', [('get', reverse('api:flight-service:flights-list'), lookup)] * requests)
+
+    def run_cold(self, requests: int) -> dict:
+        """
+        Lookups of distinct flights never fetched, each one calls the upstream API.
+        """
+        path = reverse('api:flight-service:flights-list')
+        return self._run('cold', [('get', path, self._new_lookup()) for _ in range(requests)])
+
+    def run_stampede(self, requests: int) -> dict:
+        """
+        Concurrent lookups of the same flight never fetched, the upstream API should be called once.
+        """
+        lookup = self._new_lookup()
+        return self._run('stampede', [('get', reverse('api:flight-service:flights-list'), lookup)] * requests)
+
+    def run_batch(self, requests: int, batch_size: int) -> dict:
+        """
+        Batch lookups of `batch_size` distinct flights never fetched.
+        """
+        path = reverse('api:flight-service:flights-batch')
+        batches = [
+            ('post', path, {'flights': [list(self._new_lookup().values()) for _ in range(batch_size)]})
+            for _ in range(max(requests // batch_size, 1))
+        ]
+        return self._run('batch', batches, batch_size=batch_size)
+
+    def run_failure_storm(self, requests: int) -> dict:
+        """
+        Lookups of distinct flights while every upstream call fails, they should fail fast once the circuit opens.
+        """
+        error_rate = self.stub.error_rate
+        self.stub.error_rate = 1
+        try:
+            path = reverse('api:flight-service:flights-list')
+            return self._run('failure_storm', [('get', path, self._new_lookup()) for _ in range(requests)])
+        finally:
+            self.stub.error_rate = error_rate
+
+    def _reset_upstream(self) -> None:
+        # Do not let a scenario fail fast because of the upstream failures of the previous one
+        circuit_breaker = get_upstream_circuit_breaker()
+        if circuit_breaker is not None:
+            circuit_breaker.reset()
+
+    def _cleanup(self) -> None:
+        Flight.objects.filter(airline_code=self.airline).delete()
+        FlightVersion.objects.filter(airline_code=self.airline).delete()
+        if settings.ENABLE_REDIS_CACHE:
+            caches['redis'].delete_pattern(f"*_{self.airline}_*")
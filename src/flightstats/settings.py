@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,6 +79,13 @@ WSGI_APPLICATION = 'flightstats.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are pooled per process, a request takes one for each query or transaction and gives it back
+# while it waits on the flight API, see `api.db.release_connections`. The flight views are not atomic.
+DATABASE_POOL_MIN_SIZE = 2  # connections kept open per process
+DATABASE_POOL_MAX_SIZE = 10  # connections per process, the processes times this must fit in max_connections
+DATABASE_POOL_TIMEOUT = 10  # seconds a query waits for a free connection before failing
+DATABASE_POOL_MAX_IDLE = 60 * 5  # 5 minutes, idle connections above the minimum are closed after it
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -86,10 +94,27 @@ DATABASES = {
         'PASSWORD': 'flightstats',
         'HOST': 'localhost',
         'PORT': '5432',
-        'ATOMIC_REQUESTS': True,
+        'ATOMIC_REQUESTS': False,  # the writes that must be atomic open their own transaction
+        'CONN_MAX_AGE': 0,  # the pool keeps the connections, persistent connections are not supported with it
+        'CONN_HEALTH_CHECKS': True,  # pooled connections are checked before they are handed out
+        'OPTIONS': {
+            'pool': {
+                'min_size': DATABASE_POOL_MIN_SIZE,
+                'max_size': DATABASE_POOL_MAX_SIZE,
+                'timeout': DATABASE_POOL_TIMEOUT,
+                'max_idle': DATABASE_POOL_MAX_IDLE,
+            },
+        },
     },
 }
 
+# Read replicas, the flight lookups and searches are spread over them, see `api.db.ReplicaRouter`.
+# e.g. DATABASES['replica'] = {**DATABASES['default'], 'HOST': 'replica', 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = []  # aliases of DATABASES
+DATABASE_REPLICA_MAX_LAG = 2  # seconds, lagging replicas are skipped, reads stay on the primary as long after a write
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = 5  # seconds between two checks of the lag of a replica, per process
+DATABASE_ROUTERS = ['api.db.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -134,19 +159,50 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Django REST framework settings
+# JSON is rendered and parsed with orjson, set the `rest_framework` classes back to use the standard library
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+
+# Metrics settings, the metrics are recorded in process and shared by all the processes through Redis
+METRICS_FLUSH_INTERVAL = 10  # seconds between two flushes of the metrics of a process to Redis
+# Clients allowed to read /metrics/, by address or with the token in an `Authorization: Bearer <token>` header
+METRICS_ALLOWED_NETWORKS = ['127.0.0.1/32', '::1/128']
+METRICS_TOKEN = None  # set it to let Prometheus scrape from other hosts
+
+# Request profiling with django-silk, every request and its queries are stored, enable it only to investigate
+ENABLE_SILK = False
+if ENABLE_SILK:
+    INSTALLED_APPS.append('silk')
+    MIDDLEWARE.insert(1, 'silk.middleware.SilkyMiddleware')
+
+
 # Celery settings
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_ONCE = {
-    'backend': 'celery_once.backends.File',
+    'backend': 'celery_once.backends.Redis',
     'settings': {
-        'location': '/tmp/celery_once',
+        'url': 'redis://localhost:6379/0',
         'default_timeout': 60 * 60,
     },
 }
-CELERY_RESULT_BACKEND = 'django-db'
-CELERY_REDIS_MAX_CONNECTIONS = 1
+# Lookup results are sent back through Redis, the waiting request is notified over pub/sub
+# instead of polling a database row, and the results expire on their own
+CELERY_RESULT_BACKEND = 'redis://localhost:6379/1'
+CELERY_RESULT_EXPIRES = 60 * 5  # 5 minutes, results are read as soon as they are stored
+CELERY_REDIS_MAX_CONNECTIONS = 50  # per process, shared by the threads waiting on results
 CELERY_ENABLED = True
 
 
@@ -170,6 +226,94 @@ CACHES = {
     }
 }
 
+# Flight freshness settings, how long the data of a flight is served before it is refreshed
+FLIGHT_FRESHNESS_TIMEOUTS = {
+    'final': 60 * 60 * 24,  # 1 day, landed, canceled or diverted flights do not change anymore
+    'airborne': 60 * 2,  # 2 minutes
+    'scheduled': 60 * 15,  # 15 minutes
+    'unknown': DEFAULT_CACHE_TIMEOUT,
+}
+FLIGHT_STALE_TIMEOUT = 60 * 60 * 24  # 1 day, stale flights are still served while they are refreshed
+FLIGHT_REFRESH_LOCK_TIMEOUT = 60  # seconds, a flight is queued for refresh at most once meanwhile
+
+# Negative cache settings, how long a failed lookup of the external API is answered from the cache
+NEGATIVE_CACHE_TIMEOUTS = {
+    'not_found': 60 * 10,  # 10 minutes, the API answered without flight data
+    'status': 60 * 5,  # 5 minutes, the API answered with a non-200 status, e.g. an unknown flight
+    'error': 30,  # seconds, the API failed or did not answer, it may recover soon
+}
+
+# In-process cache in front of Redis, invalidated across processes over Redis pub/sub
+ENABLE_LOCAL_CACHE = False
+LOCAL_CACHE_MAX_ENTRIES = 1000
+LOCAL_CACHE_TIMEOUT = 60  # 1 minute, bounds staleness if an invalidation is lost
+CACHE_INVALIDATION_CHANNEL = 'cache_invalidation'
+
+# Live updates settings, refreshed flights are pushed to their subscribers over Redis pub/sub
+FLIGHT_UPDATES_CHANNEL_PREFIX = 'flight_updates_'
+FLIGHT_UPDATES_HEARTBEAT = 15  # seconds between two keep-alive comments on an idle stream
+FLIGHT_UPDATES_QUEUE_SIZE = 10  # updates buffered per subscriber, the oldest are dropped for slow clients
+
+
+# Single-flight settings, used to coalesce concurrent fetches of the same flight
+SINGLE_FLIGHT_LOCK_TIMEOUT = 35  # seconds, must outlive the upstream fetch
+SINGLE_FLIGHT_WAIT_TIMEOUT = 35  # seconds
+SINGLE_FLIGHT_RESULT_TIMEOUT = 10  # seconds
+
+
+# Prewarm settings, upcoming and airborne flights are refreshed ahead of demand
+PREWARM_INTERVAL = 60 * 5  # 5 minutes
+PREWARM_HORIZON_HOURS = 6
+PREWARM_BATCH_SIZE = 20  # flights refreshed per airline and batch
+PREWARM_BATCH_INTERVAL = 10  # seconds between two batches of the same airline
+CELERY_BEAT_SCHEDULE = {
+    'prewarm-flights': {
+        'task': 'flights.prewarm_flights',
+        'schedule': PREWARM_INTERVAL,
+    },
+    'create-flight-partitions': {
+        'task': 'flights.create_flight_partitions',
+        'schedule': 60 * 60 * 24,  # 1 day
+    },
+    'archive-flight-partitions': {
+        'task': 'flights.archive_flight_partitions',
+        'schedule': 60 * 60 * 24,  # 1 day
+    },
+}
+
+
+# Partitioning settings, on PostgreSQL the flights are partitioned by month of departure date,
+# lookups and searches only scan the partitions of their dates and old months are dropped as a whole
+FLIGHT_PARTITIONS_AHEAD = 3  # months of partitions created ahead, later flights go to the default partition
+FLIGHT_RETENTION_MONTHS = 24  # months of flights kept, None keeps them all
+FLIGHT_ARCHIVE_DIR = BASE_DIR / 'archives'  # dropped months are archived here, shared by the workers
+
+
+# History settings, each change of a flight is recorded as a JSON patch from its previous version
+FLIGHT_HISTORY_SNAPSHOT_INTERVAL = 20  # versions, the full data is recorded once every this many versions
+
+
+# Batch lookup settings
+BATCH_MAX_SIZE = 500  # flights per request
+BATCH_UPSTREAM_CONCURRENCY = 20  # flights fetched from the API at the same time
+
+
+# Search settings, flights are listed with keyset pagination
+SEARCH_PAGE_SIZE = 100  # flights per page
+SEARCH_MAX_PAGE_SIZE = 1000  # flights per page, when set with the `page_size` parameter
+
 
 # API settings
 API_URL = 'https://www.flightstats.com/v2/api-next/flight-tracker/{airline}/{flight_number}/{year}/{month}/{day}/'
+UPSTREAM_TIMEOUT = 10  # seconds
+UPSTREAM_POOL_CONNECTIONS = 1  # hosts kept in the pool, the API has a single one
+UPSTREAM_POOL_SIZE = 10  # kept-alive connections per host and process
+UPSTREAM_MAX_RETRIES = 3  # retries on connection errors
+UPSTREAM_BACKOFF_FACTOR = 0.2  # seconds, doubled on every retry
+UPSTREAM_BACKOFF_JITTER = 0.2  # seconds, random delay added to every backoff
+UPSTREAM_RATE_LIMIT = 20  # requests per second to the API, shared by all the workers
+UPSTREAM_RATE_LIMIT_BURST = 40  # requests
+UPSTREAM_RATE_LIMIT_WAIT = 2  # seconds a request waits for the rate limit before failing
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5  # API failures opening the circuit
+CIRCUIT_BREAKER_FAILURE_WINDOW = 30  # seconds the failures are counted over
+CIRCUIT_BREAKER_RECOVERY_TIMEOUT = 30  # seconds the circuit stays open before a probe request